@@ -0,0 +1,146 @@
+"""
+Кэш ответов на похожие аналитические вопросы — без вызова Claude.
+
+«кто лучший на этой неделе» и «топ недели» — один вопрос. Вопрос
+приводится к набору основ слов: нижний регистр, без стоп-слов, грубое
+отсечение русских окончаний, синонимы к одной основе. Два вопроса
+совпадают, если сходство наборов (Жаккар) не ниже ANSWER_CACHE_SIMILARITY %,
+а сущности совпадают точно: @username, числа, отрицание («не», «ни»),
+сравнения («больше», «хуже»…) и период («неделя», «вчера»…) — слова,
+которые меняют смысл вопроса на противоположный или другой.
+
+Кэшируются только read-only ответы агента. Область задаёт brain: роль и
+чат — ответ считался с историей этого чата и в другом неуместен. Запись
+годна, пока не изменились данные (версии файлов) и не истёк ANSWER_CACHE_TTL.
+LRU на ANSWER_CACHE_SIZE записей (0 — кэш выключен).
+
+Метрики: answer_cache.lookups, .hit, .miss, .stored,
+gauge answer_cache.size и answer_cache.hit_rate.
+"""
+import re
+import time
+from collections import OrderedDict
+
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+from utils import metrics
+
+_RE_WORD = re.compile(r"@\w+|\d+|[a-zа-яё]+")
+
+_STOP_WORDS = {
+    "а", "и", "в", "во", "на", "за", "по", "с", "со", "у", "к", "о", "об", "от", "до", "из",
+    "ли", "же", "бы", "ну", "то", "это", "эта", "этой", "этот", "эту", "этом", "тот",
+    "кто", "что", "какой", "какая", "какие", "каких", "как", "где", "сейчас", "вообще",
+    "мне", "нам", "нас", "покажи", "скажи", "подскажи", "дай", "выведи", "пожалуйста", "плиз",
+    "бот", "текущей", "текущий", "самый", "самые", "самых", "был", "была", "были",
+}
+
+# Окончания — от длинных к коротким; основа не короче 3 букв
+_ENDINGS = sorted((
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ах", "ях", "ов", "ев", "ам", "ям",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ую", "юю", "ом", "ем",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+), key=len, reverse=True)
+
+_SYNONYMS = {
+    "лучш": "топ", "лидер": "топ", "перв": "топ",
+    "сегодн": "день", "дня": "день", "днях": "день",
+    "неактивн": "неактив", "бездельник": "неактив", "афк": "неактив",
+    "статистик": "стат",
+}
+
+# Основы, меняющие смысл вопроса, — сравниваются точно, как сущности
+_EXACT_STEMS = {
+    "не": "не", "ни": "не", "нет": "не",
+    "больш": "больше", "меньш": "меньше", "выш": "больше", "ниж": "меньше",
+    "хуж": "хуже", "худш": "хуже", "чащ": "чаще", "реж": "реже",
+    "день": "день", "вчер": "вчера", "недел": "неделя", "месяц": "месяц", "год": "год",
+}
+
+# (область, основы, сущности) → запись
+_entries: OrderedDict[tuple, dict] = OrderedDict()
+
+
+def _stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def question_key(text: str) -> tuple[frozenset, frozenset]:
+    """(основы слов, сущности: @username, числа и смысловые слова) нормализованного вопроса."""
+    from agent.intents import normalize
+    stems, entities = set(), set()
+    for word in _RE_WORD.findall(normalize(text).lower()):
+        if word.startswith("@") or word.isdigit():
+            entities.add(word)
+        elif word not in _STOP_WORDS:
+            stem = _stem(word)
+            stem = _SYNONYMS.get(stem, stem)
+            if stem in _EXACT_STEMS:
+                entities.add(_EXACT_STEMS[stem])
+            else:
+                stems.add(stem)
+    return frozenset(stems), frozenset(entities)
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _update_gauges():
+    metrics.set_gauge("answer_cache.size", len(_entries))
+    rate = metrics.ratio("answer_cache.hit", "answer_cache.lookups")
+    metrics.set_gauge("answer_cache.hit_rate", round(rate or 0, 3))
+
+
+def get(scope, text: str, versions: tuple) -> str | None:
+    """Ответ на похожий вопрос в той же области и на тех же данных (None — промах)."""
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    stems, entities = question_key(text)
+    if not stems:
+        return None
+    metrics.inc("answer_cache.lookups")
+    now = time.monotonic()
+    best_key, best_score = None, 0.0
+    for key, entry in list(_entries.items()):
+        if entry["versions"] != versions or now - entry["at"] > ANSWER_CACHE_TTL:
+            del _entries[key]  # данные изменились или устарело — больше не пригодится
+            continue
+        if key[0] != scope or key[2] != entities:
+            continue
+        score = _similarity(stems, key[1])
+        if score > best_score:
+            best_key, best_score = key, score
+    if best_key is None or best_score * 100 < ANSWER_CACHE_SIMILARITY:
+        metrics.inc("answer_cache.miss")
+        _update_gauges()
+        return None
+    _entries.move_to_end(best_key)
+    metrics.inc("answer_cache.hit")
+    _update_gauges()
+    print(f"[ANSWER-CACHE] Похожий вопрос ({best_score:.2f}): \"{text.strip()[:50]}\"")
+    return _entries[best_key]["answer"]
+
+
+def put(scope, text: str, versions: tuple, answer: str):
+    if ANSWER_CACHE_SIZE <= 0 or not answer:
+        return
+    stems, entities = question_key(text)
+    if not stems:
+        return
+    key = (scope, stems, entities)
+    _entries[key] = {"versions": versions, "answer": answer, "at": time.monotonic()}
+    _entries.move_to_end(key)
+    while len(_entries) > ANSWER_CACHE_SIZE:
+        _entries.popitem(last=False)
+    metrics.inc("answer_cache.stored")
+    _update_gauges()
+
+
+def clear():
+    _entries.clear()
+    _update_gauges()
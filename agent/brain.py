@@ -5,19 +5,21 @@
 По образцу ChatGptController: всё в одном файле-контроллере.
 """
 import json
+import random
 import re
 import time
 import asyncio
 import html as html_module
 from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import anthropic
 import httpx
 
 from config import (
-    MODEL, MAX_TOKENS, MAX_TOOL_ROUNDS, MAX_HISTORY,
-    MAX_USERS_CACHE, ANTHROPIC_API_KEY, SEARCH_BUGS_LIMIT,
+    MODEL, MAX_TOKENS, MAX_TOOL_ROUNDS, MAX_HISTORY, TOOL_SELECTION,
+    ANTHROPIC_API_KEY, SEARCH_BUGS_LIMIT, REQUEST_DEADLINE, MEMORY_TOKEN_BUDGET,
 )
 from models.tester import (
     get_tester_by_username, get_all_testers, increment_warnings,
@@ -31,9 +33,12 @@ from models.admin import add_admin, remove_admin, get_all_admins, get_admin_ids
 from services.points_service import award_points, award_points_bulk
 from services.rating_service import get_rating
 from json_store import (
-    async_load, async_update,
-    POINTS_LOG_FILE, WARNINGS_FILE, TESTERS_FILE, BUGS_FILE, TASKS_FILE,
+    async_load, async_update, get_version,
+    POINTS_LOG_FILE, WARNINGS_FILE, TESTERS_FILE, BUGS_FILE, TASKS_FILE, LOGIN_MAPPING_FILE,
+    ADMINS_FILE,
 )
+from agent import answer_cache, budget, chat_queue, llm_scheduler, memory, model_router
+from utils import accounting, deadline, metrics, singleflight
 from utils.logger import log_info, log_admin, get_bot
 
 
@@ -41,59 +46,147 @@ from utils.logger import log_info, log_admin, get_bot
 # ║                   CLAUDE API КЛИЕНТ                              ║
 # ╚══════════════════════════════════════════════════════════════════╝
 
-client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+# Повторы — только в call_claude (пауза по retry-after, jitter, дедлайн запроса);
+# встроенные повторы SDK держали бы слот планировщика и обходили всё это
+client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
 
-MIN_INTERVAL = 1.0
-_last_request_time = 0.0
-_throttle_lock = asyncio.Lock()
+RETRY_BASE_DELAY = 1.0    # сек, экспонента с jitter
+RETRY_MAX_DELAY = 20.0    # дольше между попытками не ждём
+MAX_RETRY_AFTER = 30.0    # retry-after длиннее — сразу отдаём ошибку, а не висим
 
 
-async def _throttle():
-    """Ждём если запросы слишком частые."""
-    global _last_request_time
-    async with _throttle_lock:
-        now = time.time()
-        elapsed = now - _last_request_time
-        if elapsed < MIN_INTERVAL:
-            await asyncio.sleep(MIN_INTERVAL - elapsed)
-        _last_request_time = time.time()
+def _retry_after(headers) -> float | None:
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 
+def _retry_delay(attempt: int, retry_after: float | None) -> float:
+    """retry-after (+ до 1с jitter, чтобы ожидающие не стартовали разом) или экспонента с jitter."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1.0)
+    base = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt + 1))
+    return base / 2 + random.uniform(0, base / 2)
 
-async def call_claude(max_retries: int = 3, **kwargs):
-    """Обёртка над client.messages.create с throttle и retry."""
+
+async def call_claude(max_retries: int = 4, priority: tuple = None, on_text=None, **kwargs):
+    """
+    Обёртка над client.messages.create: слот у планировщика и retry.
+    priority — llm_scheduler.priority(role, continuation); по умолчанию — новый запрос тестера.
+    on_text — async-колбэк: ответ идёт через messages.stream, куски текста
+    передаются в него по мере генерации (on_text(None) — сброс перед повтором).
+
+    Заголовки anthropic-ratelimit-* каждого ответа уходят в планировщик —
+    он сам замедляется у границы лимита. 429/5xx/529 повторяются с jitter;
+    retry-after от 429 ставит на паузу все запросы, не только этот.
+    """
+    prio = priority or llm_scheduler.priority("tester")
+    tokens = llm_scheduler.estimate_tokens(kwargs)
+    started = time.monotonic()
     for attempt in range(max_retries):
-        await _throttle()
+        streamed = False
         try:
-            return await client.messages.create(**kwargs)
+            async with llm_scheduler.slot(prio, tokens) as slot_usage:
+                if on_text is None:
+                    raw = await client.messages.with_raw_response.create(**kwargs)
+                    response = raw.parse()
+                    headers = raw.headers
+                else:
+                    async with client.messages.stream(**kwargs) as stream:
+                        async for delta in stream.text_stream:
+                            streamed = True
+                            await on_text(delta)
+                        response = await stream.get_final_message()
+                    headers = getattr(getattr(stream, "response", None), "headers", None)
+                usage = response.usage
+                slot_usage["tokens"] = usage.input_tokens + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+            llm_scheduler.observe_headers(headers, tokens)
+            cost = accounting.add_llm(kwargs.get("model"), response.usage, (time.monotonic() - started) * 1000)
+            try:
+                await budget.add(accounting.current_role(), cost)
+            except Exception as e:
+                print(f"[BUDGET] Ошибка учёта: {e}")
+            return response
         except anthropic.APIStatusError as e:
-            if e.status_code in (429, 500, 529) and attempt < max_retries - 1:
-                wait = 2 ** attempt * 2
-                print(f"[CLAUDE-CLIENT] {e.status_code}, retry {attempt + 1} через {wait}с...")
-                await asyncio.sleep(wait)
-            else:
+            if streamed:
+                await on_text(None)
+            headers = getattr(e.response, "headers", None)
+            llm_scheduler.observe_headers(headers, tokens)
+            retry_after = _retry_after(headers)
+            retryable = e.status_code in (429, 500, 502, 503, 504, 529)
+            if not retryable or attempt == max_retries - 1 or (retry_after or 0) > MAX_RETRY_AFTER:
                 raise
-        except (httpx.ConnectError, httpx.ReadTimeout) as e:
-            if attempt < max_retries - 1:
-                wait = 2 ** attempt * 2
-                print(f"[CLAUDE-CLIENT] Network error ({type(e).__name__}), retry {attempt + 1} через {wait}с...")
-                await asyncio.sleep(wait)
-            else:
+            wait = _retry_delay(attempt, retry_after)
+            if not _fits_deadline(wait):
+                raise
+            if e.status_code == 429:
+                metrics.inc("claude.rate_limited")
+                llm_scheduler.pause(retry_after if retry_after is not None else wait)
+            print(f"[CLAUDE-CLIENT] {e.status_code}, retry {attempt + 1} через {wait:.1f}с...")
+            await asyncio.sleep(wait)
+        # При max_retries=0 сетевые сбои приходят от SDK как APIConnectionError
+        # (и его подкласс APITimeoutError); сырые httpx — на случай обрыва потока
+        except (anthropic.APIConnectionError, httpx.ConnectError, httpx.ReadTimeout) as e:
+            if streamed:
+                await on_text(None)
+            wait = _retry_delay(attempt, None)
+            if attempt == max_retries - 1 or not _fits_deadline(wait):
                 raise
+            print(f"[CLAUDE-CLIENT] Network error ({type(e).__name__}), retry {attempt + 1} через {wait:.1f}с...")
+            await asyncio.sleep(wait)
+
+
+def _fits_deadline(wait: float) -> bool:
+    """Успеет ли повтор после паузы wait до дедлайна запроса (deadline.remaining)."""
+    left = deadline.remaining()
+    return left is None or wait < left
+
+
+def _usage_str(usage) -> str:
+    """Токены ответа для лога (включая кэш промпта) + счётчики в метрики."""
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    metrics.inc("claude.input_tokens", usage.input_tokens)
+    metrics.inc("claude.output_tokens", usage.output_tokens)
+    metrics.inc("claude.cache_read_tokens", cache_read)
+    metrics.inc("claude.cache_write_tokens", cache_write)
+    return (
+        f"in={usage.input_tokens}, out={usage.output_tokens}, "
+        f"cache_read={cache_read}, cache_write={cache_write}"
+    )
 
 
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║                   СИСТЕМНЫЙ ПРОМПТ                               ║
 # ╚══════════════════════════════════════════════════════════════════╝
 
-def get_system_prompt(context: dict) -> str:
+# Кэш промпта Anthropic: стабильный префикс (tools → ролевой system-блок)
+# помечается cache_control, переменная часть идёт после него.
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def get_system_prompt(context: dict) -> list[dict]:
     """
-    Формирует системный промпт с контекстом.
+    Формирует системный промпт с контекстом — блоками для Anthropic API.
     context: {"username": ..., "role": ..., "topic": ...}
+
+    Первый блок зависит только от роли и кэшируется; строка
+    «@username | роль | топик» идёт вторым блоком, после кэша.
     """
     role = context.get('role', 'tester')
     username = context.get('username', 'unknown')
     topic = context.get('topic', 'unknown')
 
+    return [
+        {"type": "text", "text": _get_role_prompt(role), "cache_control": _CACHE_CONTROL},
+        {"type": "text", "text": f"Текущее сообщение: @{username} | {role} | топик: {topic}"},
+    ]
+
+
+@lru_cache(maxsize=None)
+def _get_role_prompt(role: str) -> str:
+    """Неизменная для роли часть системного промпта (байт в байт — иначе кэш промахнётся)."""
     if role == "owner":
         role_block = (
             "Пользователь: РУКОВОДИТЕЛЬ (высшая роль).\n"
@@ -132,7 +225,6 @@ def get_system_prompt(context: dict) -> str:
     prompt = f"""Ты — свой чувак в чате тестирования Umbrella (чит для Dota 2). Координируешь тестирование.
 Роли: руководитель, админ, тестер.
 
-@{username} | {role} | топик: {topic}
 {role_block}
 
 <классификация>
@@ -413,11 +505,12 @@ ALL_TOOLS = [
     },
     {
         "name": "search_bugs",
-        "description": "Поиск багов. Укажи хотя бы один фильтр: bug_id, query, tester или status.",
+        "description": "Поиск багов. Укажи хотя бы один фильтр: display_number, bug_id, query, tester или status.",
         "input_schema": {
             "type": "object",
             "properties": {
-                "bug_id": {"type": "integer", "description": "ID бага"},
+                "display_number": {"type": "integer", "description": "Номер бага, который видят пользователи (#N)"},
+                "bug_id": {"type": "integer", "description": "Внутренний ID бага"},
                 "query": {"type": "string", "description": "Текстовый поиск"},
                 "tester": {"type": "string", "description": "@username тестера"},
                 "status": {"type": "string", "enum": ["pending", "accepted", "rejected", "duplicate", "all"]}
@@ -476,48 +569,108 @@ ALL_TOOLS = [
 ]
 
 
-def get_tools_for_role(role: str) -> list:
-    """Возвращает набор инструментов в зависимости от роли."""
+@lru_cache(maxsize=None)
+def _get_role_tools(role: str) -> tuple:
     if role == "owner":
-        return ALL_TOOLS
-    if role == "admin":
-        return [t for t in ALL_TOOLS if t["name"] != "manage_admin"]
-    tester_tools = ["get_tester_stats", "get_rating"]
-    return [t for t in ALL_TOOLS if t["name"] in tester_tools]
+        tools = list(ALL_TOOLS)
+    elif role == "admin":
+        tools = [t for t in ALL_TOOLS if t["name"] != "manage_admin"]
+    else:
+        tester_tools = ["get_tester_stats", "get_rating"]
+        tools = [t for t in ALL_TOOLS if t["name"] in tester_tools]
+    # Точка кэша на последнем инструменте: весь список tools — часть кэшируемого префикса
+    if tools:
+        tools[-1] = {**tools[-1], "cache_control": _CACHE_CONTROL}
+    return tuple(tools)
+
+
+def get_tools_for_role(role: str) -> list:
+    """Возвращает набор инструментов в зависимости от роли (с точкой кэша на последнем)."""
+    return list(_get_role_tools(role))
+
+
+# === Отбор инструментов по намерению ===
+# Локальный классификатор по основам слов выбирает группы инструментов.
+# Ни одна группа не угадана — отправляем полный набор (fallback).
+# Наборов немного (комбинации групп), каждый кэшируется как свой префикс промпта.
+_TOOL_GROUPS = {
+    "analytics": ("get_tester_stats", "get_team_stats", "get_inactive_testers", "compare_testers",
+                  "get_bug_stats", "get_testers_list", "get_rating", "publish_rating"),
+    "points": ("award_points", "award_points_bulk"),
+    "warnings": ("issue_warning", "issue_warning_bulk", "remove_warning", "get_inactive_testers"),
+    "bugs": ("search_bugs", "mark_bug_duplicate", "delete_bug", "get_bug_stats"),
+    "logins": ("link_login", "get_logins_list"),
+    "admin": ("manage_admin", "switch_mode", "refresh_testers", "create_task"),
+}
+# Нужны почти любой составной команде («баллы активным» → список → начисление)
+_CORE_TOOLS = ("get_tester_stats", "get_testers_list")
+
+_GROUP_KEYWORDS = {
+    "analytics": ("стат", "рейтинг", "топ", "таблиц", "лидер", "лучш", "неактив", "не работал", "афк",
+                  "бездел", "сравни", "активн", "сколько", "итог", "опубликуй", "запости"),
+    "points": ("балл", "очк", "начисл", "спиш", "награ"),
+    "warnings": ("варн", "предупре", "выговор"),
+    "bugs": ("баг", "краш", "дубл", "вик", "weeek"),
+    "logins": ("логин", "аккаунт", "привяж", "отвяж", "привяз"),
+    "admin": ("админ", "режим", "наблюден", "обнови", "синхрон", "задани", "задач"),
+}
+
+
+def classify_tool_groups(text: str) -> tuple[str, ...]:
+    """Группы инструментов, о которых говорит сообщение (пусто — не уверены)."""
+    lowered = text.lower()
+    return tuple(sorted(
+        group for group, keywords in _GROUP_KEYWORDS.items()
+        if any(kw in lowered for kw in keywords)
+    ))
+
+
+@lru_cache(maxsize=None)
+def _get_subset_tools(role: str, groups: tuple[str, ...]) -> tuple:
+    wanted = set(_CORE_TOOLS)
+    for group in groups:
+        wanted.update(_TOOL_GROUPS[group])
+    tools = [t for t in _get_role_tools(role) if t["name"] in wanted]
+    tools = [{k: v for k, v in t.items() if k != "cache_control"} for t in tools]
+    if tools:
+        tools[-1] = {**tools[-1], "cache_control": _CACHE_CONTROL}
+    return tuple(tools)
+
+
+def select_tools(role: str, text: str) -> list:
+    """Инструменты для запроса: по роли и, для админов, по намерению сообщения."""
+    if not TOOL_SELECTION or role not in ("owner", "admin"):
+        return get_tools_for_role(role)
+    metrics.inc("tools.select.total")
+    groups = classify_tool_groups(text)
+    if not groups:
+        metrics.inc("tools.select.fallback")
+        tools = get_tools_for_role(role)
+    else:
+        for group in groups:
+            metrics.inc(f"tools.select.group.{group}")
+        tools = list(_get_subset_tools(role, groups))
+    metrics.observe("tools.select.count", len(tools))
+    rate = metrics.ratio("tools.select.fallback", "tools.select.total")
+    metrics.set_gauge("tools.select.fallback_rate", round(rate, 3))
+    return tools
 
 
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║                   ИСТОРИЯ ДИАЛОГОВ                               ║
 # ╚══════════════════════════════════════════════════════════════════╝
 
-_conversation_history: OrderedDict[int, list] = OrderedDict()
-
+# Бюджет по токенам, резюме старых реплик и хранение на диске — agent/memory.py
 
-def _get_history(history_key: int) -> list:
-    """Получает историю по ключу (chat_id или caller_id), обновляя LRU-порядок."""
-    if history_key in _conversation_history:
-        _conversation_history.move_to_end(history_key)
-        return _conversation_history[history_key]
-    if len(_conversation_history) >= MAX_USERS_CACHE:
-        _conversation_history.popitem(last=False)
-    _conversation_history[history_key] = []
-    return _conversation_history[history_key]
 
-
-def clear_history(caller_id: int):
+async def clear_history(caller_id: int):
     """Сбрасывает историю диалога для пользователя (при смене роли)."""
-    _conversation_history.pop(caller_id, None)
+    await memory.clear(caller_id)
 
 
-def clear_all_history():
+async def clear_all_history():
     """Полный сброс всей памяти бота — все диалоги всех пользователей."""
-    _conversation_history.clear()
-
-
-def _trim_history(history: list, max_messages: int):
-    """Обрезает историю до max_messages сообщений."""
-    while len(history) > max_messages:
-        history.pop(0)
+    await memory.clear_all()
 
 
 # === Мгновенные ответы БЕЗ вызова Claude API ===
@@ -615,25 +768,318 @@ def _tag(username: str) -> str:
     return html_module.escape(username.lstrip("@"))
 
 
+# === Кэш результатов read-only инструментов ===
+# Ключ: инструмент + аргументы + версии файлов, из которых он читает.
+# Любая запись в эти файлы (json_store.save) меняет версию — кэш сам промахивается.
+# TTL — для периодов «сегодня/неделя» и «неактивны N дней», зависящих от текущего времени.
+_TOOL_CACHE_FILES = {
+    # ADMINS_FILE: рейтинг и списки тестеров исключают админов (get_admin_ids)
+    "get_rating": (TESTERS_FILE, ADMINS_FILE),
+    "get_team_stats": (TESTERS_FILE, BUGS_FILE, POINTS_LOG_FILE, ADMINS_FILE),
+    "get_bug_stats": (BUGS_FILE,),
+    "get_testers_list": (TESTERS_FILE, ADMINS_FILE),
+    "get_inactive_testers": (TESTERS_FILE, POINTS_LOG_FILE, ADMINS_FILE),
+    "get_logins_list": (LOGIN_MAPPING_FILE, TESTERS_FILE),
+    "get_tester_stats": (TESTERS_FILE,),
+    "compare_testers": (TESTERS_FILE,),
+    "search_bugs": (BUGS_FILE, TESTERS_FILE),
+}
+# Результат зависит от вызывающего (get_tester_stats: не найден — статистика самого caller)
+_CALLER_SCOPED_TOOLS = {"get_tester_stats"}
+# @username и регистр не меняют результат — ключ кэша один на тестера
+_USERNAME_ARGS = ("username", "username1", "username2", "tester")
+_TOOL_CACHE_TTL = 300
+_TOOL_CACHE_SIZE = 128
+_tool_cache: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+
+
+def _tool_cache_key(name: str, args: dict, caller_id: int = None) -> tuple:
+    versions = tuple(get_version(f) for f in _TOOL_CACHE_FILES[name])
+    args = dict(args or {})
+    for field in _USERNAME_ARGS:
+        if isinstance(args.get(field), str):
+            args[field] = _normalize_username(args[field]).lower()
+    caller = caller_id if name in _CALLER_SCOPED_TOOLS else None
+    return name, json.dumps(args, sort_keys=True, ensure_ascii=False), versions, caller
+
+
+def _tool_cache_get(key: tuple) -> str | None:
+    entry = _tool_cache.get(key)
+    if entry is None or time.monotonic() - entry[0] > _TOOL_CACHE_TTL:
+        return None
+    _tool_cache.move_to_end(key)
+    return entry[1]
+
+
+def _tool_cache_put(key: tuple, result: str):
+    _tool_cache[key] = (time.monotonic(), result)
+    _tool_cache.move_to_end(key)
+    while len(_tool_cache) > _TOOL_CACHE_SIZE:
+        _prefetched_keys.discard(_tool_cache.popitem(last=False)[0])
+
+
+# === Упреждающая загрузка упомянутых тестеров ===
+# Пока Claude думает над первым ответом, данные упомянутых @username
+# (и реплая — «контекст: реплай на @…») уже считаются и ложатся в кэш:
+# инструмент следующего раунда берёт готовое, индекс тестеров прогрет.
+# Отдельного инструмента варнов нет — их число в get_tester_stats, а
+# issue/remove_warning находят тестера по индексу, который прогреваем всегда.
+_MENTION_RE = re.compile(r"@(\w{3,32})")
+_PREFETCH_LIMIT = 5
+# Инструмент → аргументы для упомянутого тестера; грузим только выбранные для запроса
+_PREFETCH_TOOLS = {
+    "get_tester_stats": lambda name: {"username": name},  # баллы, число багов и варнов
+    "search_bugs": lambda name: {"tester": name},         # баги тестера
+}
+_prefetched_keys: set[tuple] = set()
+
+
+def _mentioned_usernames(text: str) -> list[str]:
+    names = []
+    for name in _MENTION_RE.findall(text):
+        # Юзернеймы ботов (обращение к нам самим) не тестеры
+        if name.lower().endswith("bot") or name.lower() in names:
+            continue
+        names.append(name.lower())
+    return names[:_PREFETCH_LIMIT]
+
+
+async def _prefetch_mentions(text: str, caller_id: int = None, tool_names=frozenset(_PREFETCH_TOOLS)):
+    """Греет кэш инструментов по упомянутым тестерам (параллельно с вызовом Claude)."""
+    names = _mentioned_usernames(text)
+    if not names:
+        return
+    calls = [(tool, build(name)) for name in names
+             for tool, build in _PREFETCH_TOOLS.items() if tool in tool_names]
+    started = time.monotonic()
+    keys = [_tool_cache_key(tool, args, caller_id) for tool, args in calls]
+    _prefetched_keys.update(keys)
+    await asyncio.gather(
+        *(execute_tool(tool, args, caller_id) for tool, args in calls),
+        *(get_tester_by_username(name) for name in names),
+        return_exceptions=True,
+    )
+    # Не найден / данные успели измениться — в кэш не легло, ждать попадания нечего
+    _prefetched_keys.difference_update(k for k in keys if k not in _tool_cache)
+    metrics.inc("prefetch.testers", len(names))
+    metrics.observe("prefetch.ms", (time.monotonic() - started) * 1000)
+
+
 async def execute_tool(name: str, arguments: str, caller_id: int = None, topic: str = "") -> str:
     """
     Выполняет функцию по имени и возвращает JSON-результат.
     arguments — строка JSON от ИИ.
+    Результаты read-only инструментов (_TOOL_CACHE_FILES) кэшируются до изменения данных.
     """
     try:
         args = json.loads(arguments) if isinstance(arguments, str) else arguments
     except json.JSONDecodeError:
         return json.dumps({"error": "Не удалось разобрать аргументы"}, ensure_ascii=False)
 
+    cache_key = None
+    if name in _TOOL_CACHE_FILES:
+        # Права проверяем до кэша — результат админского инструмента не должен утечь
+        perm_error = await _check_permission(name, caller_id)
+        if perm_error:
+            return json.dumps({"error": perm_error}, ensure_ascii=False)
+        cache_key = _tool_cache_key(name, args, caller_id)
+        cached = _tool_cache_get(cache_key)
+        if cached is not None:
+            metrics.inc("tools.cache_hit")
+            if cache_key in _prefetched_keys:
+                _prefetched_keys.discard(cache_key)
+                metrics.inc("prefetch.hit")
+            print(f"[TOOL-EXEC] {name} → кэш")
+            return cached
+        metrics.inc("tools.cache_miss")
+
     try:
         result = await _dispatch(name, args, caller_id, topic)
         print(f"[TOOL-EXEC] {name} → OK")
-        return json.dumps(result, ensure_ascii=False, default=str)
+        result_json = json.dumps(result, ensure_ascii=False, default=str)
+        if cache_key is not None and not (isinstance(result, dict) and result.get("error")):
+            _tool_cache_put(cache_key, result_json)
+        return result_json
     except Exception as e:
         print(f"[TOOL-EXEC] {name} → ERROR: {e}")
         return json.dumps({"error": f"Ошибка: {str(e)}"}, ensure_ascii=False)
 
 
+# === Компактные проекции результатов для Claude ===
+# execute_tool возвращает полный результат (его же используют прямые команды и кэш),
+# а в tool_result уходит проекция: только поля, нужные модели, длинный текст обрезан
+# с маркером, у списков — total (сколько всего) отдельно от returned (сколько в ответе).
+_PROJECT_TEXT_LIMIT = 300
+_PROJECT_LIST_LIMIT = 50
+_TRUNC_MARK = "…[обрезано]"
+_KEEP_FULL_KEYS = {"formatted_message"}  # отправляется пользователю как есть
+
+
+def _clip_text(value: str, limit: int = _PROJECT_TEXT_LIMIT) -> str:
+    return value if len(value) <= limit else value[:limit] + _TRUNC_MARK
+
+
+def _pick(item: dict, fields: tuple) -> dict:
+    return {k: item[k] for k in fields if item.get(k) not in (None, "", [])}
+
+
+def _project_bug(bug: dict) -> dict:
+    out = _pick(bug, ("id", "display_number", "username", "status", "type", "points_awarded", "weeek_task_id"))
+    out["script"] = bug.get("script_name") or bug.get("title") or ""
+    steps = bug.get("steps") or bug.get("description")
+    if steps:
+        out["steps"] = steps
+    if bug.get("youtube_link"):
+        out["video"] = bug["youtube_link"]
+    out["created"] = (bug.get("created_at") or "")[:10]
+    return out
+
+
+def _project_page(result: dict, key: str, project, total: int | None = None) -> dict:
+    items = result.get(key) or []
+    return {
+        "total": total if total is not None else len(items),
+        "returned": len(items),
+        key: [project(item) for item in items],
+    }
+
+
+_TOOL_PROJECTIONS = {
+    "search_bugs": lambda r: _project_page(r, "bugs", _project_bug, r.get("total")),
+    "get_rating": lambda r: _pick(r, ("total_testers", "formatted_message")),
+    "publish_rating": lambda r: {
+        "published": r.get("published", False),
+        **_pick(r, ("awaiting_confirmation",)),
+    },
+    "get_testers_list": lambda r: _project_page(
+        r, "testers", lambda t: _pick(t, ("username", "total_points", "warnings_count", "is_active")),
+    ),
+    "get_inactive_testers": lambda r: {
+        "days": r["days"],
+        **_project_page(r, "testers", lambda t: {
+            "username": t["username"], "last_activity": (t.get("last_activity") or "")[:10] or None,
+        }),
+    },
+    "get_tester_stats": lambda r: {k: v for k, v in r.items() if k not in ("full_name", "registered")},
+    "award_points": lambda r: _pick(r, ("success", "error", "username", "amount", "new_total", "reason")),
+    "award_points_bulk": lambda r: {
+        "success_count": r["success_count"],
+        "failed_count": r["failed_count"],
+        "results": [_pick(x, ("username", "new_total")) for x in r.get("results", [])],
+        "errors": [x.get("error") for x in r.get("errors", [])],
+    },
+    "issue_warning": lambda r: {k: v for k, v in r.items() if k != "telegram_id"},
+    "issue_warning_bulk": lambda r: {
+        **{k: v for k, v in r.items() if k != "results"},
+        "results": [{k: v for k, v in x.items() if k != "telegram_id"} for x in r.get("results", [])],
+    },
+}
+
+
+def _compact_value(value, key: str = ""):
+    """Обрезает длинные строки и списки (с маркером), рекурсивно."""
+    if isinstance(value, str):
+        return value if key in _KEEP_FULL_KEYS else _clip_text(value)
+    if isinstance(value, list):
+        items = [_compact_value(v) for v in value[:_PROJECT_LIST_LIMIT]]
+        if len(value) > _PROJECT_LIST_LIMIT:
+            items.append(f"…ещё {len(value) - _PROJECT_LIST_LIMIT}")
+        return items
+    if isinstance(value, dict):
+        return {k: _compact_value(v, k) for k, v in value.items()}
+    return value
+
+
+def project_tool_result(name: str, result_json: str) -> str:
+    """Компактная версия результата инструмента для tool_result."""
+    try:
+        result = json.loads(result_json)
+    except (json.JSONDecodeError, TypeError):
+        return _clip_text(str(result_json), _PROJECT_TEXT_LIMIT * 4)
+    if isinstance(result, dict) and not result.get("error") and name in _TOOL_PROJECTIONS:
+        try:
+            result = _TOOL_PROJECTIONS[name](result)
+        except (KeyError, TypeError, AttributeError) as e:
+            print(f"[TOOL] Проекция {name} не удалась: {e}")
+    compact = json.dumps(_compact_value(result), ensure_ascii=False, default=str)
+    metrics.inc("tools.result_chars_full", len(result_json))
+    metrics.inc("tools.result_chars_sent", len(compact))
+    return compact
+
+
+# === Параллельное исполнение: кто что читает и меняет ===
+# Ресурс — "вид:id" ("tester:petrov") или "вид:*" (все сущности вида), "*" — всё.
+# Два вызова конфликтуют, если пересекаются по ресурсу и хотя бы один мутирующий:
+# такие идут строго по порядку, остальные в одном раунде — параллельно.
+
+def _tester_resources(*usernames) -> set[str]:
+    keys = set()
+    for value in usernames:
+        for name in str(value or "").split(","):
+            name = _normalize_username(name.strip()).lower()
+            if name == "all":
+                return {"tester:*"}
+            if name:
+                keys.add(f"tester:{name}")
+    return keys or {"tester:*"}
+
+
+_TOOL_ACCESS = {
+    # инструмент: (мутирующий?, args → ресурсы)
+    "get_tester_stats": (False, lambda a: _tester_resources(a.get("username"))),
+    "compare_testers": (False, lambda a: _tester_resources(a.get("username1"), a.get("username2"))),
+    "get_team_stats": (False, lambda a: {"tester:*", "bug:*"}),
+    "get_inactive_testers": (False, lambda a: {"tester:*"}),
+    "get_testers_list": (False, lambda a: {"tester:*"}),
+    "get_rating": (False, lambda a: {"tester:*"}),
+    "publish_rating": (False, lambda a: {"tester:*"}),
+    "get_bug_stats": (False, lambda a: {"bug:*"}),
+    "search_bugs": (False, lambda a: {"bug:*"}),
+    "get_logins_list": (False, lambda a: {"login:*"}),
+    "award_points": (True, lambda a: _tester_resources(a.get("username"))),
+    "award_points_bulk": (True, lambda a: _tester_resources(a.get("usernames"))),
+    "issue_warning": (True, lambda a: _tester_resources(a.get("username"))),
+    "issue_warning_bulk": (True, lambda a: _tester_resources(a.get("usernames"))),
+    "remove_warning": (True, lambda a: _tester_resources(a.get("usernames"))),
+    "refresh_testers": (True, lambda a: {"tester:*"}),
+    # bug.py пишет баги через load/save — все изменения багов только по очереди
+    "mark_bug_duplicate": (True, lambda a: {"bug:*"}),
+    "delete_bug": (True, lambda a: {"bug:*", "tester:*"}),
+    "link_login": (True, lambda a: {"login:*"}),
+    "create_task": (True, lambda a: {"task:*"}),
+    "manage_admin": (True, lambda a: {"admin:*"}),
+    "switch_mode": (True, lambda a: {"*"}),
+}
+
+
+def _tool_access(name: str, args: dict) -> tuple[bool, set[str]]:
+    """(мутирующий?, ресурсы). Неизвестный инструмент — мутирует всё."""
+    spec = _TOOL_ACCESS.get(name)
+    if spec is None:
+        return True, {"*"}
+    mutates, resources = spec
+    try:
+        return mutates, resources(args or {})
+    except Exception:
+        return mutates, {"*"}
+
+
+def _resources_overlap(a: set[str], b: set[str]) -> bool:
+    if "*" in a or "*" in b:
+        return True
+    for ka in a:
+        kind_a, _, id_a = ka.partition(":")
+        for kb in b:
+            kind_b, _, id_b = kb.partition(":")
+            if kind_a == kind_b and (id_a == id_b or id_a == "*" or id_b == "*"):
+                return True
+    return False
+
+
+def _tools_conflict(a: tuple[bool, set[str]], b: tuple[bool, set[str]]) -> bool:
+    return (a[0] or b[0]) and _resources_overlap(a[1], b[1])
+
+
 _ADMIN_TOOLS = {
     "award_points", "award_points_bulk", "issue_warning", "issue_warning_bulk",
     "remove_warning", "create_task", "mark_bug_duplicate", "search_bugs",
@@ -788,10 +1234,12 @@ async def _dispatch(name: str, args: dict, caller_id: int = None, topic: str = "
         return {"success": True, "bug_id": args["bug_id"], "status": "duplicate"}
 
     elif name == "search_bugs":
-        return await _search_bugs(args.get("query"), args.get("tester"), args.get("bug_id"), args.get("status"))
+        return await _search_bugs(args.get("query"), args.get("tester"), args.get("bug_id"), args.get("status"),
+                                  args.get("display_number"))
 
     elif name == "delete_bug":
-        return await _delete_bug(args.get("bug_id"), args["target"], args.get("delete_all", False))
+        return await _delete_bug(args.get("bug_id"), args["target"], args.get("delete_all", False),
+                                 caller_id, topic)
 
     elif name == "refresh_testers":
         return await _refresh_testers()
@@ -1163,7 +1611,9 @@ async def _create_task(brief: str, admin_id: int) -> dict:
 
     full_text = brief
     try:
+        # Вызывается посреди tool-раунда админа — приоритет продолжения
         response = await call_claude(
+            priority=llm_scheduler.priority("admin", continuation=True),
             model=MODEL,
             messages=[{
                 "role": "user",
@@ -1270,7 +1720,7 @@ async def _manage_admin(action: str, username: str = None) -> dict:
             return {"error": f"@{clean_username} не найден в базе. Человек должен сначала написать в группу."}
         ok = await add_admin(tester["telegram_id"], tester["username"], tester["full_name"])
         if ok:
-            clear_history(tester["telegram_id"])
+            await clear_history(tester["telegram_id"])
         return {"success": ok, "action": "added", "username": _tag(tester["username"])}
 
     elif action == "remove":
@@ -1279,7 +1729,7 @@ async def _manage_admin(action: str, username: str = None) -> dict:
         ok = await remove_admin(tester["telegram_id"])
         if not ok:
             return {"error": "Не удалось удалить (возможно, это руководитель)"}
-        clear_history(tester["telegram_id"])
+        await clear_history(tester["telegram_id"])
         return {"success": True, "action": "removed", "username": _tag(tester["username"])}
 
     return {"error": f"Неизвестное действие: {action}"}
@@ -1326,15 +1776,21 @@ async def _refresh_testers() -> dict:
 
 
 async def _search_bugs(query: str = None, tester: str = None,
-                       bug_id: int = None, status: str = None) -> dict:
+                       bug_id: int = None, status: str = None, display_number: int = None) -> dict:
     bugs_data = await async_load(BUGS_FILE)
     items = bugs_data.get("items", {})
     testers_data = await async_load(TESTERS_FILE)
 
-    if bug_id:
+    if display_number:
+        # Пользователи видят display_number («Баг #N принят»); после миграции он не равен ID
+        bug = next((b for b in items.values() if (b.get("display_number") or b.get("id")) == display_number), None)
+        if not bug:
+            return {"error": f"Баг #{display_number} не найден"}
+    elif bug_id:
         bug = items.get(str(bug_id))
         if not bug:
             return {"error": f"Баг #{bug_id} не найден"}
+    if display_number or bug_id:
         bug = dict(bug)
         tid_key = str(bug.get("tester_id", ""))
         t = testers_data.get(tid_key, {})
@@ -1369,19 +1825,71 @@ async def _search_bugs(query: str = None, tester: str = None,
         results.append(bug)
 
     results.sort(key=lambda b: b.get("id", 0), reverse=True)
+    total = len(results)
     results = results[:SEARCH_BUGS_LIMIT]
 
     return {
         "query": query or "",
         "tester": tester or "",
         "status": status or "all",
+        "total": total,
         "count": len(results),
         "bugs": results,
     }
 
 
+_BULK_PROGRESS_MIN = 10        # Прогресс показываем только для больших пачек
+_BULK_PROGRESS_INTERVAL = 1.5  # Не чаще одного edit за столько секунд
+
+
+def _progress_reporter(caller_id: int, topic: str, title: str):
+    """
+    Async-колбэк прогресса для массовых операций: одно сообщение,
+    которое редактируется по мере выполнения (с троттлингом edit'ов).
+    ЛС → пишем вызвавшему, группа → в тот же топик.
+    """
+    from config import GROUP_ID, TOPIC_IDS
+
+    if topic == "private" or not GROUP_ID:
+        chat_id, thread_id = caller_id, None
+    else:
+        chat_id = GROUP_ID
+        thread_id = TOPIC_IDS.get(topic) if topic != "general" else None
+
+    state = {"message_id": None, "last_edit": 0.0}
+
+    async def report(done: int, total: int, ok: int, failed: int):
+        bot = get_bot()
+        if not bot or not chat_id or total < _BULK_PROGRESS_MIN:
+            return
+        now = time.monotonic()
+        if done < total and now - state["last_edit"] < _BULK_PROGRESS_INTERVAL:
+            return
+        state["last_edit"] = now
+        text = f"⏳ {title}: <b>{done}/{total}</b> (✅ {ok}, ❌ {failed})"
+        if done >= total:
+            text = f"✅ {title}: <b>{done}/{total}</b> (✅ {ok}, ❌ {failed})"
+        try:
+            if state["message_id"] is None:
+                msg = await bot.send_message(
+                    chat_id=chat_id, message_thread_id=thread_id,
+                    text=text, parse_mode="HTML",
+                )
+                state["message_id"] = msg.message_id
+            else:
+                await bot.edit_message_text(
+                    text=text, chat_id=chat_id,
+                    message_id=state["message_id"], parse_mode="HTML",
+                )
+        except Exception as e:
+            print(f"[PROGRESS] ERROR: {e}")
+
+    return report
+
+
 async def _delete_bug(bug_id: int = None, target: str = "both",
-                      do_delete_all: bool = False) -> dict:
+                      do_delete_all: bool = False,
+                      caller_id: int = None, topic: str = "") -> dict:
     """Удаляет баг(и) из БД и/или Weeek."""
 
     if do_delete_all:
@@ -1392,38 +1900,57 @@ async def _delete_bug(bug_id: int = None, target: str = "both",
         elif target in ("weeek_only", "both"):
             bugs_data = await async_load(BUGS_FILE)
             items = bugs_data.get("items", {})
-            weeek_bugs = [b for b in items.values() if b.get("weeek_task_id")]
-            weeek_deleted = 0
-            weeek_errors = 0
-            if weeek_bugs:
-                from services.weeek_service import delete_task as weeek_delete
-                for b in weeek_bugs:
-                    r = await weeek_delete(str(b["weeek_task_id"]))
-                    if r.get("success"):
-                        weeek_deleted += 1
-                    else:
-                        weeek_errors += 1
+            # weeek_task_id → ключ бага в bugs.json
+            task_to_bug = {
+                str(b["weeek_task_id"]): str(b["id"])
+                for b in items.values() if b.get("weeek_task_id")
+            }
+            deleted_ids: list[str] = []
+            failed: dict[str, str] = {}
+            if task_to_bug:
+                from services.weeek_service import delete_tasks_bulk
+                bulk = await delete_tasks_bulk(
+                    list(task_to_bug),
+                    on_progress=_progress_reporter(caller_id, topic, "Удаление задач из Weeek"),
+                )
+                deleted_ids = bulk["deleted"]
+                failed = bulk["failed"]
 
             result = {
                 "success": True,
                 "target": target,
-                "weeek_deleted": weeek_deleted,
-                "weeek_errors": weeek_errors,
+                "weeek_deleted": len(deleted_ids),
+                "weeek_errors": len(failed),
             }
+            if failed:
+                # Не удалённые сейчас задачи дочистит outbox-воркер
+                from services import weeek_outbox
+                for tid in failed:
+                    bug_key = task_to_bug[tid]
+                    await weeek_outbox.enqueue(
+                        "delete", None if target == "both" else int(bug_key), {"task_id": tid},
+                    )
+                result["weeek_queued"] = len(failed)
 
             if target == "both":
                 count = await delete_all_bugs()
                 result["db_deleted"] = count
-                await log_info(f"Удалены все баги: БД ({count}), Weeek ({weeek_deleted})")
+                await log_info(f"Удалены все баги: БД ({count}), Weeek ({len(deleted_ids)})")
             else:
+                # Одна запись в конце — и только для реально удалённых задач
+                cleared_keys = {task_to_bug[tid] for tid in deleted_ids}
+
                 def clear_weeek(data):
-                    for key in data.get("items", {}):
-                        data["items"][key]["weeek_task_id"] = None
-                        data["items"][key]["weeek_board_name"] = None
-                        data["items"][key]["weeek_column_name"] = None
+                    for key in cleared_keys:
+                        bug = data.get("items", {}).get(key)
+                        if bug:
+                            bug["weeek_task_id"] = None
+                            bug["weeek_board_name"] = None
+                            bug["weeek_column_name"] = None
                     return data
-                await async_update(BUGS_FILE, clear_weeek)
-                await log_info(f"Удалены все баги из Weeek ({weeek_deleted})")
+                if cleared_keys:
+                    await async_update(BUGS_FILE, clear_weeek)
+                await log_info(f"Удалены все баги из Weeek ({len(deleted_ids)}, ошибок {len(failed)})")
             return result
 
     if not bug_id:
@@ -1444,12 +1971,21 @@ async def _delete_bug(bug_id: int = None, target: str = "both",
         else:
             from services.weeek_service import delete_task as weeek_delete
             weeek_result = await weeek_delete(weeek_task_id)
-            if weeek_result.get("success"):
+            if weeek_result.get("success") or weeek_result.get("status_code") == 404:
                 result["weeek"] = "удалён из Weeek"
                 if target == "weeek_only":
                     await clear_weeek_task_id(bug_id)
             else:
-                result["weeek"] = f"ошибка Weeek: {weeek_result.get('error', '?')}"
+                # Повторит outbox-воркер; для both баг уже удалён из БД — ссылку не чистим
+                from services import weeek_outbox
+                await weeek_outbox.enqueue(
+                    "delete", bug_id if target == "weeek_only" else None,
+                    {"task_id": str(weeek_task_id)},
+                )
+                result["weeek"] = (
+                    f"Weeek не ответил ({weeek_result.get('error', '?')}), "
+                    f"удаление поставлено в очередь"
+                )
 
     if target in ("db_only", "both"):
         deleted = await delete_bug(bug_id)
@@ -1537,43 +2073,13 @@ async def _switch_mode(mode: str) -> dict:
 # ║                   ГЛАВНЫЕ ФУНКЦИИ                                ║
 # ╚══════════════════════════════════════════════════════════════════╝
 
-_RE_STATS = re.compile(r"^(?:стат(?:истика|а)?|статы?)\s+@?(\w+)$", re.IGNORECASE)
-_RE_RATING = re.compile(r"^(?:рейтинг|топ|таблица|лидеры)$", re.IGNORECASE)
-
-
-async def try_direct_command(text: str, caller_id: int) -> str | None:
+async def try_direct_command(text: str, caller_id: int, role: str | None = None) -> str | None:
     """
-    Пробует выполнить команду напрямую без Claude API.
+    Пробует выполнить команду напрямую без Claude API (грамматика — agent/intents.py).
     Возвращает ответ или None если команда не распознана.
     """
-    clean = text.strip()
-
-    # --- Рейтинг ---
-    if _RE_RATING.match(clean):
-        print(f"[DIRECT] Совпадение: рейтинг")
-        from services.rating_service import format_rating_message
-        data = await get_rating()
-        return format_rating_message(data)
-
-    # --- Статистика конкретного тестера ---
-    m = _RE_STATS.match(clean)
-    if m:
-        print(f"[DIRECT] Совпадение: статистика @{m.group(1)}")
-        result_json = await execute_tool("get_tester_stats", json.dumps({"username": m.group(1)}), caller_id)
-        result = json.loads(result_json)
-        if result.get("error"):
-            return f"⚠️ {result['error']}"
-        t = result
-        uname = t['username'] if t.get("username") else t.get("full_name", "?")
-        return (
-            f"📊 <b>Статистика {uname}</b>\n\n"
-            f"⭐ Баллы: <b>{t['total_points']}</b>\n"
-            f"📝 Баги: {t['total_bugs']}\n"
-            f"🎮 Игры: {t['total_games']}\n"
-            f"⚠️ Предупреждения: {t['warnings_count']}/3"
-        )
-
-    return None
+    from agent.intents import try_direct
+    return await try_direct(text, caller_id, role)
 
 
 def _serialize_content(content) -> list[dict]:
@@ -1592,218 +2098,454 @@ def _serialize_content(content) -> list[dict]:
     return result
 
 
+async def _execute_tool_blocks(blocks: list, caller_id: int = None, topic: str = "") -> list[str]:
+    """
+    Выполняет tool_use-блоки одного раунда параллельно.
+
+    Вызов ждёт только предыдущие конфликтующие с ним (_TOOL_ACCESS) —
+    например, два award_points одному тестеру идут по очереди, а статистика
+    двух разных тестеров — одновременно. Результаты — в порядке блоков.
+    """
+    access = [_tool_access(b.name, b.input) for b in blocks]
+    tasks: list[asyncio.Task] = []
+
+    async def run(block, deps: list[asyncio.Task], mutates: bool) -> str:
+        if deps:
+            await asyncio.gather(*deps, return_exceptions=True)
+        func_args = json.dumps(block.input, ensure_ascii=False)
+        print(f"[TOOL] Вызов: {block.name}({func_args[:100]})")
+        tool_started = time.monotonic()
+        call = execute_tool(block.name, func_args, caller_id, topic)
+        # Изменение данных при отмене (дедлайн) доводим до конца — не бросаем на полпути
+        result = await (asyncio.shield(call) if mutates else call)
+        accounting.add_tool(block.name, (time.monotonic() - tool_started) * 1000)
+        print(f"[TOOL] {block.name} → {result[:150]}")
+        return result
+
+    started = time.monotonic()
+    for i, block in enumerate(blocks):
+        deps = [tasks[j] for j in range(i) if _tools_conflict(access[i], access[j])]
+        tasks.append(asyncio.create_task(run(block, deps, access[i][0])))
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    elapsed = (time.monotonic() - started) * 1000
+    metrics.observe("tools.round_ms", elapsed)
+    accounting.add_tools_round(elapsed)
+    if len(blocks) > 1:
+        print(f"[TOOL] Раунд: {len(blocks)} вызовов за {elapsed:.0f} мс")
+    return list(results)
+
+
+def _formatted_message(result_json: str) -> str | None:
+    """Готовое сообщение пользователю из результата инструмента (если есть)."""
+    try:
+        data = json.loads(result_json)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return data.get("formatted_message") if isinstance(data, dict) else None
+
+
+async def _remember(history_key: int, max_msgs: int):
+    """Завершает ход диалога: сохраняет память и при переполнении сворачивает старое в резюме."""
+    await memory.save(history_key)
+    memory.maybe_compact(history_key, max_msgs)
+
+
+# === Склейка одинаковых запросов (single-flight) ===
+# Одинаковый read-only запрос (область + нормализованный текст + версия данных),
+# пока первый такой ещё считается, получает его ответ вместо своего вызова Claude.
+# Область прямой команды — уровень роли (и caller, если ответ от него зависит),
+# запроса к агенту — роль, чат и caller: ответ считается с историей этого чата
+# и для того, кто спросил («моя статистика» в группе у каждого своя).
+_COALESCE_GROUPS = {"analytics"}
+_PUBLISH_WORDS = ("опубликуй", "запости", "отправь")
+_COALESCE_DATA_FILES = (TESTERS_FILE, BUGS_FILE, POINTS_LOG_FILE, WARNINGS_FILE,
+                        LOGIN_MAPPING_FILE, ADMINS_FILE)
+_ROLE_TIERS = {"owner": "staff", "admin": "staff"}
+
+
+def _data_versions() -> tuple:
+    return tuple(get_version(f) for f in _COALESCE_DATA_FILES)
+
+
+def _coalesce_key(kind: str, scope: tuple, text: str) -> tuple:
+    from agent.intents import normalize
+    clean = re.sub(r"\s+", " ", normalize(text).lower())
+    return kind, scope, clean, _data_versions()
+
+
+async def _direct_scope(text: str, role: str, caller_id: int) -> tuple:
+    """Область склейки прямой команды: «стата xyz» без такого тестера — статистика caller."""
+    from agent.intents import match
+    found = await match(text, role)
+    caller = caller_id if found and found[0]["tool"] in _CALLER_SCOPED_TOOLS else None
+    return _ROLE_TIERS.get(role, role), caller
+
+
+def _is_read_only_request(text: str) -> bool:
+    """Только чтение: все угаданные группы инструментов — аналитика, без публикации."""
+    groups = classify_tool_groups(text)
+    lowered = text.lower()
+    return bool(groups) and set(groups) <= _COALESCE_GROUPS and not any(w in lowered for w in _PUBLISH_WORDS)
+
+
+def _history_entry(text: str, username: str, role: str, chat_id: int = None) -> tuple[str, int]:
+    """(текст для истории, лимит реплик): в группе — с @username и общим лимитом чата."""
+    from config import MAX_GROUP_HISTORY
+    if chat_id:
+        return f"@{username}: {text}", MAX_GROUP_HISTORY
+    return text, MAX_HISTORY.get(role, 3) * 2
+
+
 async def process_message(text: str, username: str, role: str, topic: str,
-                          caller_id: int = None, chat_id: int = None) -> str:
+                          caller_id: int = None, chat_id: int = None, on_text=None) -> str:
     """Главная функция мозга агента.
     chat_id — ID чата. Для групп: общая история на весь чат.
-    Для ЛС: None, используется caller_id как ключ."""
-    from config import MAX_GROUP_HISTORY
+    Для ЛС: None, используется caller_id как ключ.
+    on_text — потоковый вывод (utils.stream_reply): текст ответа по мере генерации,
+    on_text(None) — начался tool-раунд, показанный текст раунда не ответ.
+
+    Весь запрос укладывается в REQUEST_DEADLINE (utils/deadline.py): по истечении
+    работа отменяется, а ответом идёт частичный результат или заглушка."""
+    streamed: list[str] = []
 
+    async def _track(delta: str | None):
+        if delta is None:
+            streamed.clear()
+        else:
+            streamed.append(delta)
+        deadline.note_draft("".join(streamed))
+        await on_text(delta)
+
+    track = _track if on_text else None
+
+    async with deadline.scope(REQUEST_DEADLINE) as state:
+        return await _process_message(text, username, role, topic, caller_id, chat_id, track)
+    return deadline.fallback_reply(state)
+
+
+async def _process_message(text: str, username: str, role: str, topic: str,
+                           caller_id: int = None, chat_id: int = None, on_text=None) -> str:
     # 1. Мгновенный ответ без API
     instant = get_instant_reply(text)
     if instant:
         print(f"[CLAUDE] Мгновенный ответ: \"{text.strip()[:50]}\"")
         return instant
 
-    # 2. Прямые команды без Claude (рейтинг, статистика @username)
-    direct = await try_direct_command(text, caller_id)
+    # 2. Прямые команды без Claude (рейтинг, статистика, баги, неактивные…)
+    direct, shared = await singleflight.do(
+        _coalesce_key("direct", await _direct_scope(text, role, caller_id), text),
+        lambda: try_direct_command(text, caller_id, role),
+    )
     if direct:
-        print(f"[CLAUDE] Прямая команда без API: \"{text.strip()[:50]}\"")
+        print(f"[CLAUDE] Прямая команда без API{' (общий ответ)' if shared else ''}: \"{text.strip()[:50]}\"")
         return direct
 
-    context = {"username": username, "role": role, "topic": topic}
-    system_prompt = get_system_prompt(context)
+    # 3. Read-only запрос: похожий уже отвечен на тех же данных — берём ответ,
+    # одинаковые одновременные считаются один раз
+    history_key = chat_id if chat_id else caller_id
+    if not _is_read_only_request(text):
+        return await _run_agent(text, username, role, topic, caller_id, chat_id, on_text)
+
+    # Ответ считается с историей этого чата и правами этой роли — в другом чате не отдаём.
+    # И для того, кто спросил: «моя статистика» в группе у каждого своя
+    scope = (role, history_key, caller_id)
+    versions = _data_versions()
+    cached = answer_cache.get(scope, text, versions)
+    if cached:
+        await _remember_exchange(text, username, role, chat_id, history_key, cached)
+        return cached
+
+    reply, shared = await singleflight.do(
+        _coalesce_key("agent", scope, text),
+        lambda: _run_agent(text, username, role, topic, caller_id, chat_id, on_text),
+    )
+    if shared:
+        print(f"[CLAUDE] Общий ответ с одинаковым запросом: \"{text.strip()[:50]}\"")
+    elif _is_cacheable_reply(reply):
+        answer_cache.put(scope, text, versions, reply)
+    return reply
+
+
+async def _remember_exchange(text: str, username: str, role: str, chat_id: int,
+                             history_key: int, reply: str):
+    """Вопрос и готовый ответ (не из своего хода агента) — в историю чата."""
+    user_text, max_msgs = _history_entry(text, username, role, chat_id)
+    async with chat_queue.turn(history_key):
+        history = await memory.get(history_key)
+        memory.append(history, "user", user_text)
+        memory.append(history, "assistant", reply)
+        await _remember(history_key, max_msgs)
+
+
+def _is_cacheable_reply(reply: str | None) -> bool:
+    """Настоящий ответ агента, а не ошибка, «занят» или ответ по дедлайну."""
+    return bool(reply) and not reply.startswith(("⚠️", "⏳")) and "⏱" not in reply
+
+
+_CHAT_BUSY_REPLY = "⏳ Разбираю предыдущие сообщения, повтори чуть позже."
+
+
+async def _run_agent(text: str, username: str, role: str, topic: str,
+                     caller_id: int = None, chat_id: int = None, on_text=None) -> str:
+    """Ход диалога с Claude — по очереди внутри чата (agent/chat_queue.py)."""
+    if await budget.blocked(role):
+        return budget.LIMIT_REPLY
+    history_key = chat_id if chat_id else caller_id
+    if not chat_queue.admit(history_key):
+        return _CHAT_BUSY_REPLY
+    async with chat_queue.turn(history_key):
+        return await _agent_turn(text, username, role, topic, caller_id, chat_id, on_text)
 
-    model = MODEL
 
+async def _agent_turn(text: str, username: str, role: str, topic: str,
+                      caller_id: int = None, chat_id: int = None, on_text=None) -> str:
+    """Диалог с Claude: история, инструменты, раунды."""
     # 4. Получаем историю: для групп — общая по chat_id, для ЛС — по caller_id
     history_key = chat_id if chat_id else caller_id
-    history = _get_history(history_key)
+    history = await memory.get(history_key)
 
-    # В групповом чате добавляем username к сообщению для контекста
-    if chat_id:
-        user_text = f"@{username}: {text}"
-        max_msgs = MAX_GROUP_HISTORY
-    else:
-        user_text = text
-        max_msgs = MAX_HISTORY.get(role, 3) * 2
+    context = {"username": username, "role": role, "topic": topic}
+    system_prompt = get_system_prompt(context) + memory.summary_block(history)
 
-    history.append({"role": "user", "content": user_text})
-    _trim_history(history, max_msgs)
+    # Бюджет дня на исходе — короче ответы и история, дешёвая модель (agent/budget.py)
+    limits = await budget.policy(role)
 
-    messages = [msg.copy() for msg in history]
+    # В групповом чате добавляем username к сообщению для контекста
+    user_text, max_msgs = _history_entry(text, username, role, chat_id)
+    memory.append(history, "user", user_text)
+    messages = memory.build_messages(history, int(MEMORY_TOKEN_BUDGET * limits["history_factor"]))
 
-    # 5. Инструменты по роли
-    tools = get_tools_for_role(role)
+    # 5. Инструменты по роли и намерению; упомянутых тестеров грузим, пока думает Claude
+    tools = select_tools(role, text)
+    prefetch = (asyncio.create_task(_prefetch_mentions(text, caller_id, {t["name"] for t in tools}))
+                if tools else None)
 
     try:
-        kwargs = {
-            "model": model,
-            "system": system_prompt,
-            "messages": messages,
-            "max_tokens": MAX_TOKENS,
-        }
-        if tools:
-            kwargs["tools"] = tools
-            kwargs["tool_choice"] = {"type": "auto"}
-
-        print(f"[CLAUDE] Запрос: role={role}, tools={len(tools) if tools else 0}, model={model}")
-        response = await call_claude(**kwargs)
-        usage = response.usage
-        has_tools = any(b.type == "tool_use" for b in response.content)
-        print(f"[CLAUDE] Ответ: {'tool_use' if has_tools else 'text'} (in={usage.input_tokens}, out={usage.output_tokens})")
-
-        tool_use_blocks = [b for b in response.content if b.type == "tool_use"]
-
-        max_tool_rounds = MAX_TOOL_ROUNDS
-        round_num = 0
-        _SILENT_TOOLS = {"create_task"}
-        called_silent_tool = False
-        silent_tool_error = None
-
-        while tool_use_blocks and round_num < max_tool_rounds:
-            round_num += 1
-
-            content_dicts = _serialize_content(response.content)
-            messages.append({"role": "assistant", "content": content_dicts})
-
-            tool_results = []
-            for block in tool_use_blocks:
-                func_name = block.name
-                func_args = json.dumps(block.input, ensure_ascii=False)
-                print(f"[TOOL] Вызов: {func_name}({func_args[:100]})")
-
-                if func_name in _SILENT_TOOLS:
-                    called_silent_tool = True
-
-                result = await execute_tool(func_name, func_args, caller_id, topic)
-                print(f"[TOOL] {func_name} → {result[:150]}")
-
-                if func_name in _SILENT_TOOLS:
-                    try:
-                        result_data = json.loads(result)
-                        if isinstance(result_data, dict) and result_data.get("error"):
-                            silent_tool_error = result_data["error"]
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": block.id,
-                    "content": result,
-                })
-
-            messages.append({"role": "user", "content": tool_results})
-
-            cont_kwargs = {
-                "model": model,
-                "system": system_prompt,
-                "messages": messages,
-                "max_tokens": MAX_TOKENS,
-            }
-            if tools:
-                cont_kwargs["tools"] = tools
-                cont_kwargs["tool_choice"] = {"type": "auto"}
-            response = await call_claude(**cont_kwargs)
-            usage = response.usage
-            has_tools = any(b.type == "tool_use" for b in response.content)
-            print(f"[CLAUDE] Продолжение (раунд {round_num}): {'tool_use' if has_tools else 'text'} (in={usage.input_tokens}, out={usage.output_tokens})")
-            tool_use_blocks = [b for b in response.content if b.type == "tool_use"]
+        # 6. Модель по уровню; сбой или неуверенный ответ — повтор уровнем выше,
+        # если попытка ещё ничего не изменила в данных
+        tier = "fast" if limits["cheap_model"] else model_router.choose(role, text)
+        while True:
+            attempt = {"mutated": False}
+            started = time.monotonic()
+            try:
+                await _agent_attempt(model_router.model(tier), system_prompt, list(messages), tools,
+                                     role, caller_id, topic, on_text, attempt, prefetch,
+                                     max_tokens=limits["max_tokens"])
+            except Exception as e:
+                reason = model_router.failure_reason(e)
+                can_escalate = reason and not attempt["mutated"] and not limits["cheap_model"]
+                upper = model_router.next_tier(tier) if can_escalate else None
+                if upper is None:
+                    model_router.record(tier, started, "error")
+                    raise
+            else:
+                reason = model_router.low_confidence(attempt["response"], attempt["rounds_exhausted"])
+                can_escalate = reason and not attempt["mutated"] and not limits["cheap_model"]
+                upper = model_router.next_tier(tier) if can_escalate else None
+                if upper is None:
+                    model_router.record(tier, started, "ok")
+                    break
+            model_router.record(tier, started, "escalated", reason)
+            if on_text:
+                await on_text(None)
+            tier = upper
+
+        response = attempt["response"]
+        called_silent_tool = attempt["called_silent_tool"]
+        silent_tool_error = attempt["silent_tool_error"]
 
         # Если silent tool вернул ошибку — сообщить пользователю
         if called_silent_tool and silent_tool_error:
             error_reply = f"⚠️ {silent_tool_error}"
-            history.append({"role": "assistant", "content": error_reply})
-            _trim_history(history, max_msgs)
+            memory.append(history, "assistant", error_reply)
+            await _remember(history_key, max_msgs)
             return error_reply
 
         # Если silent tool отработал без ошибки — не дублируем ответ
         if called_silent_tool:
             text_blocks = [b for b in response.content if b.type == "text"]
             reply = text_blocks[0].text if text_blocks else ""
-            history.append({"role": "assistant", "content": reply or "Готово"})
-            _trim_history(history, max_msgs)
+            memory.append(history, "assistant", reply or "Готово")
+            await _remember(history_key, max_msgs)
             return None
 
         text_blocks = [b for b in response.content if b.type == "text"]
         reply = text_blocks[0].text if text_blocks else "Готово ✅"
 
-        history.append({"role": "assistant", "content": reply})
-        _trim_history(history, max_msgs)
+        memory.append(history, "assistant", reply)
+        await _remember(history_key, max_msgs)
 
         return reply
 
+    except asyncio.CancelledError:
+        # Дедлайн запроса: ответа в истории не будет — убираем и вопрос
+        memory.pop_last_user(history)
+        raise
     except anthropic.RateLimitError:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         print("[CLAUDE] RateLimitError — превышен лимит запросов")
         return "⚠️ Claude API: превышен лимит запросов. Подождите немного."
     except anthropic.AuthenticationError:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         print("[CLAUDE] AuthenticationError — неверный API ключ")
         return "⚠️ Ошибка авторизации Claude API. Проверьте ANTHROPIC_API_KEY в .env"
     except anthropic.APIStatusError as e:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         if e.status_code in (400, 402):
             print(f"[CLAUDE] Баланс исчерпан: {e.status_code}")
             return "⚠️ Бот временно недоступен. Свяжитесь с руководителем."
         print(f"[CLAUDE] APIStatusError {e.status_code}: {e.message}")
         return f"⚠️ Ошибка API: {str(e)[:200]}"
     except Exception as e:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         print(f"[CLAUDE] ERROR: {e}")
         return f"⚠️ Ошибка: {str(e)[:200]}"
+    finally:
+        if prefetch and not prefetch.done():
+            prefetch.cancel()
+
+
+# Не меняют данные, но пишут в группу — повтор попытки продублировал бы пост
+_PUBLISHING_TOOLS = {"publish_rating"}
+
+
+async def _agent_attempt(model: str, system_prompt, messages: list, tools: list, role: str,
+                         caller_id: int, topic: str, on_text, attempt: dict,
+                         prefetch: asyncio.Task = None, max_tokens: int = MAX_TOKENS):
+    """
+    Одна попытка агента на модели model: запрос и tool-раунды.
+    prefetch — упреждающая загрузка тестеров: инструменты ждут её, чтобы попасть в кэш.
+    Итог — в attempt: response, rounds_exhausted, called_silent_tool, silent_tool_error;
+    mutated ставится до вызова изменяющего инструмента (повтор такой попытки недопустим).
+    """
+    kwargs = {
+        "model": model,
+        "system": system_prompt,
+        "messages": messages,
+        "max_tokens": max_tokens,
+    }
+    if tools:
+        kwargs["tools"] = tools
+        kwargs["tool_choice"] = {"type": "auto"}
+
+    print(f"[CLAUDE] Запрос: role={role}, tools={len(tools) if tools else 0}, model={model}")
+    response = await call_claude(priority=llm_scheduler.priority(role), on_text=on_text, **kwargs)
+    has_tools = any(b.type == "tool_use" for b in response.content)
+    print(f"[CLAUDE] Ответ: {'tool_use' if has_tools else 'text'} ({_usage_str(response.usage)})")
+
+    tool_use_blocks = [b for b in response.content if b.type == "tool_use"]
+
+    max_tool_rounds = MAX_TOOL_ROUNDS
+    round_num = 0
+    _SILENT_TOOLS = {"create_task"}
+    attempt.update(called_silent_tool=False, silent_tool_error=None)
+
+    while tool_use_blocks and round_num < max_tool_rounds:
+        round_num += 1
+
+        content_dicts = _serialize_content(response.content)
+        messages.append({"role": "assistant", "content": content_dicts})
+        if on_text:
+            await on_text(None)
+
+        if any(_tool_access(b.name, b.input)[0] or b.name in _PUBLISHING_TOOLS for b in tool_use_blocks):
+            attempt["mutated"] = True
+            deadline.note_mutation()
+
+        if prefetch and not prefetch.done():
+            await asyncio.wait([prefetch])
+
+        tool_results = []
+        results = await _execute_tool_blocks(tool_use_blocks, caller_id, topic)
+        for block, result in zip(tool_use_blocks, results):
+            func_name = block.name
+            if func_name in _SILENT_TOOLS:
+                attempt["called_silent_tool"] = True
+                try:
+                    result_data = json.loads(result)
+                    if isinstance(result_data, dict) and result_data.get("error"):
+                        attempt["silent_tool_error"] = result_data["error"]
+                except (json.JSONDecodeError, TypeError):
+                    pass
+
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": project_tool_result(func_name, result),
+            })
+            deadline.note_partial(_formatted_message(result))
+
+        messages.append({"role": "user", "content": tool_results})
+
+        # Продолжение раунда — вперёд новых диалогов в очереди планировщика
+        response = await call_claude(priority=llm_scheduler.priority(role, continuation=True),
+                                     on_text=on_text, **kwargs)
+        has_tools = any(b.type == "tool_use" for b in response.content)
+        print(f"[CLAUDE] Продолжение (раунд {round_num}): {'tool_use' if has_tools else 'text'} ({_usage_str(response.usage)})")
+        tool_use_blocks = [b for b in response.content if b.type == "tool_use"]
+
+    attempt["response"] = response
+    attempt["rounds_exhausted"] = bool(tool_use_blocks)
 
 
 async def process_chat_message(text: str, caller_id: int) -> str:
     """Свободный чат без инструментов — просто болтовня."""
+    if await budget.blocked("chat"):
+        return budget.LIMIT_REPLY
+    if not chat_queue.admit(caller_id):
+        return _CHAT_BUSY_REPLY
+    async with chat_queue.turn(caller_id):
+        return await _chat_turn(text, caller_id)
+
+
+async def _chat_turn(text: str, caller_id: int) -> str:
     from config import CHAT_MODEL
 
     system_prompt = get_chat_prompt()
+    limits = await budget.policy("chat")
+    model = model_router.model("fast") if limits["cheap_model"] else CHAT_MODEL
 
-    history = _get_history(caller_id)
-    history.append({"role": "user", "content": text})
-    _trim_history(history, 10)
-
-    messages = [msg.copy() for msg in history]
+    history = await memory.get(caller_id)
+    memory.append(history, "user", text)
+    messages = memory.build_messages(history, int(MEMORY_TOKEN_BUDGET * limits["history_factor"]))
 
     try:
-        print(f"[CLAUDE] Chat запрос от user_id={caller_id}, model={CHAT_MODEL}")
+        print(f"[CLAUDE] Chat запрос от user_id={caller_id}, model={model}")
         response = await call_claude(
-            model=CHAT_MODEL,
-            system=system_prompt,
+            priority=llm_scheduler.priority("chat"),
+            model=model,
+            system=[{"type": "text", "text": system_prompt}] + memory.summary_block(history),
             messages=messages,
-            max_tokens=MAX_TOKENS,
+            max_tokens=limits["max_tokens"],
         )
-        usage = response.usage
-        print(f"[CLAUDE] Chat ответ (in={usage.input_tokens}, out={usage.output_tokens})")
+        print(f"[CLAUDE] Chat ответ ({_usage_str(response.usage)})")
 
         text_blocks = [b for b in response.content if b.type == "text"]
         reply = text_blocks[0].text if text_blocks else "чё"
 
-        history.append({"role": "assistant", "content": reply})
-        _trim_history(history, 10)
+        memory.append(history, "assistant", reply)
+        await _remember(caller_id, 10)
 
         return reply
 
     except anthropic.RateLimitError:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         print("[CLAUDE] Chat: RateLimitError")
         return "⚠️ Claude API: превышен лимит запросов. Подождите немного."
     except anthropic.APIStatusError as e:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         if e.status_code in (400, 402):
             print(f"[CLAUDE] Chat: баланс исчерпан: {e.status_code}")
             return "⚠️ Бот временно недоступен. Свяжитесь с руководителем."
         print(f"[CLAUDE] Chat: APIStatusError {e.status_code}: {e.message}")
         return f"⚠️ Ошибка API: {str(e)[:200]}"
     except Exception as e:
-        if history and history[-1].get("role") == "user":
-            history.pop()
+        memory.pop_last_user(history)
         print(f"[CLAUDE] Chat ERROR: {e}")
         return f"⚠️ Ошибка: {str(e)[:200]}"
@@ -0,0 +1,189 @@
+"""
+Дневной бюджет на Claude: общий и по ролям, по фактическому расходу.
+
+Каждый успешный вызов Claude (call_claude → accounting.add_llm) добавляет
+свою оценку стоимости к расходу дня — общему и роли запроса. По доле
+израсходованного поведение ужесточается ступенями:
+
+    50%  — ответы короче (max_tokens вдвое)
+    70%  — + история вдвое короче
+    85%  — + самая дешёвая модель, без эскалации
+    100% — только прямые команды и мгновенные ответы, Claude не вызывается
+
+Доля — большая из общей (LLM_DAILY_BUDGET) и роли (LLM_ROLE_BUDGETS, если задан).
+Руководителя последняя ступень не блокирует — он должен иметь возможность
+работать. О каждой ступени руководитель получает сообщение (раз в день).
+Расход переживает рестарт: data/budget.json, сброс в полночь. Запись файла
+и сообщения руководителю — в фоне, запрос пользователя их не ждёт.
+
+Метрики: gauge budget.spent_usd, budget.level; budget.blocked.
+"""
+import asyncio
+from datetime import date
+
+from config import LLM_DAILY_BUDGET, LLM_ROLE_BUDGETS, MAX_TOKENS, OWNER_TELEGRAM_ID
+from json_store import async_load, async_update, BUDGET_FILE
+from utils import metrics
+from utils.logger import get_bot, log_admin
+
+# (доля бюджета, ступень)
+_THRESHOLDS = ((1.0, 4), (0.85, 3), (0.7, 2), (0.5, 1))
+_LEVEL_NAMES = {
+    1: "короткие ответы",
+    2: "короткая история",
+    3: "дешёвая модель",
+    4: "только прямые команды",
+}
+_MIN_MAX_TOKENS = 512
+
+LIMIT_REPLY = (
+    "💸 Дневной лимит запросов к ИИ исчерпан — до завтра работают прямые команды: "
+    "<b>рейтинг</b>, <b>статистика @username</b>, <b>принятые баги</b>, <b>кто неактивен</b>."
+)
+
+_state = {"day": None, "spent": {}, "notified": []}
+_loaded = False
+_load_lock = asyncio.Lock()
+_dirty = False
+_persist_task: asyncio.Task | None = None
+
+
+async def _ensure_today():
+    global _loaded
+    if not _loaded:
+        async with _load_lock:
+            if not _loaded:
+                data = await async_load(BUDGET_FILE)
+                _state.update(day=data.get("day"), spent=data.get("spent", {}),
+                              notified=data.get("notified", []))
+                _loaded = True
+    today = date.today().isoformat()
+    if _state["day"] != today:
+        _state.update(day=today, spent={}, notified=[])
+
+
+def _level(fraction: float) -> int:
+    for threshold, level in _THRESHOLDS:
+        if fraction >= threshold:
+            return level
+    return 0
+
+
+def _fractions(role: str) -> tuple[float, float]:
+    """(доля общего бюджета, доля бюджета роли); 0 — лимит не задан."""
+    total = sum(_state["spent"].values())
+    total_fraction = total / LLM_DAILY_BUDGET if LLM_DAILY_BUDGET > 0 else 0.0
+    cap = LLM_ROLE_BUDGETS.get(role, 0)
+    role_fraction = _state["spent"].get(role, 0.0) / cap if cap > 0 else 0.0
+    return total_fraction, role_fraction
+
+
+async def policy(role: str) -> dict:
+    """Ограничения для запроса роли по текущему расходу."""
+    await _ensure_today()
+    level = _level(max(_fractions(role)))
+    if role == "owner":
+        level = min(level, 3)
+    return {
+        "level": level,
+        "max_tokens": max(_MIN_MAX_TOKENS, MAX_TOKENS // 2) if level >= 1 else MAX_TOKENS,
+        "history_factor": 0.5 if level >= 2 else 1.0,
+        "cheap_model": level >= 3,
+        "direct_only": level >= 4,
+    }
+
+
+async def blocked(role: str) -> bool:
+    """Claude для роли сегодня недоступен (последняя ступень)."""
+    if (await policy(role))["direct_only"]:
+        metrics.inc("budget.blocked")
+        return True
+    return False
+
+
+async def add(role: str, cost: float):
+    """Расход одного вызова Claude; при переходе ступени — сообщение руководителю."""
+    if cost <= 0:
+        return
+    await _ensure_today()
+    _state["spent"][role] = _state["spent"].get(role, 0.0) + cost
+    total_fraction, role_fraction = _fractions(role)
+    metrics.set_gauge("budget.spent_usd", round(sum(_state["spent"].values()), 4))
+    metrics.set_gauge("budget.level", _level(total_fraction))
+
+    alerts = []
+    for scope, fraction in (("total", total_fraction), (role, role_fraction)):
+        level = _level(fraction)
+        key = f"{scope}:{level}"
+        if level and key not in _state["notified"]:
+            _state["notified"].append(key)
+            alerts.append((scope, level, fraction))
+
+    _schedule_persist()
+    for scope, level, fraction in alerts:
+        asyncio.create_task(_notify_owner(scope, level, fraction))
+
+
+def _schedule_persist():
+    """Сохранение в фоне; пока идёт запись, новые расходы попадут в следующую."""
+    global _dirty, _persist_task
+    _dirty = True
+    if _persist_task is None or _persist_task.done():
+        _persist_task = asyncio.create_task(_persist())
+
+
+async def _persist():
+    global _dirty
+    while _dirty:
+        _dirty = False
+        snapshot = {"day": _state["day"], "spent": dict(_state["spent"]), "notified": list(_state["notified"])}
+        try:
+            await async_update(BUDGET_FILE, lambda data: snapshot)
+        except Exception as e:
+            print(f"[BUDGET] Не удалось сохранить расход: {e}")
+
+
+def _spent_line(scope: str) -> str:
+    if scope == "total":
+        spent = sum(_state["spent"].values())
+        return f"${spent:.2f} из ${LLM_DAILY_BUDGET:.2f}"
+    return f"роль {scope}: ${_state['spent'].get(scope, 0.0):.2f} из ${LLM_ROLE_BUDGETS[scope]:.2f}"
+
+
+def _enabled(level: int) -> str:
+    return ", ".join(_LEVEL_NAMES[lvl] for lvl in range(1, level + 1))
+
+
+async def _notify_owner(scope: str, level: int, fraction: float):
+    """Фоновая задача из add(): ошибки только в лог."""
+    text = (f"💸 <b>Бюджет Claude на сегодня</b>: {_spent_line(scope)} ({fraction:.0%}).\n"
+            f"Включено: {_enabled(level)}.")
+    print(f"[BUDGET] {scope}: ступень {level} ({fraction:.0%})")
+    bot = get_bot()
+    if bot and OWNER_TELEGRAM_ID:
+        try:
+            await bot.send_message(OWNER_TELEGRAM_ID, text, parse_mode="HTML")
+        except Exception as e:
+            print(f"[BUDGET] Не удалось уведомить руководителя: {e}")
+    try:
+        await log_admin(f"Бюджет Claude: {_spent_line(scope)} ({fraction:.0%}) — {_enabled(level)}")
+    except Exception as e:
+        print(f"[BUDGET] log_admin ERROR: {e}")
+
+
+async def format_status() -> str:
+    """Строки для отчёта «расходы»: расход дня и текущая ступень."""
+    await _ensure_today()
+    if LLM_DAILY_BUDGET <= 0 and not any(v > 0 for v in LLM_ROLE_BUDGETS.values()):
+        return "💸 Дневной бюджет: без лимита"
+    lines = []
+    if LLM_DAILY_BUDGET > 0:
+        fraction = _fractions("total")[0]
+        level = _level(fraction)
+        lines.append(f"💸 Бюджет дня: {_spent_line('total')} ({fraction:.0%})"
+                     + (f" — {_enabled(level)}" if level else ""))
+    for role, cap in LLM_ROLE_BUDGETS.items():
+        if cap > 0:
+            fraction = _fractions(role)[1]
+            lines.append(f"   {_spent_line(role)} ({fraction:.0%})")
+    return "\n".join(lines)
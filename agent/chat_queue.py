@@ -0,0 +1,59 @@
+"""
+Очередь ходов диалога на чат: внутри одного чата — строго по порядку,
+разные чаты — параллельно.
+
+Групповой чат делит одну историю; без очереди два одновременных сообщения
+перемешивают реплики и раунды Claude. Здесь ход (история → Claude →
+инструменты → ответ в историю) одного чата ждёт завершения предыдущего.
+
+Очередь ограничена CHAT_QUEUE_LIMIT ожидающими: сверх — admit() возвращает
+False, и вызывающий сразу отвечает «занят» (load shedding) вместо того,
+чтобы копить задержку.
+
+Метрики: chat_queue.wait_ms, chat_queue.shed, gauge chat_queue.waiting.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from config import CHAT_QUEUE_LIMIT
+from utils import metrics
+
+# key (chat_id или caller_id) → {"lock": asyncio.Lock, "users": сколько держат или ждут}
+_chats: dict[int, dict] = {}
+
+
+def _waiting_total() -> int:
+    return sum(max(0, q["users"] - 1) for q in _chats.values())
+
+
+def admit(key: int) -> bool:
+    """Можно ли встать в очередь чата (False — очередь полна, запрос сбрасываем)."""
+    queue = _chats.get(key)
+    if queue is None or queue["users"] - 1 < CHAT_QUEUE_LIMIT:
+        return True
+    metrics.inc("chat_queue.shed")
+    print(f"[CHAT-QUEUE] Чат {key}: очередь полна ({queue['users'] - 1}), запрос сброшен")
+    return False
+
+
+@asynccontextmanager
+async def turn(key: int):
+    """Ход диалога в чате key: ждёт предыдущие (FIFO), потом выполняется один."""
+    queue = _chats.get(key)
+    if queue is None:
+        queue = {"lock": asyncio.Lock(), "users": 0}
+        _chats[key] = queue
+    queue["users"] += 1
+    metrics.set_gauge("chat_queue.waiting", _waiting_total())
+    started = time.monotonic()
+    try:
+        async with queue["lock"]:
+            metrics.observe("chat_queue.wait_ms", (time.monotonic() - started) * 1000)
+            metrics.set_gauge("chat_queue.waiting", _waiting_total())
+            yield
+    finally:
+        queue["users"] -= 1
+        if queue["users"] == 0 and _chats.get(key) is queue:
+            del _chats[key]
+        metrics.set_gauge("chat_queue.waiting", _waiting_total())
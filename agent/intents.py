@@ -0,0 +1,310 @@
+"""
+Грамматика прямых команд: шаблон → инструмент + аргументы, без Claude API.
+
+Частые формулировки админов («баги от @x», «баг #12», «кто неактивен 7 дней»,
+«список тестеров», «статистика за неделю») разбираются регулярками и
+выполняются через execute_tool — с теми же правами и кэшем, что у агента.
+
+Правило: {"name", "pattern", "tool", "args"?, "roles"?}
+- pattern — регулярка на всё сообщение (без учёта регистра, ^…$ добавляются сами);
+- именованные группы становятся аргументами инструмента: числа приводятся
+  по схеме инструмента, period/status переводятся из русских слов, @ убирается;
+- args — константы (значения по умолчанию для необязательных групп);
+- roles — кому доступно правило (по умолчанию всем). Кроме того, правило
+  срабатывает только для роли, у которой инструмент есть в наборе агента
+  (get_tools_for_role): execute_tool проверяет лишь админские инструменты.
+
+Свои правила — в data/intents.json: {"intents": [правило, ...]}. Они проверяются
+раньше встроенных, инструмент должен иметь форматтер (_FORMATTERS).
+Файл читается при первом сообщении после старта.
+
+Метрики: intents.checked, intents.hit, intents.hit.<name>, gauge intents.hit_rate.
+"""
+import html
+import json
+import re
+
+from json_store import async_load, INTENTS_FILE
+from utils import metrics
+
+_WORD_VALUES = {
+    "period": {
+        "сегодня": "today", "день": "today", "today": "today",
+        "неделю": "week", "неделя": "week", "week": "week",
+        "месяц": "month", "month": "month",
+        "всё время": "all", "все время": "all", "all": "all",
+    },
+    "status": {
+        "принятые": "accepted", "отклонённые": "rejected", "отклоненные": "rejected",
+        "дубли": "duplicate", "ожидающие": "pending", "новые": "pending",
+        "все": "all",
+    },
+}
+
+_PERIOD = r"(?:за\s+)?(?P<period>сегодня|день|неделю|месяц|вс[её]\s+время)"
+
+# Порядок важен: «статистика команды» не должна стать статистикой тестера «команды»
+DEFAULT_INTENTS = [
+    {"name": "rating", "tool": "get_rating",
+     "pattern": r"(?:покажи\s+)?(?:рейтинг|топ|таблица|лидеры)"},
+    {"name": "bug_stats", "tool": "get_bug_stats", "roles": ["owner", "admin"], "args": {"period": "all"},
+     "pattern": rf"(?:статистика|стата)\s+(?:по\s+)?багов?(?:\s+{_PERIOD})?"},
+    {"name": "team_stats", "tool": "get_team_stats", "roles": ["owner", "admin"], "args": {"period": "all"},
+     "pattern": rf"(?:общая\s+)?(?:статистика|стата)(?:\s+команды)?(?:\s+{_PERIOD})?"},
+    {"name": "tester_stats", "tool": "get_tester_stats",
+     "pattern": r"(?:стат(?:истика|а)?|статы?)\s+@?(?P<username>\w+)"},
+    {"name": "bug_by_id", "tool": "search_bugs", "roles": ["owner", "admin"],
+     "pattern": r"(?:покажи\s+)?баг\s*#?(?P<display_number>\d+)"},
+    {"name": "bugs_by_tester", "tool": "search_bugs", "roles": ["owner", "admin"],
+     "pattern": r"(?:покажи\s+)?баги\s+(?:от\s+|у\s+)?@(?P<tester>\w+)"},
+    {"name": "bugs_by_status", "tool": "search_bugs", "roles": ["owner", "admin"],
+     "pattern": r"(?:покажи\s+)?(?P<status>принятые|отклон[её]нные|дубли|ожидающие|новые)\s+баги"},
+    {"name": "inactive", "tool": "get_inactive_testers", "roles": ["owner", "admin"],
+     "args": {"days": 7},
+     "pattern": r"кто\s+(?:неактивен|не\s+активен|не\s+работал|афк)(?:\s+(?P<days>\d+)\s+(?:дн\w*|день))?"},
+    {"name": "testers_list", "tool": "get_testers_list", "roles": ["owner", "admin"],
+     "pattern": r"(?:покажи\s+)?список\s+тестеров"},
+]
+
+# Упоминание бота в начале («@umbrella_bot рейтинг»): username бота всегда кончается на bot
+_RE_BOT_MENTION = re.compile(r"^@\w*bot\b[\s,:]*", re.IGNORECASE)
+_RE_TRAILING = re.compile(r"[\s!?.,)]+$")
+
+_compiled: list[tuple[dict, re.Pattern]] | None = None
+
+
+# ─────────────────────────────────────────────
+#  Форматирование результатов
+# ─────────────────────────────────────────────
+
+_PERIOD_LABELS = {"today": "сегодня", "week": "за неделю", "month": "за месяц", "all": "за всё время"}
+_STATUS_LABELS = {
+    "pending": "⏳ на рассмотрении", "accepted": "✅ принят",
+    "rejected": "❌ отклонён", "duplicate": "🔁 дубль",
+}
+_MAX_LIST = 30
+
+
+def _fmt_rating(result: dict, args: dict) -> str:
+    from services.rating_service import format_rating_message
+    return result.get("formatted_message") or format_rating_message(result)
+
+
+def _fmt_tester_stats(t: dict, args: dict) -> str:
+    uname = t['username'] if t.get("username") else t.get("full_name", "?")
+    return (
+        f"📊 <b>Статистика {uname}</b>\n\n"
+        f"⭐ Баллы: <b>{t['total_points']}</b>\n"
+        f"📝 Баги: {t['total_bugs']}\n"
+        f"🎮 Игры: {t['total_games']}\n"
+        f"⚠️ Предупреждения: {t['warnings_count']}/3"
+    )
+
+
+def _fmt_bug_stats(r: dict, args: dict) -> str:
+    return (
+        f"🐞 <b>Баги {_PERIOD_LABELS.get(args.get('period'), '')}</b>\n\n"
+        f"Всего: <b>{r['total']}</b>\n"
+        f"✅ Принято: {r['accepted']}\n"
+        f"🔁 Дублей: {r['duplicates']}"
+    )
+
+
+def _fmt_team_stats(r: dict, args: dict) -> str:
+    bugs = r.get("bugs_stats") or {}
+    lines = [
+        f"📊 <b>Команда {_PERIOD_LABELS.get(r.get('period'), '')}</b>\n",
+        f"👥 Тестеров: {r['total_testers']}",
+        f"⭐ Баллов: <b>{r['total_points']}</b> (в среднем {r['average_points']})",
+        f"🎮 Игр: {r['total_games']}",
+        f"🐞 Багов: {bugs.get('total', 0)}, принято {bugs.get('accepted', 0)}",
+    ]
+    if r.get("top_3"):
+        lines.append("\n🏆 <b>Топ-3:</b>")
+        lines.extend(
+            f"{i}. {t['username']} — {t['points']} б., багов {t['bugs']}, игр {t['games']}"
+            for i, t in enumerate(r["top_3"], 1)
+        )
+    return "\n".join(lines)
+
+
+def _fmt_bugs(r: dict, args: dict) -> str:
+    bugs = r.get("bugs") or []
+    if not bugs:
+        return "🔍 Баги не найдены."
+    if args.get("display_number") or args.get("bug_id"):
+        b = bugs[0]
+        dn = b.get("display_number") or b.get("id")
+        lines = [
+            f"🐞 <b>Баг #{dn}</b> — {_STATUS_LABELS.get(b.get('status'), b.get('status'))}",
+            f"👤 {b.get('username', '?')}",
+            f"📜 {html.escape(b.get('script_name') or b.get('title') or '—')}",
+        ]
+        if b.get("steps") or b.get("description"):
+            lines.append(f"\n{html.escape((b.get('steps') or b.get('description'))[:1000])}")
+        if b.get("youtube_link"):
+            lines.append(f"\n🎬 {html.escape(b['youtube_link'])}")
+        if b.get("weeek_task_id"):
+            lines.append(f"📌 Weeek: {b['weeek_task_id']}")
+        return "\n".join(lines)
+
+    title = "🐞 <b>Баги"
+    if args.get("tester"):
+        title += f" от {html.escape(args['tester'])}"
+    if args.get("status") and args["status"] != "all":
+        title += f" — {_STATUS_LABELS.get(args['status'], args['status'])}"
+    lines = [f"{title}</b> ({r.get('total', r['count'])})\n"]
+    for b in bugs:
+        dn = b.get("display_number") or b.get("id")
+        name = html.escape((b.get("script_name") or b.get("title") or "—")[:60])
+        status = _STATUS_LABELS.get(b.get("status"), b.get("status"))
+        lines.append(f"• #{dn} {name} — {b.get('username', '?')}, {status}")
+    return "\n".join(lines)
+
+
+def _fmt_inactive(r: dict, args: dict) -> str:
+    testers = r.get("testers") or []
+    if not testers:
+        return f"✅ Все активны за последние {r['days']} дн."
+    lines = [f"😴 <b>Неактивны {r['days']} дн.</b> ({r['inactive_count']})\n"]
+    for t in testers[:_MAX_LIST]:
+        last = (t.get("last_activity") or "")[:10] or "никогда"
+        lines.append(f"• {t['username']} — последняя активность: {last}")
+    if len(testers) > _MAX_LIST:
+        lines.append(f"… и ещё {len(testers) - _MAX_LIST}")
+    return "\n".join(lines)
+
+
+def _fmt_testers_list(r: dict, args: dict) -> str:
+    testers = r.get("testers") or []
+    lines = [f"👥 <b>Тестеры</b> ({r['total']})\n"]
+    for t in testers[:_MAX_LIST * 2]:
+        warns = f", ⚠️ {t['warnings_count']}/3" if t.get("warnings_count") else ""
+        lines.append(f"• {t['username']} — {t['total_points']} б.{warns}")
+    if len(testers) > _MAX_LIST * 2:
+        lines.append(f"… и ещё {len(testers) - _MAX_LIST * 2}")
+    return "\n".join(lines)
+
+
+_FORMATTERS = {
+    "get_rating": _fmt_rating,
+    "get_tester_stats": _fmt_tester_stats,
+    "get_bug_stats": _fmt_bug_stats,
+    "get_team_stats": _fmt_team_stats,
+    "search_bugs": _fmt_bugs,
+    "get_inactive_testers": _fmt_inactive,
+    "get_testers_list": _fmt_testers_list,
+}
+
+
+# ─────────────────────────────────────────────
+#  Компиляция и разбор
+# ─────────────────────────────────────────────
+
+def _compile(rules: list[dict]) -> list[tuple[dict, re.Pattern]]:
+    compiled = []
+    for rule in rules:
+        name = rule.get("name") or rule.get("tool")
+        if rule.get("tool") not in _FORMATTERS:
+            print(f"[INTENTS] Правило {name}: нет форматтера для {rule.get('tool')} — пропущено")
+            continue
+        try:
+            pattern = re.compile(rf"^(?:{rule['pattern']})$", re.IGNORECASE)
+        except (KeyError, re.error) as e:
+            print(f"[INTENTS] Правило {name}: плохой шаблон — {e}")
+            continue
+        compiled.append(({**rule, "name": name}, pattern))
+    return compiled
+
+
+async def _get_compiled() -> list[tuple[dict, re.Pattern]]:
+    global _compiled
+    if _compiled is None:
+        custom = (await async_load(INTENTS_FILE)).get("intents", [])
+        _compiled = _compile(list(custom) + DEFAULT_INTENTS)
+        if custom:
+            print(f"[INTENTS] Своих правил: {len(custom)}, всего {len(_compiled)}")
+    return _compiled
+
+
+def reload():
+    """Перечитать data/intents.json при следующем сообщении."""
+    global _compiled
+    _compiled = None
+
+
+def _schema_types(tool: str) -> dict:
+    from agent.brain import ALL_TOOLS
+    for t in ALL_TOOLS:
+        if t["name"] == tool:
+            return {k: v.get("type") for k, v in t["input_schema"]["properties"].items()}
+    return {}
+
+
+def _build_args(rule: dict, groups: dict) -> dict:
+    args = dict(rule.get("args") or {})
+    types = _schema_types(rule["tool"])
+    for key, value in groups.items():
+        if value is None:
+            continue
+        value = value.strip().lower() if key in _WORD_VALUES else value.strip()
+        if key in _WORD_VALUES:
+            value = _WORD_VALUES[key].get(re.sub(r"\s+", " ", value), value)
+        elif types.get(key) == "integer":
+            value = int(value)
+        else:
+            value = value.lstrip("@")
+        args[key] = value
+    return args
+
+
+def normalize(text: str) -> str:
+    """Текст команды без @упоминания бота и хвостовой пунктуации."""
+    return _RE_TRAILING.sub("", _RE_BOT_MENTION.sub("", text.strip()))
+
+
+def _role_tool_names(role: str) -> set[str]:
+    from agent.brain import get_tools_for_role
+    return {t["name"] for t in get_tools_for_role(role)}
+
+
+async def match(text: str, role: str | None = None) -> tuple[dict, dict] | None:
+    """(правило, аргументы) первой подходящей команды или None."""
+    clean = normalize(text)
+    allowed = _role_tool_names(role) if role else None
+    for rule, pattern in await _get_compiled():
+        if role and rule.get("roles") and role not in rule["roles"]:
+            continue
+        if allowed is not None and rule["tool"] not in allowed:
+            continue
+        m = pattern.match(clean)
+        if m:
+            return rule, _build_args(rule, m.groupdict())
+    return None
+
+
+async def try_direct(text: str, caller_id: int, role: str | None = None) -> str | None:
+    """Выполняет прямую команду через execute_tool. None — не распознана, дальше Claude."""
+    from agent.brain import execute_tool
+
+    metrics.inc("intents.checked")
+    found = await match(text, role)
+    if found is None:
+        _update_hit_rate()
+        return None
+
+    rule, args = found
+    print(f"[DIRECT] Совпадение: {rule['name']} → {rule['tool']}({args})")
+    result = json.loads(await execute_tool(rule["tool"], json.dumps(args, ensure_ascii=False), caller_id))
+    metrics.inc("intents.hit")
+    metrics.inc(f"intents.hit.{rule['name']}")
+    _update_hit_rate()
+    if isinstance(result, dict) and result.get("error"):
+        return f"⚠️ {result['error']}"
+    return _FORMATTERS[rule["tool"]](result, args)
+
+
+def _update_hit_rate():
+    rate = metrics.ratio("intents.hit", "intents.checked")
+    if rate is not None:
+        metrics.set_gauge("intents.hit_rate", round(rate, 3))
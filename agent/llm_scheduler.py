@@ -0,0 +1,313 @@
+"""
+Планировщик запросов к Claude — вместо глобального throttle «1 запрос в секунду».
+
+Запрос получает слот, когда одновременно выполняются:
+- активных запросов меньше LLM_CONCURRENCY;
+- за последнюю минуту отправлено меньше LLM_RPM запросов;
+- входных токенов за минуту (с этим запросом) не больше LLM_TPM.
+
+Очередь приоритетная: продолжения tool-раундов — раньше новых диалогов,
+внутри — руководитель > админ > тестер > чат-режим, дальше по времени прихода.
+Голова очереди не обгоняется: если ей не хватает бюджета, ждут все.
+
+Поверх статических лимитов — адаптация по ответам Anthropic:
+observe_headers() читает anthropic-ratelimit-* и, когда остаток лимита
+меньше SLOWDOWN_AT, растягивает запросы равномерно до сброса окна;
+pause() (429 с retry-after) придерживает все запросы.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from config import LLM_CONCURRENCY, LLM_RPM, LLM_TPM
+from utils import metrics
+
+_WINDOW = 60.0  # Окно бюджетов RPM/TPM, сек
+
+_ROLE_RANK = {"owner": 0, "admin": 1, "tester": 2, "chat": 3}
+_RANK_NAME = {rank: role for role, rank in _ROLE_RANK.items()}
+
+_limits = {"concurrency": LLM_CONCURRENCY, "rpm": LLM_RPM, "tpm": LLM_TPM}
+
+_queue: list = []               # heap: (priority, seq, tokens, future)
+_seq = itertools.count()
+_active = 0
+_sent: deque[float] = deque()                 # время отправки запросов за окно
+_tokens: deque[tuple[float, int]] = deque()   # (время, токены) за окно
+_token_sum = 0
+_timer: asyncio.TimerHandle | None = None
+
+# === Адаптация по заголовкам Anthropic ===
+SLOWDOWN_AT = 0.2          # Осталось меньше 20% лимита — замедляемся
+MAX_PACE_INTERVAL = 10.0   # Реже одного запроса в столько секунд не опускаемся
+_RATELIMIT_KINDS = ("requests", "input-tokens", "tokens")
+
+# pause_until — общая пауза (retry-after); interval/interval_until — темп до сброса окна
+_adaptive = {"pause_until": 0.0, "interval": 0.0, "interval_until": 0.0, "next_at": 0.0}
+
+
+def priority(role: str, continuation: bool = False) -> tuple[int, int]:
+    """Ключ приоритета: меньше — раньше. role: owner/admin/tester/chat."""
+    return (0 if continuation else 1, _ROLE_RANK.get(role, _ROLE_RANK["tester"]))
+
+
+def _priority_name(prio: tuple[int, int]) -> str:
+    return ("cont_" if prio[0] == 0 else "new_") + _RANK_NAME.get(prio[1], "tester")
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Грубая оценка входных токенов запроса (≈3 символа на токен для русского текста)."""
+    size = 0
+    for key in ("system", "messages", "tools"):
+        value = kwargs.get(key)
+        if value:
+            size += len(value) if isinstance(value, str) else len(json.dumps(value, ensure_ascii=False, default=str))
+    return max(1, size // 3)
+
+
+def configure(concurrency: int | None = None, rpm: int | None = None, tpm: int | None = None):
+    """Меняет лимиты на лету (0 у rpm/tpm — без ограничения)."""
+    if concurrency is not None:
+        _limits["concurrency"] = max(1, concurrency)
+    if rpm is not None:
+        _limits["rpm"] = max(0, rpm)
+    if tpm is not None:
+        _limits["tpm"] = max(0, tpm)
+    _pump()
+
+
+# ─────────────────────────────────────────────
+#  Внутренняя кухня
+# ─────────────────────────────────────────────
+
+def _expire(now: float):
+    global _token_sum
+    while _sent and now - _sent[0] >= _WINDOW:
+        _sent.popleft()
+    while _tokens and now - _tokens[0][0] >= _WINDOW:
+        _token_sum -= _tokens.popleft()[1]
+
+
+def _add_tokens(now: float, tokens: int):
+    global _token_sum
+    if tokens:
+        _tokens.append((now, tokens))
+        _token_sum += tokens
+
+
+def _wait_time(tokens: int, now: float) -> float | None:
+    """
+    0 — можно запускать; >0 — сколько ждать, пока освободится бюджет окна;
+    None — все слоты заняты, ждём release().
+    """
+    if _active >= _limits["concurrency"]:
+        return None
+    wait = max(0.0, _adaptive["pause_until"] - now)
+    if now < _adaptive["interval_until"]:
+        wait = max(wait, _adaptive["next_at"] - now)
+    rpm = _limits["rpm"]
+    if rpm and len(_sent) >= rpm:
+        wait = max(wait, _sent[len(_sent) - rpm] + _WINDOW - now)
+    tpm = _limits["tpm"]
+    if tpm and _tokens and _token_sum + tokens > tpm:
+        # Ждём, пока из окна уйдёт столько токенов, сколько не хватает
+        need = _token_sum + tokens - tpm
+        freed = 0
+        for ts, t in _tokens:
+            freed += t
+            if freed >= need:
+                wait = max(wait, ts + _WINDOW - now)
+                break
+    return wait
+
+
+def _schedule(delay: float):
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+    _timer = asyncio.get_running_loop().call_later(delay, _on_timer)
+
+
+def _on_timer():
+    global _timer
+    _timer = None
+    _pump()
+
+
+def _update_gauges():
+    waiting: dict[str, int] = {}
+    for prio, _, _, fut in _queue:
+        if not fut.done():
+            name = _priority_name(prio)
+            waiting[name] = waiting.get(name, 0) + 1
+    metrics.set_gauge("llm.queue_depth", sum(waiting.values()))
+    for name in ("cont_owner", "cont_admin", "cont_tester", "new_owner", "new_admin", "new_tester", "new_chat"):
+        metrics.set_gauge(f"llm.queue_depth.{name}", waiting.get(name, 0))
+    metrics.set_gauge("llm.active", _active)
+
+
+def _pump():
+    """Выдаёт слоты голове очереди, пока хватает лимитов."""
+    global _active
+    now = time.monotonic()
+    _expire(now)
+    while _queue:
+        prio, _, tokens, fut = _queue[0]
+        if fut.done():  # ожидающий отменён
+            heapq.heappop(_queue)
+            continue
+        wait = _wait_time(tokens, now)
+        if wait is None:
+            break
+        if wait > 0:
+            _schedule(wait)
+            break
+        heapq.heappop(_queue)
+        _active += 1
+        _sent.append(now)
+        if now < _adaptive["interval_until"]:
+            _adaptive["next_at"] = now + _adaptive["interval"]
+        _add_tokens(now, tokens)
+        fut.set_result(None)
+    _update_gauges()
+
+
+# ─────────────────────────────────────────────
+#  API
+# ─────────────────────────────────────────────
+
+async def acquire(prio: tuple[int, int], tokens: int = 0):
+    """Ждёт слот. После запроса обязательно release()."""
+    fut = asyncio.get_running_loop().create_future()
+    heapq.heappush(_queue, (prio, next(_seq), tokens, fut))
+    name = _priority_name(prio)
+    metrics.inc(f"llm.requests.{name}")
+    started = time.monotonic()
+    _pump()
+    try:
+        await fut
+    except asyncio.CancelledError:
+        # Слот успели выдать, а ожидающего отменили — возвращаем слот
+        if fut.done() and not fut.cancelled():
+            release()
+        else:
+            _update_gauges()
+        raise
+    waited = (time.monotonic() - started) * 1000
+    metrics.observe("llm.queue_wait_ms", waited)
+    metrics.observe(f"llm.queue_wait_ms.{name}", waited)
+
+
+def release(tokens_used: int | None = None, tokens_reserved: int = 0):
+    """Освобождает слот. tokens_used — фактические входные токены (уточняют TPM-окно)."""
+    global _active
+    _active = max(0, _active - 1)
+    if tokens_used is not None and tokens_used != tokens_reserved:
+        _add_tokens(time.monotonic(), tokens_used - tokens_reserved)
+    _pump()
+
+
+@asynccontextmanager
+async def slot(prio: tuple[int, int], tokens: int = 0):
+    """
+    async with slot(priority("admin"), estimate_tokens(kwargs)) as usage:
+        response = await client.messages.create(**kwargs)
+        usage["tokens"] = response.usage.input_tokens
+    """
+    await acquire(prio, tokens)
+    usage = {"tokens": None}
+    try:
+        yield usage
+    finally:
+        release(usage["tokens"], tokens)
+
+
+# ─────────────────────────────────────────────
+#  Адаптация к лимитам Anthropic
+# ─────────────────────────────────────────────
+
+def _header_int(headers, name: str) -> int | None:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _reset_in(value: str | None) -> float | None:
+    """Секунд до сброса окна из *-reset (RFC 3339)."""
+    if not value:
+        return None
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def observe_headers(headers, tokens: int = 0):
+    """
+    Подстраивает темп по anthropic-ratelimit-* одного ответа (успешного или ошибки).
+    Мало осталось — интервал между запросами = время до сброса / сколько ещё влезет;
+    лимит восстановился — интервал снова 0.
+    """
+    if not headers:
+        return
+    interval = 0.0
+    reset_max = 0.0
+    for kind in _RATELIMIT_KINDS:
+        limit = _header_int(headers, f"anthropic-ratelimit-{kind}-limit")
+        remaining = _header_int(headers, f"anthropic-ratelimit-{kind}-remaining")
+        reset_in = _reset_in(headers.get(f"anthropic-ratelimit-{kind}-reset"))
+        if not limit or remaining is None or reset_in is None:
+            continue
+        metrics.set_gauge(f"llm.ratelimit.{kind}_remaining", remaining)
+        if remaining > limit * SLOWDOWN_AT:
+            continue
+        per_request = 1 if kind == "requests" else max(1, tokens)
+        fits = max(1, remaining // per_request)
+        interval = max(interval, reset_in / fits)
+        reset_max = max(reset_max, reset_in)
+
+    interval = min(interval, MAX_PACE_INTERVAL)
+    if abs(interval - _adaptive["interval"]) >= 0.05:
+        if interval:
+            print(f"[LLM-SCHED] Лимит близко — не чаще раза в {interval:.1f}с ещё {reset_max:.0f}с")
+        else:
+            print("[LLM-SCHED] Лимит восстановлен — полный темп")
+    now = time.monotonic()
+    _adaptive["interval"] = interval
+    _adaptive["interval_until"] = now + reset_max if interval else 0.0
+    metrics.set_gauge("llm.pace_interval_ms", round(interval * 1000))
+
+
+def pause(seconds: float):
+    """Все ожидающие запросы ждут seconds (429 с retry-after)."""
+    until = time.monotonic() + max(0.0, seconds)
+    if until <= _adaptive["pause_until"]:
+        return
+    _adaptive["pause_until"] = until
+    metrics.inc("llm.paused")
+    print(f"[LLM-SCHED] Пауза всех запросов на {seconds:.1f}с")
+    try:
+        _schedule(seconds)
+    except RuntimeError:
+        pass
+
+
+def get_stats() -> dict:
+    """Текущее состояние: очередь, активные, использование окна."""
+    _expire(time.monotonic())
+    return {
+        "queued": sum(1 for _, _, _, fut in _queue if not fut.done()),
+        "active": _active,
+        "requests_last_minute": len(_sent),
+        "tokens_last_minute": _token_sum,
+        "pace_interval": _adaptive["interval"],
+        "paused_for": max(0.0, _adaptive["pause_until"] - time.monotonic()),
+        **_limits,
+    }
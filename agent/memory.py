@@ -0,0 +1,252 @@
+"""
+Память диалогов: бюджет по токенам, сжатие старых реплик в резюме, хранение на диске.
+
+На каждый чат (ключ — chat_id группы или caller_id в ЛС) хранится
+{"summary": str, "messages": [{"role", "content"}], "updated_at"}.
+
+Когда реплики не влезают в бюджет токенов (или их больше лимита по
+количеству), самые старые в фоне сворачиваются дешёвой моделью в
+резюме — оно идёт в системный промпт. Пока сжатие не готово, запрос
+всё равно ограничен: build_messages() подрезает слишком длинные реплики
+и отбрасывает старые сверх двойного бюджета. Если сжатие не удалось,
+реплики остаются до следующей попытки (хранится не больше двойного лимита).
+
+Память переживает рестарт: data/memory.json.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+
+from config import MAX_USERS_CACHE, MEMORY_TOKEN_BUDGET, SUMMARY_MODEL
+from json_store import async_load, async_update, MEMORY_FILE
+from utils import metrics
+
+_SUMMARY_MAX_TOKENS = 400
+_CLIP_MARK = "\n…[обрезано]"
+
+_chats: OrderedDict[int, dict] = OrderedDict()
+_loaded = False
+_load_lock = asyncio.Lock()
+_compacting: set[int] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """≈3 символа на токен для смеси русского текста и разметки."""
+    return len(text or "") // 3 + 1
+
+
+def _messages_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m.get("content") if isinstance(m.get("content"), str) else str(m.get("content")))
+               for m in messages)
+
+
+def _new_entry() -> dict:
+    return {"summary": "", "messages": [], "updated_at": None}
+
+
+async def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    async with _load_lock:
+        if _loaded:
+            return
+        data = await async_load(MEMORY_FILE)
+        # Самые свежие чаты — в конце LRU
+        entries = sorted(data.items(), key=lambda kv: kv[1].get("updated_at") or "")
+        for key, entry in entries[-MAX_USERS_CACHE:]:
+            _chats[int(key)] = {
+                "summary": entry.get("summary", ""),
+                "messages": entry.get("messages", []),
+                "updated_at": entry.get("updated_at"),
+            }
+        _loaded = True
+        if _chats:
+            print(f"[MEMORY] Загружено диалогов: {len(_chats)}")
+
+
+async def get(key: int) -> dict:
+    """Память чата (создаёт пустую). Изменять через append(), на диск — save()."""
+    await _ensure_loaded()
+    if key in _chats:
+        _chats.move_to_end(key)
+        return _chats[key]
+    if len(_chats) >= MAX_USERS_CACHE:
+        _chats.popitem(last=False)
+    _chats[key] = _new_entry()
+    return _chats[key]
+
+
+async def save(key: int):
+    """Сохраняет память чата на диск (раз в ход диалога, не на каждую реплику)."""
+    entry = _chats.get(key)
+    snapshot = None
+    if entry is not None:
+        snapshot = {
+            "summary": entry["summary"],
+            "messages": list(entry["messages"]),
+            "updated_at": entry["updated_at"],
+        }
+
+    def updater(data):
+        if snapshot is None:
+            data.pop(str(key), None)
+        else:
+            data[str(key)] = snapshot
+        # Файл не растёт бесконечно: держим столько же чатов, сколько в памяти
+        if len(data) > MAX_USERS_CACHE:
+            oldest = sorted(data, key=lambda k: data[k].get("updated_at") or "")
+            for k in oldest[:len(data) - MAX_USERS_CACHE]:
+                del data[k]
+        return data
+
+    await async_update(MEMORY_FILE, updater)
+
+
+def append(entry: dict, role: str, content: str):
+    entry["messages"].append({"role": role, "content": content})
+    entry["updated_at"] = datetime.now().isoformat()
+
+
+def pop_last_user(entry: dict):
+    """Убирает последнюю реплику пользователя (запрос не удался)."""
+    if entry["messages"] and entry["messages"][-1].get("role") == "user":
+        entry["messages"].pop()
+
+
+async def clear(key: int):
+    await _ensure_loaded()
+    _chats.pop(key, None)
+    await save(key)
+
+
+async def clear_all():
+    await _ensure_loaded()
+    _chats.clear()
+    await async_update(MEMORY_FILE, lambda data: {})
+
+
+def _clip(content: str, max_tokens: int) -> str:
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    return content[:max_tokens * 3] + _CLIP_MARK
+
+
+def build_messages(entry: dict, budget: int = MEMORY_TOKEN_BUDGET) -> list[dict]:
+    """
+    Сообщения для запроса: копии реплик, длинные подрезаны до половины бюджета,
+    старые сверх двойного бюджета отброшены (на случай, если сжатие ещё не успело).
+    Первой всегда идёт реплика пользователя.
+    """
+    messages = [
+        {"role": m["role"], "content": _clip(m["content"], budget // 2) if isinstance(m["content"], str) else m["content"]}
+        for m in entry["messages"]
+    ]
+    while len(messages) > 1 and _messages_tokens(messages) > budget * 2:
+        messages.pop(0)
+    while messages and messages[0]["role"] != "user":
+        messages.pop(0)
+    metrics.observe("memory.request_tokens", _messages_tokens(messages) + estimate_tokens(entry["summary"]))
+    return messages
+
+
+def summary_block(entry: dict) -> list[dict]:
+    """Резюме для системного промпта (после кэшируемой части)."""
+    if not entry["summary"]:
+        return []
+    return [{"type": "text", "text": f"Краткое содержание предыдущего разговора:\n{entry['summary']}"}]
+
+
+# ─────────────────────────────────────────────
+#  Сжатие в резюме
+# ─────────────────────────────────────────────
+
+def _fold_count(messages: list[dict], budget: int, max_messages: int) -> int:
+    """Сколько старых реплик свернуть, чтобы остаться в половине бюджета и лимита."""
+    keep_tokens = budget // 2
+    keep_count = max(2, max_messages // 2)
+    cut = 0
+    while cut < len(messages) - 2 and (
+        _messages_tokens(messages[cut:]) > keep_tokens or len(messages) - cut > keep_count
+    ):
+        cut += 1
+    # Оставшаяся история должна начинаться с реплики пользователя
+    while cut < len(messages) and messages[cut]["role"] != "user":
+        cut += 1
+    return cut
+
+
+async def _summarize(previous: str, folded: list[dict]) -> str | None:
+    from agent import llm_scheduler
+    from agent.brain import call_claude
+
+    transcript = "\n".join(
+        f"{'Пользователь' if m['role'] == 'user' else 'Бот'}: {m['content']}" for m in folded
+    )
+    prompt = (
+        "Сожми переписку чата тестировщиков с ботом-координатором в краткое резюме "
+        "(до 120 слов, по-русски, без вступлений). Сохрани: кто что просил, какие действия "
+        "бот выполнил (баллы, варны, баги — с юзернеймами и числами), незакрытые вопросы.\n\n"
+        f"Предыдущее резюме:\n{previous or '—'}\n\nНовые сообщения:\n{transcript}"
+    )
+    try:
+        response = await call_claude(
+            priority=llm_scheduler.priority("chat"),
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=_SUMMARY_MAX_TOKENS,
+        )
+    except Exception as e:
+        print(f"[MEMORY] Ошибка сжатия: {e}")
+        return None
+    text_blocks = [b for b in response.content if b.type == "text"]
+    return text_blocks[0].text.strip() if text_blocks else None
+
+
+async def _compact(key: int, budget: int, max_messages: int):
+    try:
+        entry = _chats.get(key)
+        if entry is None:
+            return
+        cut = _fold_count(entry["messages"], budget, max_messages)
+        if cut <= 0:
+            return
+        folded = entry["messages"][:cut]
+        summary = await _summarize(entry["summary"], folded)
+        # Пока шло сжатие, чат могли сбросить
+        if _chats.get(key) is not entry:
+            return
+        if not summary:
+            metrics.inc("memory.compaction_failed")
+            # Реплики не теряем — свернём при следующем ходе. Но если сжатие
+            # долго не удаётся, храним не больше двойного лимита реплик
+            if len(entry["messages"]) <= max_messages * 2:
+                return
+            cut = _fold_count(entry["messages"], budget * 2, max_messages * 2)
+            if cut <= 0:
+                return
+            del entry["messages"][:cut]
+            metrics.inc("memory.trimmed")
+            await save(key)
+            print(f"[MEMORY] Чат {key}: сжатие не удалось, отброшено {cut} старых реплик")
+            return
+        entry["summary"] = summary
+        metrics.inc("memory.compactions")
+        # Реплики добавляются только в конец — свёрнутые всё ещё первые cut штук
+        del entry["messages"][:cut]
+        await save(key)
+        print(f"[MEMORY] Чат {key}: свёрнуто {cut} реплик в резюме, осталось {len(entry['messages'])}")
+    finally:
+        _compacting.discard(key)
+
+
+def maybe_compact(key: int, max_messages: int, budget: int = MEMORY_TOKEN_BUDGET):
+    """Запускает фоновое сжатие, если память чата вышла за бюджет токенов или лимит реплик."""
+    entry = _chats.get(key)
+    if entry is None or key in _compacting:
+        return
+    tokens = _messages_tokens(entry["messages"]) + estimate_tokens(entry["summary"])
+    if tokens <= budget and len(entry["messages"]) <= max_messages:
+        return
+    _compacting.add(key)
+    asyncio.create_task(_compact(key, budget, max_messages))
@@ -0,0 +1,108 @@
+"""
+Маршрутизация модели агента по уровням: fast → default → strong.
+
+Уровень выбирается по дешёвым признакам, без вызова Claude:
+- роль (тестеру доступны только свои данные — всегда быстрая модель);
+- сложность по классификатору групп инструментов (classify_tool_groups):
+  сколько групп задето, есть ли изменяющие данные, составная ли команда;
+- болтовня без единой угаданной группы — быстрая модель.
+
+Сильная модель — только эскалацией: ответ не получен (сбой API после всех
+повторов) или неуверенный (обрезан по max_tokens, пустой, исчерпаны
+tool-раунды). Повтор допустим, пока попытка ничего не изменила в данных.
+
+Метрики: router.requests, router.routed.<tier> (начальный выбор);
+по уровню — router.<tier>.ms, router.<tier>.ok / .escalated / .error;
+router.escalation.<причина>, gauge router.escalation_rate.
+"""
+import time
+
+import anthropic
+import httpx
+
+from config import MODEL, MODEL_FAST, MODEL_STRONG, MODEL_ROUTING
+from utils import metrics
+
+TIERS = ("fast", "default", "strong")
+_MODELS = {"fast": MODEL_FAST, "default": MODEL, "strong": MODEL_STRONG}
+
+# Группы инструментов, меняющие данные, — их не отдаём быстрой модели
+_MUTATING_GROUPS = {"points", "warnings", "logins", "admin"}
+_COMPOUND_WORDS = (" и ", " потом ", " затем ", " после ", " всем ", " каждому ", " кроме ")
+_LONG_TEXT = 200
+
+# Признаки «модель не справилась» в тексте ответа
+_UNSURE_MARKERS = ("не понял запрос", "не могу понять", "не удалось разобрать")
+
+
+def model(tier: str) -> str:
+    return _MODELS[tier]
+
+
+def choose(role: str, text: str) -> str:
+    """Начальный уровень для запроса."""
+    from agent.brain import classify_tool_groups
+
+    if not MODEL_ROUTING:
+        tier = "default"
+    elif role == "tester":
+        tier = "fast"
+    else:
+        groups = set(classify_tool_groups(text))
+        lowered = f" {text.lower()} "
+        score = len(groups)
+        if groups & _MUTATING_GROUPS:
+            score += 2
+        if len(text) > _LONG_TEXT:
+            score += 1
+        if any(w in lowered for w in _COMPOUND_WORDS):
+            score += 1
+        tier = "fast" if score <= 1 else "default"
+    metrics.inc("router.requests")
+    metrics.inc(f"router.routed.{tier}")
+    return tier
+
+
+def next_tier(tier: str) -> str | None:
+    """Следующий уровень с другой моделью (None — выше некуда)."""
+    for candidate in TIERS[TIERS.index(tier) + 1:]:
+        if _MODELS[candidate] != _MODELS[tier]:
+            return candidate
+    return None
+
+
+def failure_reason(error: Exception) -> str | None:
+    """Причина эскалации по ошибке; None — ошибка не лечится другой моделью."""
+    if isinstance(error, anthropic.RateLimitError):
+        return None
+    if isinstance(error, anthropic.APIStatusError):
+        return "api_error" if error.status_code >= 500 else None
+    if isinstance(error, (anthropic.APIConnectionError, httpx.ConnectError, httpx.ReadTimeout)):
+        return "network"
+    return None
+
+
+def low_confidence(response, rounds_exhausted: bool) -> str | None:
+    """Причина эскалации по ответу; None — ответ принимаем."""
+    if rounds_exhausted:
+        return "rounds_exhausted"
+    if getattr(response, "stop_reason", None) == "max_tokens":
+        return "max_tokens"
+    texts = [b.text for b in response.content if b.type == "text"]
+    if not any(t.strip() for t in texts):
+        return "empty"
+    lowered = texts[0].lower()
+    if any(m in lowered for m in _UNSURE_MARKERS):
+        return "unsure"
+    return None
+
+
+def record(tier: str, started: float, outcome: str, reason: str = None):
+    """Итог попытки на уровне: ok / escalated / error."""
+    metrics.observe(f"router.{tier}.ms", (time.monotonic() - started) * 1000)
+    metrics.inc(f"router.{tier}.{outcome}")
+    if outcome == "escalated":
+        metrics.inc("router.escalations")
+        metrics.inc(f"router.escalation.{reason}")
+        print(f"[ROUTER] {tier} ({_MODELS[tier]}) → эскалация: {reason}")
+    metrics.set_gauge("router.escalation_rate", round(metrics.ratio("router.escalations", "router.requests") or 0, 3))
@@ -0,0 +1,282 @@
+"""
+Бенчмарк агента (process_message) на сценарном Claude (bench/fake_anthropic.py), без сети.
+
+Поднимает синтетический data/ во временной папке (тестеры, админы, баги,
+баллы), подменяет клиента Anthropic и одновременно гоняет смесь сообщений
+админов и тестеров: мгновенные ответы, прямые команды, запросы с
+инструментами и болтовню.
+
+Отчёт: пропускная способность, задержка end-to-end по ролям, накладные
+расходы бота (задержка минус время «модели»), этапы из utils/metrics
+(очередь планировщика, очередь чата, раунды инструментов, уровни моделей),
+число вызовов Claude и, с --alloc, выделения памяти по файлам бота.
+
+Запуск:
+    python -m bench.agent_bench --admins 5 --testers 20 --messages 10 --latency 0.3
+    python -m bench.agent_bench --chats 1 --stream --alloc
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+
+import json_store
+from agent import brain, llm_scheduler
+from bench.fake_anthropic import FakeAnthropic, simulated_seconds
+from models.admin import add_admin
+from models.bug import create_bug
+from models.tester import get_or_create_tester, update_tester_stats
+from services.points_service import award_points
+from utils import metrics
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_GROUP_BASE = -1000000
+
+
+def _mentions(prompt: str) -> list[str]:
+    return re.findall(r"@(\w+)", prompt)
+
+
+def _first(prompt: str) -> str:
+    names = _mentions(prompt)
+    return names[0] if names else "tester_1"
+
+
+_LONG_TEXT = (
+    "По данным за неделю команда держит темп: багов принято больше, чем неделей раньше, "
+    "лидеры рейтинга не поменялись. Стоит подтянуть тех, кто давно не присылал отчёты, "
+    "и проверить дубли в свежих багах."
+)
+
+# Сценарии «модели»: шаблон реплики → шаги (инструменты или текст)
+SCRIPTS = [
+    (r"начисли", [
+        {"tools": [("award_points", lambda p: {"username": _first(p), "amount": 3, "reason": "бенчмарк"})]},
+        {"text": "✅ Начислил 3 балла."},
+    ]),
+    (r"варн", [
+        {"tools": [("issue_warning", lambda p: {"username": _first(p), "reason": "бенчмарк"})]},
+        {"text": "Варн выдан, тестер уведомлён."},
+    ]),
+    (r"сравни", [
+        {"tools": [("compare_testers", lambda p: {"username1": _mentions(p)[0], "username2": _mentions(p)[1]})]},
+        {"text": "Первый заметно активнее: больше багов и игр за период."},
+    ]),
+    (r"найди баги", [
+        {"tools": [("search_bugs", {"query": "login"})]},
+        {"text": "Нашёл несколько багов по логину, самые свежие — сверху."},
+    ]),
+    (r"итоги недели", [
+        {"tools": [("get_team_stats", {"period": "week"}), ("get_rating", {"top_count": 5})]},
+        {"text": _LONG_TEXT},
+    ]),
+    (r"как мне", [{"text": "Присылай баги с шагами и видео — за принятый баг начисляются баллы."}]),
+]
+
+ADMIN_MESSAGES = [
+    (3, "привет"),
+    (5, "рейтинг"),
+    (5, "статистика @{t}"),
+    (4, "начисли @{t} 3 балла за помощь"),
+    (2, "выдай варн @{t} за флуд"),
+    (3, "сравни @{t} и @{u}"),
+    (3, "найди баги про логин"),
+    (3, "итоги недели: кто молодец и кого подтянуть?"),
+    (2, "как дела у команды в целом?"),
+]
+
+TESTER_MESSAGES = [
+    (4, "спасибо"),
+    (4, "моя статистика"),
+    (4, "рейтинг"),
+    (3, "как мне набрать больше баллов?"),
+    (2, "когда следующий тест?"),
+]
+
+
+# ─────────────────────────────────────────────
+#  Синтетические данные
+# ─────────────────────────────────────────────
+
+async def seed_data(testers: int, admins: int, bugs: int, rnd: random.Random) -> tuple[list[dict], list[int]]:
+    tester_list = []
+    for i in range(1, testers + 1):
+        tester = await get_or_create_tester(100000 + i, f"tester_{i}", f"Тестер {i}")
+        await update_tester_stats(tester["telegram_id"], bugs=rnd.randint(0, 20), games=rnd.randint(0, 50))
+        tester_list.append(tester)
+    for tester in rnd.sample(tester_list, k=min(len(tester_list), testers // 2)):
+        await award_points(tester["username"], rnd.randint(1, 30), "seed", source="seed")
+    admin_ids = []
+    for i in range(1, admins + 1):
+        await add_admin(200000 + i, f"admin_{i}", f"Админ {i}")
+        admin_ids.append(200000 + i)
+    for i in range(bugs):
+        tester = rnd.choice(tester_list)
+        await create_bug(tester["telegram_id"], 10000 + i, script_name=f"login flow {i}",
+                         steps="1. открыть 2. войти", status=rnd.choice(["accepted", "pending", "rejected"]))
+    return tester_list, admin_ids
+
+
+# ─────────────────────────────────────────────
+#  Нагрузка
+# ─────────────────────────────────────────────
+
+def _pick(mix: list[tuple[int, str]], rnd: random.Random, names: list[str]) -> str:
+    template = rnd.choices([m for _, m in mix], weights=[w for w, _ in mix])[0]
+    t, u = rnd.sample(names, 2)
+    return template.format(t=t, u=u)
+
+
+async def run_user(user: dict, count: int, think: float, stream: bool, rnd: random.Random,
+                   names: list[str]) -> int:
+    mix = ADMIN_MESSAGES if user["role"] == "admin" else TESTER_MESSAGES
+    errors = 0
+
+    async def on_text(delta):
+        pass
+
+    for _ in range(count):
+        if think:
+            await asyncio.sleep(rnd.uniform(0, think))
+        text = _pick(mix, rnd, names)
+        spent: list[float] = []
+        token = simulated_seconds.set(spent)
+        started = time.monotonic()
+        try:
+            reply = await brain.process_message(
+                text, user["username"], user["role"], "general", user["id"], user["chat_id"],
+                on_text=on_text if stream else None,
+            )
+        except Exception as e:
+            reply = f"⚠️ {e}"
+        finally:
+            simulated_seconds.reset(token)
+        elapsed = (time.monotonic() - started) * 1000
+        metrics.observe(f"bench.e2e_ms.{user['role']}", elapsed)
+        metrics.observe("bench.overhead_ms", max(0.0, elapsed - sum(spent) * 1000))
+        if reply and reply.startswith("⚠️"):
+            errors += 1
+    return errors
+
+
+def _print_hist(name: str, label: str = None):
+    hist = metrics.snapshot()["histograms"].get(name)
+    if hist:
+        print(f"  {label or name:<28} n={hist['count']:<5} p50={hist['p50']:>8g}  "
+              f"p95={hist['p95']:>8g}  max={hist['max']:>8g}")
+
+
+def _print_allocations(snapshot: tracemalloc.Snapshot, top: int):
+    stats = [
+        s for s in snapshot.statistics("filename")
+        if s.traceback[0].filename.startswith(_ROOT) and "/bench/" not in s.traceback[0].filename
+    ]
+    print(f"\nВыделения памяти (живые на конец прогона, файлы бота, топ {top}):")
+    for stat in stats[:top]:
+        path = os.path.relpath(stat.traceback[0].filename, _ROOT)
+        print(f"  {path:<28} {stat.size / 1024:8.1f} КБ  {stat.count:7d} блоков")
+
+
+async def run(args):
+    rnd = random.Random(args.seed)
+
+    # Рабочие данные не трогаем: всё во временной папке
+    json_store.DATA_DIR = tempfile.mkdtemp(prefix="agent_bench_")
+    json_store.init_store()
+    testers, admin_ids = await seed_data(args.seed_testers, args.admins, args.bugs, rnd)
+    names = [t["username"] for t in testers]
+
+    fake = FakeAnthropic(SCRIPTS, latency=args.latency, token_latency=args.token_latency,
+                         jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    brain.client = fake
+    llm_scheduler.configure(concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm)
+
+    users = []
+    for i, admin_id in enumerate(admin_ids):
+        users.append({"id": admin_id, "username": f"admin_{i + 1}", "role": "admin"})
+    for tester in testers[:args.testers]:
+        users.append({"id": tester["telegram_id"], "username": tester["username"], "role": "tester"})
+    for i, user in enumerate(users):
+        user["chat_id"] = _GROUP_BASE - (i % args.chats) if args.chats else None
+
+    total = len(users) * args.messages
+    print(f"Пользователей: {args.admins} админов, {min(args.testers, len(testers))} тестеров; "
+          f"сообщений: {total}; чатов: {args.chats or 'только ЛС'}; "
+          f"latency {args.latency}s, token_latency {args.token_latency}s, error_rate {args.error_rate}")
+
+    metrics.reset()
+    if args.alloc:
+        tracemalloc.start()
+    started = time.monotonic()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log) if not args.verbose else contextlib.nullcontext():
+        errors = await asyncio.gather(*(
+            run_user(user, args.messages, args.think, args.stream, random.Random(rnd.random()), names)
+            for user in users
+        ))
+    elapsed = time.monotonic() - started
+    if args.alloc:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+    counters = metrics.snapshot()["counters"]
+    print(f"\nГотово за {elapsed:.2f} с: {total / elapsed:.1f} сообщ/с, ошибок {sum(errors)}")
+    print(f"Вызовов Claude: {fake.calls} ({', '.join(f'{m}={n}' for m, n in fake.by_model.items()) or '—'}), "
+          f"сбоев стенда: {fake.errors}")
+    print("Пути: " + ", ".join(
+        f"{label}={counters.get(name, 0):g}" for label, name in (
+            ("прямые", "intents.hit"), ("общий ответ", "singleflight.shared"),
+            ("кэш инструментов", "tools.cache_hit"), ("эскалации", "router.escalations"),
+            ("сброшено", "chat_queue.shed"), ("дедлайн", "deadline.expired"),
+        )
+    ))
+
+    print("\nЗадержка, мс:")
+    _print_hist("bench.e2e_ms.admin", "end-to-end админ")
+    _print_hist("bench.e2e_ms.tester", "end-to-end тестер")
+    _print_hist("bench.overhead_ms", "накладные (без модели)")
+    _print_hist("llm.queue_wait_ms", "очередь планировщика")
+    _print_hist("chat_queue.wait_ms", "очередь чата")
+    _print_hist("tools.round_ms", "раунд инструментов")
+    for tier in ("fast", "default", "strong"):
+        _print_hist(f"router.{tier}.ms", f"уровень {tier}")
+    _print_hist("memory.request_tokens", "история, токенов")
+
+    if args.alloc:
+        print(f"\nПамять: пик {peak / 1024 / 1024:.1f} МБ, на конец {current / 1024 / 1024:.1f} МБ")
+        _print_allocations(snapshot, args.alloc_top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк агента на сценарном Claude")
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--testers", type=int, default=10, help="сколько тестеров пишут боту")
+    parser.add_argument("--messages", type=int, default=10, help="сообщений на пользователя")
+    parser.add_argument("--chats", type=int, default=0, help="групповых чатов (0 — все пишут в ЛС)")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза между сообщениями до, сек")
+    parser.add_argument("--stream", action="store_true", help="потоковые ответы (messages.stream)")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка ответа модели, сек")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="сек на выходной токен")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=llm_scheduler.LLM_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=0, help="лимит планировщика, запросов/мин (0 — без)")
+    parser.add_argument("--tpm", type=int, default=0, help="лимит планировщика, токенов/мин (0 — без)")
+    parser.add_argument("--seed-testers", type=int, default=50, help="тестеров в синтетической базе")
+    parser.add_argument("--bugs", type=int, default=200)
+    parser.add_argument("--alloc", action="store_true", help="учёт выделений памяти (tracemalloc)")
+    parser.add_argument("--alloc-top", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Сценарный AsyncAnthropic — для бенчмарка агента без сети и без расходов.
+
+Реализует то, чем пользуется agent/brain.py:
+  client.messages.create(**kwargs)
+  client.messages.with_raw_response.create(**kwargs)  → .parse(), .headers
+  client.messages.stream(**kwargs)                   → text_stream, get_final_message()
+
+Ответ выбирается по сценарию: первый шаблон, совпавший с последней текстовой
+репликой пользователя, даёт последовательность шагов — вызовы инструментов
+(tool_use) или текст. Номер шага — сколько tool-раундов уже прошло в запросе.
+Аргументы инструмента — dict или функция от текста реплики (достать @username).
+
+Задержка: latency + token_latency × выходные токены (± jitter), доля ошибок
+error_rate (500 — клиент повторяет). Входные токены и кэш промпта
+оцениваются по размеру запроса: первый запрос с данным префиксом пишет
+кэш, следующие читают.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+
+# Сколько секунд «модели» набежало в текущем запросе (бенчмарк вычитает их из задержки)
+simulated_seconds: ContextVar[list | None] = ContextVar("fake_anthropic_seconds", default=None)
+
+_DEFAULT_STEPS = [{"text": "Понял 👍"}]
+
+
+def _usage(input_tokens: int, output_tokens: int, cache_read: int, cache_write: int):
+    return SimpleNamespace(
+        input_tokens=input_tokens, output_tokens=output_tokens,
+        cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write,
+    )
+
+
+def _prompt_text(messages: list[dict]) -> tuple[str, int]:
+    """(последняя текстовая реплика пользователя, сколько tool-раундов после неё)."""
+    rounds = 0
+    for message in reversed(messages):
+        content = message["content"]
+        if message["role"] == "user":
+            if isinstance(content, str):
+                return re.sub(r"^@\S+:\s*", "", content), rounds
+            rounds += 1
+    return "", rounds
+
+
+class FakeAnthropic:
+    """Подмена anthropic.AsyncAnthropic: client = FakeAnthropic(scripts)."""
+
+    def __init__(self, scripts: list[tuple[str, list[dict]]], latency: float = 0.3,
+                 token_latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 chunk_size: int = 40, seed: int | None = None):
+        self.scripts = [(re.compile(pattern, re.IGNORECASE), steps) for pattern, steps in scripts]
+        self.latency = latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._cached_prefixes: set[str] = set()
+
+        self.calls = 0
+        self.errors = 0
+        self.by_model: dict[str, int] = {}
+
+        self.messages = _Messages(self)
+
+    # ─────────────────────────────────────────────
+    #  Ответ по сценарию
+    # ─────────────────────────────────────────────
+
+    def _steps(self, prompt: str) -> list[dict]:
+        for pattern, steps in self.scripts:
+            if pattern.search(prompt):
+                return steps
+        return _DEFAULT_STEPS
+
+    def _build(self, kwargs: dict):
+        prompt, rounds = _prompt_text(kwargs.get("messages", []))
+        steps = self._steps(prompt)
+        step = steps[min(rounds, len(steps) - 1)]
+
+        if "tools" in step:
+            content = [
+                SimpleNamespace(type="tool_use", id=f"toolu_{next(self._ids)}", name=name,
+                                input=args(prompt) if callable(args) else dict(args))
+                for name, args in step["tools"]
+            ]
+            stop_reason = "tool_use"
+            output_tokens = 30 * len(content)
+        else:
+            content = [SimpleNamespace(type="text", text=step["text"])]
+            stop_reason = "end_turn"
+            output_tokens = len(step["text"]) // 3 + 1
+
+        # Кэш промпта: system + tools — префикс; первый раз пишем, дальше читаем
+        prefix = json.dumps([kwargs.get("system"), kwargs.get("tools")], ensure_ascii=False, default=str)
+        prefix_tokens = len(prefix) // 3
+        rest_tokens = len(json.dumps(kwargs.get("messages", []), ensure_ascii=False, default=str)) // 3
+        key = hashlib.sha1(f"{kwargs.get('model')}:{prefix}".encode()).hexdigest()
+        if key in self._cached_prefixes:
+            cache_read, cache_write = prefix_tokens, 0
+        else:
+            self._cached_prefixes.add(key)
+            cache_read, cache_write = 0, prefix_tokens
+
+        return SimpleNamespace(
+            id=f"msg_{next(self._ids)}", type="message", role="assistant",
+            model=kwargs.get("model"), content=content, stop_reason=stop_reason,
+            usage=_usage(rest_tokens, output_tokens, cache_read, cache_write),
+        )
+
+    async def _respond(self, kwargs: dict):
+        self.calls += 1
+        model = kwargs.get("model") or "?"
+        self.by_model[model] = self.by_model.get(model, 0) + 1
+        response = self._build(kwargs)
+        delay = self.latency + self.token_latency * response.usage.output_tokens
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        delay = max(0.0, delay)
+        spent = simulated_seconds.get()
+        if spent is not None:
+            spent.append(delay)
+        await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            request = httpx.Request("POST", "https://fake.anthropic/v1/messages")
+            raise anthropic.InternalServerError(
+                "fake overloaded", response=httpx.Response(500, request=request), body=None,
+            )
+        return response
+
+
+class _Messages:
+    def __init__(self, fake: FakeAnthropic):
+        self._fake = fake
+        self.with_raw_response = _RawMessages(fake)
+
+    async def create(self, **kwargs):
+        return await self._fake._respond(kwargs)
+
+    def stream(self, **kwargs) -> "_Stream":
+        return _Stream(self._fake, kwargs)
+
+
+class _RawResponse:
+    def __init__(self, response):
+        self._response = response
+        self.headers = {}
+
+    def parse(self):
+        return self._response
+
+
+class _RawMessages:
+    def __init__(self, fake: FakeAnthropic):
+        self._fake = fake
+
+    async def create(self, **kwargs) -> _RawResponse:
+        return _RawResponse(await self._fake._respond(kwargs))
+
+
+class _Stream:
+    """async with client.messages.stream(...) as stream: text_stream, get_final_message()."""
+
+    def __init__(self, fake: FakeAnthropic, kwargs: dict):
+        self._fake = fake
+        self._kwargs = kwargs
+        self._message = None
+        self.response = SimpleNamespace(headers={})
+
+    async def __aenter__(self):
+        self._message = await self._fake._respond(self._kwargs)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        size = self._fake.chunk_size
+        for block in self._message.content:
+            if block.type == "text":
+                for i in range(0, len(block.text), size):
+                    yield block.text[i:i + size]
+                    await asyncio.sleep(0)
+
+    async def get_final_message(self):
+        return self._message
@@ -0,0 +1,307 @@
+"""
+Локальный стенд Weeek API — для бенчмарков и ручной проверки без сети.
+
+Реализует эндпоинты, которыми пользуется services/weeek_service.py:
+  GET    /tm/projects
+  GET    /tm/boards[?projectId=]        GET /tm/boards/{id}
+  GET    /tm/board-columns?boardId=
+  GET    /tm/tasks?projectId=&perPage=&offset=
+  POST   /tm/tasks                      GET/PUT/DELETE /tm/tasks/{id}
+  POST   /tm/tasks/{id}/attachments     (multipart, поле files[])
+
+Задержка и ошибки настраиваются: latency/jitter (сек), error_rate (доля
+ответов error_status), rate_limit (запросов/сек, сверх — 429 с Retry-After)
+и fail_next() для детерминированных сбоев.
+
+Запуск отдельно (бот направляется на стенд через WEEEK_BASE_URL):
+    python -m bench.fake_weeek --port 8090 --latency 0.2 --error-rate 0.05
+    WEEEK_BASE_URL=http://127.0.0.1:8090 WEEEK_API_KEY=fake python bot.py
+"""
+import argparse
+import asyncio
+import random
+import socket
+import time
+from collections import deque
+
+from aiohttp import web
+
+
+class FakeWeeek:
+    """In-memory Weeek: проекты, доски, колонки, задачи и вложения."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500,
+                 rate_limit: int = 0, api_key: str | None = None, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.api_key = api_key  # None — принимаем любой Bearer
+        self._random = random.Random(seed)
+
+        self.projects: list[dict] = []
+        self.boards: list[dict] = []
+        self.columns: dict[int, list[dict]] = {}   # board_id → колонки
+        self.tasks: dict[int, dict] = {}           # task_id → задача
+        self.attachments: dict[int, list[dict]] = {}
+        self._next_id = 1
+
+        self.requests: dict[str, int] = {}         # "GET /tm/tasks" → сколько раз
+        self._fail_queue: deque[int] = deque()
+        self._window: deque[float] = deque()
+
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    # ─────────────────────────────────────────────
+    #  Данные
+    # ─────────────────────────────────────────────
+
+    def _new_id(self) -> int:
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    def seed(self, boards: int = 3, columns_per_board: int = 3, tasks: int = 0,
+             project_name: str = "Umbrella") -> "FakeWeeek":
+        """Заполняет стенд: один проект, boards досок, tasks задач по кругу между досками."""
+        project_id = self._new_id()
+        self.projects.append({"id": project_id, "name": project_name})
+        for b in range(boards):
+            board_id = self._new_id()
+            self.boards.append({"id": board_id, "name": f"Доска {b + 1}", "projectId": project_id})
+            self.columns[board_id] = [
+                {"id": self._new_id(), "name": f"Колонка {c + 1}", "boardId": board_id}
+                for c in range(columns_per_board)
+            ]
+        for i in range(tasks):
+            board = self.boards[i % len(self.boards)] if self.boards else None
+            self._add_task(f"Задача {i + 1}", project_id,
+                           self.columns[board["id"]][0]["id"] if board and self.columns[board["id"]] else None)
+        return self
+
+    def _column_board(self, column_id: int | None) -> int | None:
+        for board_id, cols in self.columns.items():
+            if any(c["id"] == column_id for c in cols):
+                return board_id
+        return None
+
+    def _add_task(self, title: str, project_id: int | None, column_id: int | None,
+                  description: str = "") -> dict:
+        task_id = self._new_id()
+        task = {
+            "id": task_id,
+            "title": title,
+            "description": description,
+            "projectId": project_id,
+            "boardId": self._column_board(column_id),
+            "boardColumnId": column_id,
+        }
+        self.tasks[task_id] = task
+        return task
+
+    def fail_next(self, count: int = 1, status: int = 500):
+        """Следующие count запросов получат status (429 — с Retry-After: 1)."""
+        self._fail_queue.extend([status] * count)
+
+    # ─────────────────────────────────────────────
+    #  Латентность, ошибки, лимиты
+    # ─────────────────────────────────────────────
+
+    def _rate_limited(self) -> bool:
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1.0:
+            self._window.popleft()
+        if len(self._window) >= self.rate_limit:
+            return True
+        self._window.append(now)
+        return False
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        route = request.match_info.route.resource
+        key = f"{request.method} {route.canonical if route else request.path}"
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.api_key is not None and request.headers.get("Authorization") != f"Bearer {self.api_key}":
+            return web.json_response({"success": False, "message": "Unauthorized"}, status=401)
+
+        status = self._fail_queue.popleft() if self._fail_queue else None
+        if status is None and self._rate_limited():
+            status = 429
+        if status is None and self.error_rate and self._random.random() < self.error_rate:
+            status = self.error_status
+        if status is not None:
+            headers = {"Retry-After": "1"} if status == 429 else None
+            return web.json_response({"success": False, "message": f"injected {status}"},
+                                     status=status, headers=headers)
+        return await handler(request)
+
+    # ─────────────────────────────────────────────
+    #  Эндпоинты
+    # ─────────────────────────────────────────────
+
+    async def _projects(self, request: web.Request) -> web.Response:
+        return web.json_response({"success": True, "projects": self.projects})
+
+    async def _boards(self, request: web.Request) -> web.Response:
+        project_id = request.query.get("projectId")
+        boards = self.boards
+        if project_id:
+            boards = [b for b in boards if str(b["projectId"]) == project_id]
+        return web.json_response({"success": True, "boards": boards})
+
+    async def _board(self, request: web.Request) -> web.Response:
+        board_id = int(request.match_info["board_id"])
+        board = next((b for b in self.boards if b["id"] == board_id), None)
+        if board is None:
+            return web.json_response({"success": False, "message": "Not found"}, status=404)
+        return web.json_response({"success": True, "board": {**board, "columns": self.columns.get(board_id, [])}})
+
+    async def _board_columns(self, request: web.Request) -> web.Response:
+        board_id = int(request.query.get("boardId", 0))
+        return web.json_response({"success": True, "boardColumns": self.columns.get(board_id, [])})
+
+    async def _list_tasks(self, request: web.Request) -> web.Response:
+        tasks = list(self.tasks.values())
+        project_id = request.query.get("projectId")
+        if project_id:
+            tasks = [t for t in tasks if str(t["projectId"]) == project_id]
+        per_page = int(request.query.get("perPage", 50))
+        offset = int(request.query.get("offset", 0))
+        page = tasks[offset:offset + per_page]
+        return web.json_response({
+            "success": True,
+            "tasks": page,
+            "hasMore": offset + per_page < len(tasks),
+        })
+
+    async def _create_task(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        location = (data.get("locations") or [{}])[0]
+        task = self._add_task(
+            data.get("title", ""),
+            location.get("projectId"),
+            location.get("boardColumnId"),
+            data.get("description", ""),
+        )
+        return web.json_response({"success": True, "task": task}, status=201)
+
+    def _get_task(self, request: web.Request) -> dict | None:
+        return self.tasks.get(int(request.match_info["task_id"]))
+
+    async def _read_task(self, request: web.Request) -> web.Response:
+        task = self._get_task(request)
+        if task is None:
+            return web.json_response({"success": False, "message": "Not found"}, status=404)
+        return web.json_response({"success": True, "task": task})
+
+    async def _update_task(self, request: web.Request) -> web.Response:
+        task = self._get_task(request)
+        if task is None:
+            return web.json_response({"success": False, "message": "Not found"}, status=404)
+        data = await request.json()
+        for field in ("title", "description", "boardColumnId"):
+            if field in data:
+                task[field] = data[field]
+        task["boardId"] = self._column_board(task["boardColumnId"])
+        return web.json_response({"success": True, "task": task})
+
+    async def _delete_task(self, request: web.Request) -> web.Response:
+        task_id = int(request.match_info["task_id"])
+        if self.tasks.pop(task_id, None) is None:
+            return web.json_response({"success": False, "message": "Not found"}, status=404)
+        self.attachments.pop(task_id, None)
+        return web.json_response({"success": True})
+
+    async def _upload(self, request: web.Request) -> web.Response:
+        task_id = int(request.match_info["task_id"])
+        if task_id not in self.tasks:
+            return web.json_response({"success": False, "message": "Not found"}, status=404)
+        files = []
+        reader = await request.multipart()
+        async for part in reader:
+            body = await part.read()
+            files.append({"name": part.filename, "size": len(body)})
+        self.attachments.setdefault(task_id, []).extend(files)
+        return web.json_response({"success": True, "attachments": files})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware], client_max_size=64 * 1024 * 1024)
+        r = app.router
+        r.add_get("/tm/projects", self._projects)
+        r.add_get("/tm/boards", self._boards)
+        r.add_get("/tm/boards/{board_id}", self._board)
+        r.add_get("/tm/board-columns", self._board_columns)
+        r.add_get("/tm/tasks", self._list_tasks)
+        r.add_post("/tm/tasks", self._create_task)
+        r.add_get("/tm/tasks/{task_id}", self._read_task)
+        r.add_put("/tm/tasks/{task_id}", self._update_task)
+        r.add_delete("/tm/tasks/{task_id}", self._delete_task)
+        r.add_post("/tm/tasks/{task_id}/attachments", self._upload)
+        return app
+
+    # ─────────────────────────────────────────────
+    #  Запуск / остановка
+    # ─────────────────────────────────────────────
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Поднимает сервер (port=0 — свободный порт). Возвращает base URL."""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        site = web.SockSite(self._runner, sock)
+        await site.start()
+        self.base_url = f"http://{host}:{sock.getsockname()[1]}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    fake = FakeWeeek(
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status,
+        rate_limit=args.rate_limit,
+    ).seed(boards=args.boards, columns_per_board=args.columns, tasks=args.tasks)
+    url = await fake.start(args.host, args.port)
+    print(f"[FAKE-WEEEK] Слушает {url} — досок {len(fake.boards)}, задач {len(fake.tasks)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд Weeek API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit", type=int, default=0, help="запросов/сек, сверх — 429")
+    parser.add_argument("--boards", type=int, default=3)
+    parser.add_argument("--columns", type=int, default=3)
+    parser.add_argument("--tasks", type=int, default=20)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
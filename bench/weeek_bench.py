@@ -0,0 +1,133 @@
+"""
+Бенчмарк Weeek-клиента на локальном стенде (bench/fake_weeek.py), без сети.
+
+Сценарии:
+  setup   — setup_weeek (проекты, доски, поиск колонок)
+  delete  — delete_tasks_bulk на --tasks задачах
+  attach  — upload_attachment: --files файлов по --size КБ, --concurrency одновременно
+
+Запуск:
+    python -m bench.weeek_bench --latency 0.1 --error-rate 0.05
+    python -m bench.weeek_bench --only delete --tasks 500 --rate-limit 10
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import json_store
+from bench.fake_weeek import FakeWeeek
+from services import weeek_service
+from utils import metrics
+
+
+def _print_result(name: str, elapsed: float, count: int, extra: str = ""):
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"  {name:<8} {elapsed * 1000:8.0f} мс  {count:5d} оп.  {rate:8.1f} оп/с  {extra}")
+
+
+def _print_weeek_metrics():
+    snap = metrics.snapshot()
+    counters = {k: v for k, v in snap["counters"].items() if k.startswith("weeek.")}
+    latency = snap["histograms"].get("weeek.latency_ms")
+    print("    " + ", ".join(f"{k.removeprefix('weeek.')}={v:g}" for k, v in sorted(counters.items())))
+    if latency:
+        print(f"    latency p50={latency['p50']:g} мс, p95={latency['p95']:g} мс, max={latency['max']:g} мс")
+
+
+async def bench_setup(fake: FakeWeeek) -> dict:
+    started = time.monotonic()
+    result = await weeek_service.setup_weeek()
+    elapsed = time.monotonic() - started
+    with_columns = sum(1 for b in weeek_service.get_cached_boards() if b.get("_first_column_id"))
+    _print_result("setup", elapsed, 1, f"досок с колонкой: {with_columns}/{len(fake.boards)}"
+                  + ("" if result.get("success") else f" — {result.get('error')}"))
+    return result
+
+
+async def bench_delete(fake: FakeWeeek, concurrency: int, rate_limit: int) -> dict:
+    task_ids = [str(tid) for tid in fake.tasks]
+    started = time.monotonic()
+    result = await weeek_service.delete_tasks_bulk(
+        task_ids, concurrency=concurrency, rate_limit=rate_limit,
+    )
+    elapsed = time.monotonic() - started
+    _print_result("delete", elapsed, len(task_ids),
+                  f"удалено {len(result['deleted'])}, ошибок {len(result['failed'])}")
+    return result
+
+
+async def bench_attach(fake: FakeWeeek, files: int, size_kb: int, concurrency: int) -> int:
+    project_id = fake.projects[0]["id"] if fake.projects else None
+    column_id = next(iter(fake.columns.values()))[0]["id"] if fake.columns else None
+    task = fake._add_task("bench attachments", project_id, column_id)
+    payload = os.urandom(size_kb * 1024)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def upload(i: int) -> bool:
+        async with semaphore:
+            r = await weeek_service.upload_attachment(str(task["id"]), payload, f"file_{i}.bin")
+            return bool(r.get("success"))
+
+    started = time.monotonic()
+    ok = sum(await asyncio.gather(*(upload(i) for i in range(files))))
+    elapsed = time.monotonic() - started
+    mb_per_s = ok * size_kb / 1024 / elapsed if elapsed > 0 else 0
+    _print_result("attach", elapsed, files, f"успешно {ok}, {mb_per_s:.1f} МБ/с")
+    return ok
+
+
+async def run(args):
+    fake = FakeWeeek(
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed,
+    ).seed(boards=args.boards, columns_per_board=args.columns, tasks=args.tasks)
+    base_url = await fake.start()
+
+    # Настоящий Weeek и рабочие данные не трогаем: клиент — на стенд, данные — во временную папку
+    weeek_service.BASE_URL = base_url
+    weeek_service.WEEEK_API_KEY = "bench"
+    json_store.DATA_DIR = tempfile.mkdtemp(prefix="weeek_bench_")
+    json_store.init_store()
+
+    print(f"Стенд {base_url}: досок {args.boards}, задач {args.tasks}, "
+          f"latency {args.latency}s, error_rate {args.error_rate}, rate_limit {args.rate_limit or '∞'}")
+    scenarios = [args.only] if args.only else ["setup", "delete", "attach"]
+    try:
+        for name in scenarios:
+            metrics.reset()
+            if name == "setup":
+                await bench_setup(fake)
+            elif name == "delete":
+                await bench_delete(fake, args.concurrency, args.client_rate)
+            elif name == "attach":
+                await bench_attach(fake, args.files, args.size, args.concurrency)
+            _print_weeek_metrics()
+    finally:
+        await weeek_service.close_client()
+        await fake.stop()
+    print("  запросов к стенду: " + ", ".join(f"{k}={v}" for k, v in sorted(fake.requests.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк Weeek-клиента на локальном стенде")
+    parser.add_argument("--only", choices=["setup", "delete", "attach"])
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка стенда, сек")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="лимит стенда, запросов/сек (429)")
+    parser.add_argument("--boards", type=int, default=5)
+    parser.add_argument("--columns", type=int, default=3)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size", type=int, default=256, help="размер вложения, КБ")
+    parser.add_argument("--concurrency", type=int, default=weeek_service.WEEEK_BULK_CONCURRENCY)
+    parser.add_argument("--client-rate", type=int, default=weeek_service.WEEEK_RATE_LIMIT,
+                        help="rate_limit клиента для delete_tasks_bulk, запросов/сек (0 — без лимита)")
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 """
 import asyncio
 import sys
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
@@ -14,10 +15,92 @@ from database import init_db
 from models.admin import init_owner
 from handlers.message_router import router as message_router
 from handlers.callback_handler import router as callback_router
+from utils import metrics
 from utils.logger import set_bot
 
 
+# ─────────────────────────────────────────────
+#  Оркестратор старта: независимые шаги — параллельно,
+#  polling — как только готово ядро (хранилище + бот)
+# ─────────────────────────────────────────────
+
+_startup_started = 0.0
+_phase_times: dict[str, float] = {}
+
+
+async def _phase(name: str, coro):
+    """Выполняет шаг старта и запоминает его длительность (мс)."""
+    started = time.monotonic()
+    try:
+        return await coro
+    finally:
+        elapsed = (time.monotonic() - started) * 1000
+        _phase_times[name] = elapsed
+        metrics.observe(f"startup.{name}_ms", elapsed)
+
+
+def _print_timings(title: str):
+    total = (time.monotonic() - _startup_started) * 1000
+    phases = ", ".join(f"{name} {ms:.0f} мс" for name, ms in _phase_times.items())
+    print(f"[STARTUP] {title} за {total:.0f} мс: {phases}")
+
+
+async def _setup_weeek():
+    from services.weeek_service import setup_weeek
+    print("[STARTUP] Подключение к Weeek (в фоне)...")
+    weeek_result = await setup_weeek()
+    if weeek_result.get("success"):
+        print("[STARTUP] Weeek подключён")
+    else:
+        print(f"[STARTUP] Weeek: {weeek_result.get('error', 'не удалось подключить')} — баги без Weeek")
+    return weeek_result
+
+
+async def _notify_owner(bot: Bot, bot_username: str):
+    """Уведомление руководителя + клавиатура смены режима."""
+    try:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Рабочий режим", callback_data="mode_active"),
+                InlineKeyboardButton(text="👁 Наблюдение", callback_data="mode_observe"),
+                InlineKeyboardButton(text="💬 Чат", callback_data="mode_chat"),
+            ],
+        ])
+        await bot.send_message(
+            OWNER_TELEGRAM_ID,
+            "🟢 <b>Umbrella Bot запущен!</b>\n\n"
+            f"Бот: @{bot_username}\n"
+            f"Режим: <b>✅ Рабочий</b>\n\n"
+            "Переключить режим можно кнопками ниже или командой в чате:",
+            reply_markup=keyboard,
+        )
+    except Exception as e:
+        print(f"[STARTUP] Не удалось отправить сообщение руководителю: {e}")
+
+
+async def _background_startup(bot: Bot, bot_username: str):
+    """Шаги, которых polling не ждёт: Weeek, outbox и сообщение руководителю."""
+    async def weeek_then_outbox():
+        from services import weeek_outbox
+        try:
+            await _phase("weeek", _setup_weeek())
+        finally:
+            # Outbox стартует после Weeek: задачам нужен найденный проект
+            weeek_outbox.start_worker()
+
+    try:
+        await asyncio.gather(
+            weeek_then_outbox(),
+            _phase("owner_dm", _notify_owner(bot, bot_username)),
+        )
+    except Exception as e:
+        print(f"[STARTUP] Ошибка фонового старта: {e}")
+    _print_timings("Старт завершён полностью")
+
+
 async def main():
+    global _startup_started
+
     # === Проверка конфигурации ===
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN не задан! Скопируйте .env.example → .env и заполните.")
@@ -29,10 +112,10 @@ async def main():
 
     # === Инициализация ===
     print("[STARTUP] Запуск Umbrella Bot...")
+    _startup_started = time.monotonic()
 
-    # База данных
-    print("[STARTUP] Инициализация базы данных...")
-    await init_db()
+    # Хранилище — до всего остального: с ним работают все шаги
+    await _phase("store", init_db())
     print("[STARTUP] База данных готова")
 
     # Бот
@@ -40,33 +123,21 @@ async def main():
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    print("[STARTUP] Бот создан")
-
-    # Логгер
     set_bot(bot)
-    print("[STARTUP] Логгер инициализирован")
-
-    # Руководитель в базу
-    await init_owner()
-    print("[STARTUP] Руководитель инициализирован")
-
-    # Weeek
-    from services.weeek_service import setup_weeek
-    print("[STARTUP] Подключение к Weeek...")
-    weeek_result = await setup_weeek()
-    if weeek_result.get("success"):
-        print("[STARTUP] Weeek подключён")
-    else:
-        print(f"[STARTUP] Weeek: {weeek_result.get('error', 'не удалось подключить')} — баги без Weeek")
+    print("[STARTUP] Бот создан, логгер инициализирован")
 
     # Диспетчер
     dp = Dispatcher()
     dp.include_router(message_router)
     dp.include_router(callback_router)
-    print("[STARTUP] Роутеры подключены")
 
-    # === Информация о старте ===
-    bot_info = await bot.get_me()
+    # Независимые шаги ядра — параллельно
+    from services.game_receiver import start_game_server, stop_game_server
+    bot_info, _, _ = await asyncio.gather(
+        _phase("get_me", bot.get_me()),
+        _phase("owner", init_owner()),
+        _phase("game_server", start_game_server()),
+    )
     print(f"[STARTUP] Бот: @{bot_info.username} (ID: {bot_info.id})")
     print(f"[STARTUP] Руководитель: {OWNER_TELEGRAM_ID}")
     print(f"[STARTUP] Группа: {GROUP_ID}")
@@ -77,38 +148,26 @@ async def main():
         from config import TOPIC_IDS
         print(f"[STARTUP] Топики: {TOPIC_IDS}")
 
-    # === Уведомление руководителя + клавиатура смены режима ===
-    try:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Рабочий режим", callback_data="mode_active"),
-                InlineKeyboardButton(text="👁 Наблюдение", callback_data="mode_observe"),
-                InlineKeyboardButton(text="💬 Чат", callback_data="mode_chat"),
-            ],
-        ])
-        await bot.send_message(
-            OWNER_TELEGRAM_ID,
-            "🟢 <b>Umbrella Bot запущен!</b>\n\n"
-            f"Бот: @{bot_info.username}\n"
-            f"Режим: <b>✅ Рабочий</b>\n\n"
-            "Переключить режим можно кнопками ниже или командой в чате:",
-            reply_markup=keyboard,
-        )
-    except Exception as e:
-        print(f"[STARTUP] Не удалось отправить сообщение руководителю: {e}")
+    # Weeek, outbox и сообщение руководителю — в фоне, polling их не ждёт
+    background = asyncio.create_task(_background_startup(bot, bot_info.username))
 
+    _print_timings("Ядро готово")
     print(f"[STARTUP] Бот запущен! Режим: Рабочий")
 
-    # Game receiver (HTTP-сервер для Lua-скрипта)
-    from services.game_receiver import start_game_server, stop_game_server
-    await start_game_server()
-
     # Запускаем polling
     print("[STARTUP] Запуск polling...")
     try:
         await dp.start_polling(bot, drop_pending_updates=True)
     finally:
         print("[SHUTDOWN] Остановка бота...")
+        if not background.done():
+            background.cancel()
+            try:
+                await background
+            except asyncio.CancelledError:
+                pass
+        from services import weeek_outbox
+        await weeek_outbox.stop_worker()
         await stop_game_server()
         from services.weeek_service import close_client
         from database import close_db
@@ -118,4 +177,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -19,6 +19,16 @@ def _int_env(name: str, default: int = 0) -> int:
         sys.exit(1)
 
 
+def _float_env(name: str, default: float = 0.0) -> float:
+    """Читает число с точкой из .env с понятной ошибкой при невалидном значении."""
+    raw = os.getenv(name, str(default))
+    try:
+        return float(raw)
+    except ValueError:
+        print(f"❌ {name}={raw!r} — должно быть числом")
+        sys.exit(1)
+
+
 # === Telegram ===
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 OWNER_TELEGRAM_ID = _int_env("OWNER_TELEGRAM_ID")
@@ -32,6 +42,13 @@ else:
 
 # === Weeek ===
 WEEEK_API_KEY = os.getenv("WEEEK_API_KEY", "")
+# Адрес API — можно направить на локальный стенд (bench/fake_weeek.py)
+WEEEK_BASE_URL = os.getenv("WEEEK_BASE_URL", "https://api.weeek.net/public/v1").rstrip("/")
+# Массовые операции: сколько запросов одновременно и не чаще скольки в секунду
+WEEEK_BULK_CONCURRENCY = _int_env("WEEEK_BULK_CONCURRENCY", 4)
+WEEEK_RATE_LIMIT = _int_env("WEEEK_RATE_LIMIT", 5)
+# Сколько секунд на старте можно потратить на поиск колонок досок по задачам
+WEEEK_DISCOVERY_TIMEOUT = _int_env("WEEEK_DISCOVERY_TIMEOUT", 10)
 
 # === ID группы ===
 GROUP_ID = _int_env("GROUP_ID")
@@ -60,13 +77,27 @@ POINTS = {
 # === Модели Anthropic ===
 # Единая модель для всех задач — Haiku (дешёвая и быстрая)
 MODEL = os.getenv("MODEL", "claude-haiku-4-5-20251001")
+# Уровни моделей для агента (agent/model_router.py): простое — быстрой,
+# при сбое или неуверенном ответе — повтор на уровень выше.
+# По умолчанию все уровни = MODEL, т.е. маршрутизация ничего не меняет.
+MODEL_FAST = os.getenv("MODEL_FAST", MODEL)
+MODEL_STRONG = os.getenv("MODEL_STRONG", MODEL)
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
 
 # === Режим отладки ===
 DEBUG_TOPICS = os.getenv("DEBUG_TOPICS", "0") == "1"
 
+# === Потоковые ответы: текст появляется в Telegram по мере генерации ===
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "0") == "1"
+
+# === Отбор инструментов по намерению: в запрос идут только нужные группы ===
+TOOL_SELECTION = os.getenv("TOOL_SELECTION", "1") == "1"
+
 # === Лимиты агента ===
 MAX_TOKENS = _int_env("MAX_TOKENS", 2048)
 MAX_TOOL_ROUNDS = _int_env("MAX_TOOL_ROUNDS", 5)
+# Общий бюджет времени на один запрос к агенту, сек (0 — без ограничения)
+REQUEST_DEADLINE = _int_env("REQUEST_DEADLINE", 45)
 MAX_HISTORY = {
     "tester": 2,
     "admin": 4,
@@ -75,6 +106,33 @@ MAX_HISTORY = {
 # Лимит общей истории группового чата (в сообщениях, не парах)
 MAX_GROUP_HISTORY = _int_env("MAX_GROUP_HISTORY", 20)
 MAX_USERS_CACHE = 200
+# Сколько сообщений одного чата могут ждать своей очереди к агенту; сверх — ответ «занят»
+CHAT_QUEUE_LIMIT = _int_env("CHAT_QUEUE_LIMIT", 3)
+# Бюджет истории в токенах (оценка ≈3 символа/токен); сверх — старое сжимается в резюме
+MEMORY_TOKEN_BUDGET = _int_env("MEMORY_TOKEN_BUDGET", 3000)
+# Дешёвая модель для резюме истории
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", MODEL)
+# Кэш ответов на похожие аналитические вопросы (agent/answer_cache.py); размер 0 — выключен
+ANSWER_CACHE_SIZE = _int_env("ANSWER_CACHE_SIZE", 200)
+ANSWER_CACHE_TTL = _int_env("ANSWER_CACHE_TTL", 600)              # сек
+ANSWER_CACHE_SIMILARITY = _int_env("ANSWER_CACHE_SIMILARITY", 80)  # % совпадения основ слов
+# Сколько дней хранить учёт стоимости и задержки запросов (data/accounting/)
+ACCOUNTING_DAYS = _int_env("ACCOUNTING_DAYS", 30)
+
+# === Дневной бюджет на Claude, USD (agent/budget.py) ===
+# По мере расхода: короче ответы → короче история → дешёвая модель → только прямые команды
+LLM_DAILY_BUDGET = _float_env("LLM_DAILY_BUDGET", 5.0)   # общий (0 — без лимита)
+LLM_ROLE_BUDGETS = {                                     # по ролям (0 — только общий)
+    "owner": _float_env("LLM_BUDGET_OWNER"),
+    "admin": _float_env("LLM_BUDGET_ADMIN"),
+    "tester": _float_env("LLM_BUDGET_TESTER"),
+    "chat": _float_env("LLM_BUDGET_CHAT"),
+}
+
+# === Планировщик запросов к Claude ===
+LLM_CONCURRENCY = _int_env("LLM_CONCURRENCY", 4)   # одновременных запросов
+LLM_RPM = _int_env("LLM_RPM", 50)                  # запросов в минуту (0 — без лимита)
+LLM_TPM = _int_env("LLM_TPM", 50000)               # входных токенов в минуту (0 — без лимита)
 DUPLICATE_CHECK_LIMIT = 50
 SEARCH_BUGS_LIMIT = 20
 
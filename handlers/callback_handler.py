@@ -370,7 +370,7 @@ async def handle_bug_reject(callback: CallbackQuery):
 async def _show_board_selection(callback: CallbackQuery, bug_id: int):
     """Редактирует сообщение, подставляя кнопки выбора доски Weeek."""
     import config
-    from services.weeek_service import get_cached_boards
+    from services.weeek_service import get_cached_boards, is_available
 
     boards = get_cached_boards() if config.WEEEK_ENABLED else []
     if not boards:
@@ -398,9 +398,12 @@ async def _show_board_selection(callback: CallbackQuery, bug_id: int):
         callback_data=f"weeek_skip:{bug_id}",
     )])
 
+    prompt = "\n\n✅ <b>Подтверждён!</b> Выберите доску Weeek:"
+    if not is_available():
+        prompt += "\n⚠️ Weeek сейчас не отвечает — попробуйте позже"
     await _safe_edit(
         callback,
-        _safe_html_text(callback) + "\n\n✅ <b>Подтверждён!</b> Выберите доску Weeek:",
+        _safe_html_text(callback) + prompt,
         reply_markup=InlineKeyboardMarkup(inline_keyboard=rows),
     )
 
@@ -423,7 +426,8 @@ async def handle_weeek_board_select(callback: CallbackQuery):
 
     from services.weeek_service import get_board_columns, get_cached_boards
 
-    columns = await get_board_columns(board_id)
+    # Короткий таймаут без повторов: кнопка не должна висеть, при сбое — кэш
+    columns = await get_board_columns(board_id, fast=True)
 
     if not columns:
         # Нет колонок через API — используем кэшированную первую колонку
@@ -474,26 +478,22 @@ async def handle_weeek_col_select(callback: CallbackQuery):
 async def _create_weeek_task_and_finish(
     callback: CallbackQuery, bug_id: int, board_id: int, col_id: int | None
 ):
-    """Создаёт задачу в Weeek и обновляет сообщение руководителя."""
+    """Ставит создание задачи в outbox Weeek и сразу обновляет сообщение руководителя.
+    Задачу создаёт фоновый воркер (services/weeek_outbox), он же допишет итог в сообщение."""
     bug = await get_bug(bug_id)
     if not bug:
         await callback.answer("Баг не найден", show_alert=True)
         return
 
-    from services.weeek_service import create_task as weeek_create_task, get_cached_boards, upload_attachment
+    from services.weeek_service import get_cached_boards
+    from services import weeek_outbox
 
-    description = (
-        f"Шаги: {bug.get('steps') or bug.get('description', '')}\n"
-        f"Видео: {bug.get('youtube_link', '')}"
-    )
-    print(f"[WEEEK] Создание задачи для бага #{bug_id}, board={board_id}, col={col_id}")
-    result = await weeek_create_task(
-        title=bug.get("script_name") or bug.get("title", ""),
-        description=description,
-        tester_username="",
-        bug_id=bug_id,
-        board_column_id=col_id,
-    )
+    if bug.get("weeek_task_id"):
+        await callback.answer("Баг уже отправлен в Weeek", show_alert=True)
+        return
+    if await weeek_outbox.has_pending("create", bug_id):
+        await callback.answer("Уже в очереди на отправку", show_alert=True)
+        return
 
     board_name = "?"
     for b in get_cached_boards():
@@ -501,58 +501,35 @@ async def _create_weeek_task_and_finish(
             board_name = b.get("name", "?")
             break
 
-    if result.get("success"):
-        task_id = str(result.get("task_id", ""))
-        print(f"[WEEEK] Задача создана: task_id={task_id} для бага #{bug_id}, доска={board_name}")
-
-        # Определяем имя колонки
-        col_name = ""
-        if col_id:
-            from services.weeek_service import get_board_columns as _get_cols
-            try:
-                cols = await _get_cols(board_id)
-                for c in cols:
-                    if c.get("id") == col_id:
-                        col_name = c.get("name", "")
-                        break
-            except Exception:
-                pass
-
-        await update_bug(bug_id, weeek_task_id=task_id, weeek_board_name=board_name, weeek_column_name=col_name)
-
-        # Прикрепляем файлы из Telegram к задаче Weeek
-        from handlers.bug_handler import _get_bug_files
-        bug_files = _get_bug_files(bug)
-        if bug_files and task_id:
-            bot = get_bot()
-            from io import BytesIO
-            ext_map = {"photo": ".jpg", "video": ".mp4", "document": ""}
-            for f in bug_files:
-                try:
-                    tg_file = await bot.get_file(f["file_id"])
-                    buffer = BytesIO()
-                    await bot.download_file(tg_file.file_path, buffer)
-                    file_bytes = buffer.getvalue()
-
-                    if tg_file.file_path:
-                        filename = tg_file.file_path.split("/")[-1]
-                    else:
-                        filename = f"bug_{bug_id}{ext_map.get(f.get('file_type', ''), '')}"
-
-                    await upload_attachment(task_id, file_bytes, filename)
-                    print(f"[WEEEK] Файл прикреплён: {filename} к задаче #{task_id}")
-                except Exception as e:
-                    print(f"[WEEEK] ERROR: не удалось прикрепить файл к задаче #{task_id}: {e}")
+    description = (
+        f"Шаги: {bug.get('steps') or bug.get('description', '')}\n"
+        f"Видео: {bug.get('youtube_link', '')}"
+    )
+    msg = callback.message
+    base_html = _safe_html_text(callback)
+    print(f"[WEEEK] В очередь: задача для бага #{bug_id}, board={board_id}, col={col_id}")
+    await weeek_outbox.enqueue(
+        "create", bug_id,
+        {
+            "title": bug.get("script_name") or bug.get("title", ""),
+            "description": description,
+            "board_id": board_id,
+            "board_name": board_name,
+            "column_id": col_id,
+        },
+        notify={
+            "chat_id": msg.chat.id,
+            "message_id": msg.message_id,
+            "is_media": bool(msg.photo or msg.video or msg.document),
+            "base_html": base_html,
+        },
+    )
 
-        await _safe_edit(
-            callback,
-            _safe_html_text(callback) + f"\n\n📋 Отправлен в Weeek: <b>«{html.escape(board_name)}»</b> ✅",
-        )
-        await callback.answer(f"Задача создана в {board_name}")
-    else:
-        await callback.answer(
-            f"Ошибка Weeek: {result.get('error', '?')}", show_alert=True
-        )
+    await _safe_edit(
+        callback,
+        base_html + f"\n\n⏳ Отправляется в Weeek: <b>«{html.escape(board_name)}»</b>",
+    )
+    await callback.answer(f"Задача ставится в {board_name}")
 
 
 @router.callback_query(F.data.startswith("weeek_skip:"))
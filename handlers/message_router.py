@@ -8,12 +8,14 @@ import time
 import html
 from aiogram import Router, F, Bot
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from config import GROUP_ID, TOPIC_IDS, TOPIC_NAMES, DEBUG_TOPICS, OBSERVE_REPLY
+from config import GROUP_ID, TOPIC_IDS, TOPIC_NAMES, DEBUG_TOPICS, OBSERVE_REPLY, STREAM_REPLIES
 from models.admin import is_admin, is_owner
 from models.tester import get_or_create_tester, get_tester_by_id
 from agent.brain import process_message, process_chat_message
 from services.rating_service import get_rating, format_rating_message
+from utils import accounting
 from utils.logger import log_info
+from utils.stream_reply import create_stream_reply
 from json_store import async_load, async_update, BUGS_FILE, TASKS_FILE
 
 router = Router()
@@ -182,13 +184,16 @@ async def handle_group_message(message: Message, bot: Bot):
             await bot.send_chat_action(message.chat.id, "typing")
         except Exception:
             pass
-        try:
-            response = await process_chat_message(text=message.text, caller_id=user.id)
-            if response:
-                await _safe_reply(message, response, parse_mode="HTML")
-        except Exception as e:
-            print(f"[ROUTE] chat ERROR: {e}")
-            await message.reply(f"⚠️ Ошибка: <code>{str(e)[:300]}</code>", parse_mode="HTML")
+        async with accounting.request(user.id, user.username or str(user.id), "chat",
+                                      message.chat.id, kind="chat"):
+            try:
+                response = await process_chat_message(text=message.text, caller_id=user.id)
+                if response:
+                    async with accounting.timed("telegram"):
+                        await _safe_reply(message, response, parse_mode="HTML")
+            except Exception as e:
+                print(f"[ROUTE] chat ERROR: {e}")
+                await message.reply(f"⚠️ Ошибка: <code>{str(e)[:300]}</code>", parse_mode="HTML")
         return
 
     # === Авторегистрация ===
@@ -287,6 +292,12 @@ async def handle_group_message(message: Message, bot: Bot):
     if await _handle_weeek_toggle(message, user):
         print(f"[ROUTE] → weeek_toggle")
         return
+    if await _handle_metrics_command(message, user):
+        print(f"[ROUTE] → metrics")
+        return
+    if await _handle_usage_command(message, user):
+        print(f"[ROUTE] → usage")
+        return
 
     # === Ожидание ввода своего значения награды ===
     if await _handle_pending_reward_input(message, user):
@@ -330,23 +341,32 @@ async def handle_group_message(message: Message, bot: Bot):
 
     print(f"[ROUTE] → brain ({role}) \"{message.text[:80]}\"")
 
-    try:
-        response = await process_message(
-            text=text_to_send,
-            username=user.username or user.full_name or str(user.id),
-            role=role,
-            topic=topic,
-            caller_id=user.id,
-            chat_id=message.chat.id,
-        )
-        if response:
-            await _safe_reply(message, response, parse_mode="HTML")
-    except Exception as e:
-        print(f"[ROUTE] brain ERROR: {e}")
-        await message.reply(
-            f"⚠️ Ошибка при обработке.\n<code>{str(e)[:300]}</code>",
-            parse_mode="HTML"
-        )
+    username = user.username or user.full_name or str(user.id)
+    push, finish = create_stream_reply(message) if STREAM_REPLIES else (None, None)
+    async with accounting.request(user.id, username, role, message.chat.id):
+        try:
+            response = await process_message(
+                text=text_to_send,
+                username=username,
+                role=role,
+                topic=topic,
+                caller_id=user.id,
+                chat_id=message.chat.id,
+                on_text=push,
+            )
+            async with accounting.timed("telegram"):
+                if finish and await finish(response):
+                    return
+                if response:
+                    await _safe_reply(message, response, parse_mode="HTML")
+        except Exception as e:
+            print(f"[ROUTE] brain ERROR: {e}")
+            if finish:
+                await finish(None)
+            await message.reply(
+                f"⚠️ Ошибка при обработке.\n<code>{str(e)[:300]}</code>",
+                parse_mode="HTML"
+            )
 
 
 async def _handle_draft_task_edit(message: Message, user) -> bool:
@@ -442,7 +462,7 @@ async def _handle_memory_reset(message: Message, user) -> bool:
     if role not in ("owner", "admin"):
         return False
     from agent.brain import clear_all_history
-    clear_all_history()
+    await clear_all_history()
     print(f"[MEMORY] Полный сброс памяти by @{user.username}")
     await message.reply("🧹 Память полностью очищена. Все диалоги сброшены.", parse_mode="HTML")
     return True
@@ -474,6 +494,66 @@ async def _handle_weeek_toggle(message: Message, user) -> bool:
     return False
 
 
+_METRICS_KEYWORDS = ("метрики", "metrics")
+
+
+async def _handle_metrics_command(message: Message, user) -> bool:
+    """Руководитель: «метрики» / «метрики weeek» — снимок метрик процесса."""
+    if not message.text:
+        return False
+    if not await is_owner(user.id):
+        return False
+
+    # Текст без @упоминания бота
+    words = [w for w in message.text.lower().split() if not w.startswith("@")]
+    if not words or words[0] not in _METRICS_KEYWORDS:
+        return False
+
+    from utils.metrics import format_metrics
+    prefix = words[1] if len(words) > 1 else ""
+    await _safe_reply(message, format_metrics(prefix), parse_mode="HTML")
+    return True
+
+
+_USAGE_KEYWORDS = ("расходы", "usage")
+_USAGE_EXPORT_KEYWORDS = ("экспорт", "выгрузка", "export")
+
+
+async def _handle_usage_command(message: Message, user) -> bool:
+    """
+    Руководитель: «расходы [дней]» — стоимость и время запросов к агенту,
+    «расходы экспорт [дней]» — JSONL-файл с записью по каждому запросу.
+    """
+    if not message.text:
+        return False
+    if not await is_owner(user.id):
+        return False
+
+    words = [w for w in message.text.lower().split() if not w.startswith("@")]
+    if not words or words[0] not in _USAGE_KEYWORDS:
+        return False
+
+    export = len(words) > 1 and words[1] in _USAGE_EXPORT_KEYWORDS
+    days = next((int(w) for w in words[1:] if w.isdigit()), 1)
+
+    if not export:
+        from agent import budget
+        report = await accounting.format_report(days)
+        await _safe_reply(message, f"{report}\n\n{await budget.format_status()}", parse_mode="HTML")
+        return True
+
+    from aiogram.types import BufferedInputFile
+    data = await accounting.export_jsonl(days)
+    if not data:
+        await message.reply("Записей за этот период нет.")
+        return True
+    filename = f"usage_{time.strftime('%Y-%m-%d')}_{days}d.jsonl"
+    count = data.count(b"\n")
+    await message.reply_document(BufferedInputFile(data, filename=filename),
+                                 caption=f"Запросы за {days} дн.: {count}")
+    return True
+
+
 _STATS_KEYWORDS = ("статистика", "стата", "мои баллы", "мой рейтинг", "мои очки", "сколько баллов", "мой стат")
 _RATING_KEYWORDS = ("рейтинг", "топ", "таблица", "лидеры", "leaderboard")
 _REWARDS_KEYWORDS = ("настройка наград", "настроить награды", "настройки наград")
@@ -603,13 +683,16 @@ async def handle_private_message(message: Message, bot: Bot):
             await bot.send_chat_action(message.chat.id, "typing")
         except Exception:
             pass
-        try:
-            response = await process_chat_message(text=message.text, caller_id=user.id)
-            if response:
-                await _safe_reply(message, response, parse_mode="HTML")
-        except Exception as e:
-            print(f"[ROUTE] DM chat ERROR: {e}")
-            await message.answer(f"⚠️ Ошибка: <code>{str(e)[:300]}</code>", parse_mode="HTML")
+        async with accounting.request(user.id, user.username or str(user.id), "chat",
+                                      message.chat.id, kind="chat"):
+            try:
+                response = await process_chat_message(text=message.text, caller_id=user.id)
+                if response:
+                    async with accounting.timed("telegram"):
+                        await _safe_reply(message, response, parse_mode="HTML")
+            except Exception as e:
+                print(f"[ROUTE] DM chat ERROR: {e}")
+                await message.answer(f"⚠️ Ошибка: <code>{str(e)[:300]}</code>", parse_mode="HTML")
         return
 
     # Авторегистрация
@@ -655,6 +738,12 @@ async def handle_private_message(message: Message, bot: Bot):
     if await _handle_weeek_toggle(message, user):
         print(f"[ROUTE] DM → weeek_toggle")
         return
+    if await _handle_metrics_command(message, user):
+        print(f"[ROUTE] DM → metrics")
+        return
+    if await _handle_usage_command(message, user):
+        print(f"[ROUTE] DM → usage")
+        return
 
     # === Ожидание ввода своего значения награды ===
     if await _handle_pending_reward_input(message, user):
@@ -678,20 +767,29 @@ async def handle_private_message(message: Message, bot: Bot):
 
     print(f"[ROUTE] DM → brain ({role}) \"{message.text[:80]}\"")
 
-    try:
-        response = await process_message(
-            text=message.text,
-            username=user.username or user.full_name or str(user.id),
-            role=role,
-            topic="private",
-            caller_id=user.id,
-        )
-        if response:
-            await _safe_reply(message, response, parse_mode="HTML")
-    except Exception as e:
-        print(f"[ROUTE] DM brain ERROR: {e}")
-        await message.answer(
-            f"⚠️ Ошибка при обработке. Проверь ANTHROPIC_API_KEY в .env\n\n"
-            f"<code>{str(e)[:300]}</code>",
-            parse_mode="HTML"
-        )
+    username = user.username or user.full_name or str(user.id)
+    push, finish = create_stream_reply(message) if STREAM_REPLIES else (None, None)
+    async with accounting.request(user.id, username, role, message.chat.id):
+        try:
+            response = await process_message(
+                text=message.text,
+                username=username,
+                role=role,
+                topic="private",
+                caller_id=user.id,
+                on_text=push,
+            )
+            async with accounting.timed("telegram"):
+                if finish and await finish(response):
+                    return
+                if response:
+                    await _safe_reply(message, response, parse_mode="HTML")
+        except Exception as e:
+            print(f"[ROUTE] DM brain ERROR: {e}")
+            if finish:
+                await finish(None)
+            await message.answer(
+                f"⚠️ Ошибка при обработке. Проверь ANTHROPIC_API_KEY в .env\n\n"
+                f"<code>{str(e)[:300]}</code>",
+                parse_mode="HTML"
+            )
@@ -12,6 +12,9 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 # Один Lock на файл для конкурентного доступа
 _locks: dict[str, asyncio.Lock] = {}
 
+# Версия данных файла: растёт при каждой записи (ключ для кэшей поверх файлов)
+_versions: dict[str, int] = {}
+
 
 def _get_lock(filename: str) -> asyncio.Lock:
     if filename not in _locks:
@@ -23,6 +26,11 @@ def _filepath(filename: str) -> str:
     return os.path.join(DATA_DIR, filename)
 
 
+def get_version(filename: str) -> int:
+    """Текущая версия данных файла. Меняется при каждом save() в этом процессе."""
+    return _versions.get(filename, 0)
+
+
 def load(filename: str) -> dict | list:
     """Читает JSON-файл из data/. Возвращает dict или list."""
     path = _filepath(filename)
@@ -49,6 +57,7 @@ def save(filename: str, data: dict | list):
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
         raise
+    _versions[filename] = _versions.get(filename, 0) + 1
 
 
 async def async_load(filename: str) -> dict | list:
@@ -82,6 +91,12 @@ SETTINGS_FILE = "settings.json"
 LOGIN_MAPPING_FILE = "login_mapping.json"
 PROCESSED_MATCHES_FILE = "processed_matches.json"
 TASKS_FILE = "tasks.json"
+WEEEK_OUTBOX_FILE = "weeek_outbox.json"
+WEEEK_COLUMNS_FILE = "weeek_columns.json"
+MEMORY_FILE = "memory.json"
+ACCOUNTING_FILE = "accounting.json"
+INTENTS_FILE = "intents.json"
+BUDGET_FILE = "budget.json"
 
 # Начальные данные для каждого файла
 _DEFAULTS = {
@@ -94,6 +109,12 @@ _DEFAULTS = {
     LOGIN_MAPPING_FILE: {},
     PROCESSED_MATCHES_FILE: {},
     TASKS_FILE: {"next_id": 1, "items": {}},
+    WEEEK_OUTBOX_FILE: {"next_id": 1, "items": {}},
+    WEEEK_COLUMNS_FILE: {"project_id": None, "columns": {}},
+    MEMORY_FILE: {},
+    ACCOUNTING_FILE: {"days": {}},
+    INTENTS_FILE: {"intents": []},
+    BUDGET_FILE: {"day": None, "spent": {}, "notified": []},
 }
 
 
@@ -195,6 +195,21 @@ async def clear_weeek_task_id(bug_id: int):
     await update_bug(bug_id, weeek_task_id=None, weeek_board_name=None, weeek_column_name=None)
 
 
+async def add_weeek_attachment(bug_id: int, file_id: str):
+    """Отмечает файл бага как загруженный в задачу Weeek."""
+    key = str(bug_id)
+
+    def updater(data):
+        bug = data.get("items", {}).get(key)
+        if bug is not None:
+            attached = bug.setdefault("weeek_attachments", [])
+            if file_id not in attached:
+                attached.append(file_id)
+        return data
+
+    await async_update(BUGS_FILE, updater)
+
+
 async def get_bug_stats(period: str = "all", bug_type: str = "all") -> dict:
     """Статистика по багам за период."""
     data = await async_load(BUGS_FILE)
@@ -2,7 +2,25 @@
 CRUD-операции с тестерами (JSON-хранилище).
 """
 from datetime import datetime
-from json_store import async_load, async_save, async_update, TESTERS_FILE
+from json_store import async_load, async_save, async_update, get_version, TESTERS_FILE
+
+# Индекс username → тестер для версии testers.json: поиск без разбора файла,
+# пока он не менялся. Прогревается заранее — agent/brain.py (упомянутые @username).
+_username_index: tuple[int, dict[str, dict]] | None = None
+
+
+async def _get_username_index() -> dict[str, dict]:
+    global _username_index
+    version = get_version(TESTERS_FILE)
+    if _username_index is None or _username_index[0] != version:
+        data = await async_load(TESTERS_FILE)
+        index = {}
+        for t in data.values():
+            if t.get("username"):
+                index.setdefault(t["username"].lower(), t)
+        # Версия взята до чтения: запись во время чтения просто вызовет перестройку
+        _username_index = (version, index)
+    return _username_index[1]
 
 
 async def get_or_create_tester(telegram_id: int, username: str = None, full_name: str = None) -> dict:
@@ -36,11 +54,8 @@ async def get_or_create_tester(telegram_id: int, username: str = None, full_name
 async def get_tester_by_username(username: str) -> dict | None:
     """Ищет тестера по @username (без @)."""
     clean = username.lstrip("@")
-    data = await async_load(TESTERS_FILE)
-    for t in data.values():
-        if t.get("username") and t["username"].lower() == clean.lower():
-            return dict(t)
-    return None
+    t = (await _get_username_index()).get(clean.lower())
+    return dict(t) if t else None
 
 
 async def get_tester_by_id(telegram_id: int) -> dict | None:
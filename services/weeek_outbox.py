@@ -0,0 +1,383 @@
+"""
+Outbox для Weeek — очередь операций, переживающая рестарт и падения Weeek.
+
+Кнопка руководителя только кладёт операцию в data/weeek_outbox.json и сразу
+отвечает. Фоновый воркер разбирает очередь с повторами и обновляет баг
+по завершении каждой операции.
+
+Операции:
+- create  — создать задачу для бага (по успеху ставит в очередь attach на каждый файл);
+            повтор сначала ищет задачу по метке бага — POST мог пройти без ответа
+- attach  — скачать файл из Telegram и прикрепить к задаче
+- delete  — удалить задачу (когда сразу удалить не вышло)
+"""
+import asyncio
+import html
+import random
+import time
+from datetime import datetime
+from io import BytesIO
+
+from json_store import async_load, async_update, WEEEK_OUTBOX_FILE
+from models.bug import get_bug, update_bug, add_weeek_attachment
+from utils import metrics
+from utils.logger import log_info, log_error, get_bot
+
+MAX_ATTEMPTS = 8          # После стольких неудач операция помечается failed
+RETRY_BASE_DELAY = 5.0    # сек, растёт экспонентой
+RETRY_MAX_DELAY = 600.0   # не реже раза в 10 минут
+_POLL_INTERVAL = 5.0      # Как часто воркер проверяет очередь без пробуждения
+
+_wake = asyncio.Event()
+_worker_task: asyncio.Task | None = None
+
+
+# ─────────────────────────────────────────────
+#  Постановка в очередь
+# ─────────────────────────────────────────────
+
+async def enqueue(op: str, bug_id: int | None, payload: dict, notify: dict | None = None) -> int:
+    """
+    Кладёт операцию в outbox и будит воркер. Возвращает id операции.
+    notify — сообщение руководителя, которое надо обновить по итогу:
+    {"chat_id", "message_id", "is_media", "base_html"}.
+    """
+    result = {}
+
+    def updater(data):
+        op_id = data.get("next_id", 1)
+        data["next_id"] = op_id + 1
+        data.setdefault("items", {})[str(op_id)] = {
+            "id": op_id,
+            "op": op,
+            "bug_id": bug_id,
+            "payload": payload,
+            "notify": notify,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": 0.0,
+            "last_error": None,
+            "created_at": datetime.now().isoformat(),
+        }
+        result["id"] = op_id
+        return data
+
+    await async_update(WEEEK_OUTBOX_FILE, updater)
+    print(f"[OUTBOX] + {op} #{result['id']} (bug={bug_id})")
+    _wake.set()
+    return result["id"]
+
+
+async def has_pending(op: str, bug_id: int) -> bool:
+    """Есть ли незавершённая операция op для бага (защита от двойного клика)."""
+    data = await async_load(WEEEK_OUTBOX_FILE)
+    return any(
+        item.get("op") == op and item.get("bug_id") == bug_id and item.get("status") == "pending"
+        for item in data.get("items", {}).values()
+    )
+
+
+async def get_stats() -> dict:
+    """Сколько операций ждёт и сколько окончательно упало."""
+    data = await async_load(WEEEK_OUTBOX_FILE)
+    items = data.get("items", {}).values()
+    return {
+        "pending": sum(1 for i in items if i.get("status") == "pending"),
+        "failed": sum(1 for i in items if i.get("status") == "failed"),
+    }
+
+
+# ─────────────────────────────────────────────
+#  Исполнители операций
+# ─────────────────────────────────────────────
+
+async def _mark_attempted(item: dict):
+    """Запоминает, что POST уже уходил: следующая попытка сначала ищет задачу."""
+    op_key = str(item["id"])
+
+    def updater(data):
+        entry = data.get("items", {}).get(op_key)
+        if entry is not None:
+            entry["create_attempted"] = True
+        return data
+
+    await async_update(WEEEK_OUTBOX_FILE, updater)
+    item["create_attempted"] = True
+
+
+async def _update_payload(item: dict, **fields):
+    op_key = str(item["id"])
+
+    def updater(data):
+        entry = data.get("items", {}).get(op_key)
+        if entry is not None:
+            entry["payload"].update(fields)
+        return data
+
+    await async_update(WEEEK_OUTBOX_FILE, updater)
+    item["payload"].update(fields)
+
+
+async def _run_create(item: dict) -> dict:
+    from services.weeek_service import (
+        create_task, find_task_by_bug, get_board_columns, replace_board_column,
+    )
+
+    bug_id = item["bug_id"]
+    payload = item["payload"]
+    bug = await get_bug(bug_id)
+    if not bug:
+        return {"success": True, "skipped": "баг удалён", "bug_deleted": True}
+    if bug.get("weeek_task_id"):
+        # Задача уже создана (например, повтор после рестарта) — не дублируем
+        return {"success": True, "task_id": bug["weeek_task_id"], "skipped": "уже в Weeek"}
+
+    # create — не идемпотентный POST: если прошлая попытка могла создать задачу
+    # (ответ потерялся, процесс упал до update_bug), сначала ищем её в Weeek
+    found = None
+    if item.get("create_attempted"):
+        lookup = await find_task_by_bug(bug_id)
+        if not lookup.get("success"):
+            return lookup
+        found = lookup.get("task_id")
+        if found:
+            metrics.inc("weeek.outbox.create_reconciled")
+            print(f"[OUTBOX] Задача для бага #{bug_id} уже есть в Weeek: task_id={found}")
+
+    if found:
+        task_id = str(found)
+    else:
+        await _mark_attempted(item)
+        result = await create_task(
+            title=payload.get("title", ""),
+            description=payload.get("description", ""),
+            tester_username="",
+            bug_id=bug_id,
+            board_column_id=payload.get("column_id"),
+        )
+        if not result.get("success"):
+            status = result.get("status_code")
+            if payload.get("column_id") and status and 400 <= status < 500 and status != 429:
+                # Колонку удалили или перенесли — следующая попытка пойдёт в новую
+                new_column = await replace_board_column(payload.get("board_id"), payload["column_id"])
+                await _update_payload(item, column_id=new_column)
+            return result
+        task_id = str(result.get("task_id", ""))
+    col_name = ""
+    if payload.get("column_id"):
+        try:
+            for c in await get_board_columns(payload["board_id"], fast=True):
+                if c.get("id") == payload["column_id"]:
+                    col_name = c.get("name", "")
+                    break
+        except Exception:
+            pass
+
+    await update_bug(
+        bug_id, weeek_task_id=task_id,
+        weeek_board_name=payload.get("board_name"), weeek_column_name=col_name,
+    )
+    print(f"[OUTBOX] Задача создана: task_id={task_id} для бага #{bug_id}")
+
+    # Вложения — отдельными операциями, чтобы сбой одного файла не повторял create
+    from handlers.bug_handler import _get_bug_files
+    for f in _get_bug_files(bug):
+        await enqueue("attach", bug_id, {
+            "task_id": task_id,
+            "file_id": f["file_id"],
+            "file_type": f.get("file_type", ""),
+        })
+    return {"success": True, "task_id": task_id}
+
+
+async def _run_attach(item: dict) -> dict:
+    from services.weeek_service import upload_attachment
+
+    bot = get_bot()
+    if not bot:
+        return {"success": False, "error": "Бот ещё не инициализирован"}
+
+    payload = item["payload"]
+    tg_file = await bot.get_file(payload["file_id"])
+    buffer = BytesIO()
+    await bot.download_file(tg_file.file_path, buffer)
+
+    ext_map = {"photo": ".jpg", "video": ".mp4", "document": ""}
+    if tg_file.file_path:
+        filename = tg_file.file_path.split("/")[-1]
+    else:
+        filename = f"bug_{item['bug_id']}{ext_map.get(payload.get('file_type', ''), '')}"
+
+    result = await upload_attachment(payload["task_id"], buffer.getvalue(), filename)
+    if result.get("success") and item.get("bug_id"):
+        await add_weeek_attachment(item["bug_id"], payload["file_id"])
+        print(f"[OUTBOX] Файл прикреплён: {filename} к задаче #{payload['task_id']}")
+    return result
+
+
+async def _run_delete(item: dict) -> dict:
+    from services.weeek_service import delete_task
+
+    task_id = str(item["payload"]["task_id"])
+    result = await delete_task(task_id)
+    if not result.get("success") and result.get("status_code") != 404:
+        return result
+
+    # Если баг ещё в БД и ссылается на эту задачу — очищаем ссылку
+    bug_id = item.get("bug_id")
+    if bug_id:
+        bug = await get_bug(bug_id)
+        if bug and str(bug.get("weeek_task_id")) == task_id:
+            await update_bug(bug_id, weeek_task_id=None, weeek_board_name=None, weeek_column_name=None)
+    return {"success": True, "task_id": task_id}
+
+
+_RUNNERS = {
+    "create": _run_create,
+    "attach": _run_attach,
+    "delete": _run_delete,
+}
+
+
+# ─────────────────────────────────────────────
+#  Воркер
+# ─────────────────────────────────────────────
+
+async def _notify(item: dict, suffix: str):
+    """Обновляет сообщение руководителя, из которого операция была поставлена."""
+    notify = item.get("notify")
+    bot = get_bot()
+    if not notify or not bot:
+        return
+    text = (notify.get("base_html") or "") + suffix
+    try:
+        if notify.get("is_media"):
+            await bot.edit_message_caption(
+                chat_id=notify["chat_id"], message_id=notify["message_id"],
+                caption=text, parse_mode="HTML",
+            )
+        else:
+            await bot.edit_message_text(
+                text=text, chat_id=notify["chat_id"], message_id=notify["message_id"],
+                parse_mode="HTML",
+            )
+    except Exception as e:
+        print(f"[OUTBOX] notify ERROR: {e}")
+
+
+async def _finish(item: dict, result: dict):
+    """Фиксирует итог попытки: удаляет выполненную или планирует повтор."""
+    op_key = str(item["id"])
+    outcome = {}
+
+    def updater(data):
+        items = data.get("items", {})
+        entry = items.get(op_key)
+        if entry is None:
+            return data
+        if result.get("success"):
+            del items[op_key]
+            outcome["status"] = "done"
+            return data
+        # Пока Weeek лежит (circuit open) — попытки не тратим
+        if not result.get("circuit_open"):
+            entry["attempts"] = entry.get("attempts", 0) + 1
+        entry["last_error"] = str(result.get("error", "?"))[:300]
+        if entry["attempts"] >= MAX_ATTEMPTS:
+            entry["status"] = "failed"
+            outcome["status"] = "failed"
+        else:
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** entry["attempts"])
+            entry["next_attempt_at"] = time.time() + random.uniform(delay / 2, delay)
+            outcome["status"] = "retry"
+        return data
+
+    await async_update(WEEEK_OUTBOX_FILE, updater)
+    status = outcome.get("status")
+    metrics.inc(f"weeek.outbox.{status}")
+
+    if status == "done" and item["op"] == "create":
+        if result.get("bug_deleted"):
+            await _notify(item, "\n\n🗑 Баг удалён — в Weeek ничего не отправлено")
+        else:
+            board = html.escape(item["payload"].get("board_name") or "?")
+            await _notify(item, f"\n\n📋 Отправлен в Weeek: <b>«{board}»</b> ✅")
+    elif status == "failed":
+        print(f"[OUTBOX] {item['op']} #{item['id']} FAILED: {result.get('error')}")
+        await log_error(
+            f"Weeek: операция {item['op']} для бага #{item.get('bug_id')} не выполнена "
+            f"после {MAX_ATTEMPTS} попыток: {result.get('error', '?')}"
+        )
+        if item["op"] == "create":
+            error = html.escape(str(result.get("error", "?")))
+            await _notify(item, f"\n\n⚠️ Не удалось отправить в Weeek: {error}")
+
+
+async def drain_once() -> int:
+    """Выполняет все операции, у которых наступило время. Возвращает сколько обработано."""
+    from services.weeek_service import is_available
+
+    data = await async_load(WEEEK_OUTBOX_FILE)
+    items = data.get("items", {})
+    pending = [i for i in items.values() if i.get("status") == "pending"]
+    metrics.set_gauge("weeek.outbox_pending", len(pending))
+
+    now = time.time()
+    due = sorted(
+        (i for i in pending if i.get("next_attempt_at", 0) <= now),
+        key=lambda i: i["id"],
+    )
+    processed = 0
+    for item in due:
+        if not is_available():
+            break
+        runner = _RUNNERS.get(item.get("op"))
+        if runner is None:
+            result = {"success": True}
+        else:
+            try:
+                result = await runner(item)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+        await _finish(item, result)
+        processed += 1
+    return processed
+
+
+async def _worker():
+    print("[OUTBOX] Воркер запущен")
+    while True:
+        # Сбрасываем до прохода: enqueue во время прохода разбудит сразу
+        _wake.clear()
+        try:
+            await drain_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[OUTBOX] ERROR: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_worker():
+    """Запускает фоновый воркер outbox (идемпотентно)."""
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(_worker())
+
+
+async def stop_worker():
+    """Останавливает воркер. Незавершённые операции остаются в файле."""
+    global _worker_task
+    if _worker_task and not _worker_task.done():
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+    _worker_task = None
+    stats = await get_stats()
+    if stats["pending"]:
+        await log_info(f"Weeek outbox: {stats['pending']} операций ждут следующего запуска")
@@ -2,15 +2,50 @@
 Сервис интеграции с Weeek — создание задач из багрепортов.
 
 API docs: https://developers.weeek.net/
-Base URL: https://api.weeek.net/public/v1
+Base URL: https://api.weeek.net/public/v1 (переопределяется WEEEK_BASE_URL)
 """
+import asyncio
+import random
+import re
+import time
+
+from datetime import datetime
+
 import httpx
-from config import WEEEK_API_KEY
+from config import (
+    WEEEK_API_KEY, WEEEK_BASE_URL, WEEEK_BULK_CONCURRENCY, WEEEK_RATE_LIMIT,
+    WEEEK_DISCOVERY_TIMEOUT,
+)
+from json_store import async_load, async_save, WEEEK_COLUMNS_FILE
+from utils import metrics
 
 WEEEK_PROJECT_ID = None
 WEEEK_BOARDS = []  # Кэш досок: [{"id": 1, "name": "ПАТЧ"}, ...]
 
-BASE_URL = "https://api.weeek.net/public/v1"
+BASE_URL = WEEEK_BASE_URL
+
+# === Таймауты и повторы ===
+DEFAULT_TIMEOUT = 15.0   # Фоновые операции
+FAST_TIMEOUT = 5.0       # Старт бота и кнопки руководителя — лучше быстро сдаться
+MAX_RETRIES = 2          # Повторов сверх первой попытки (только идемпотентные методы)
+RETRY_BASE_DELAY = 0.5   # Базовая задержка экспоненты, сек
+RETRY_MAX_DELAY = 8.0    # Дольше не ждём — ни по экспоненте, ни по Retry-After
+
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# === Circuit breaker ===
+# closed → (BREAKER_THRESHOLD сбоев подряд) → open → (BREAKER_COOLDOWN сек) →
+# half_open: пропускаем один пробный запрос; успех → closed, сбой → снова open.
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+_breaker = {"state": "closed", "failures": 0, "opened_at": 0.0, "probe": False}
+
+# === Поиск колонок по задачам ===
+DISCOVERY_PER_PAGE = 100     # Задач на страницу
+DISCOVERY_CONCURRENCY = 3    # Страниц одновременно
+DISCOVERY_MAX_PAGES = 60     # Дальше не ищем, даже если задачи ещё есть
 
 # Shared HTTP-клиент — переиспользует TCP-соединения
 _http_client: httpx.AsyncClient | None = None
@@ -21,7 +56,7 @@ def _get_client() -> httpx.AsyncClient:
     global _http_client
     if _http_client is None or _http_client.is_closed:
         _http_client = httpx.AsyncClient(
-            timeout=15.0,
+            timeout=DEFAULT_TIMEOUT,
             headers={
                 "Authorization": f"Bearer {WEEEK_API_KEY}",
                 "Content-Type": "application/json",
@@ -30,83 +65,325 @@ def _get_client() -> httpx.AsyncClient:
     return _http_client
 
 
-async def _request(method: str, endpoint: str, data: dict = None) -> dict:
-    """Выполняет асинхронный запрос к Weeek API."""
-    if not WEEEK_API_KEY:
-        return {"error": "WEEEK_API_KEY не задан"}
+def _parse_retry_after(value: str | None) -> float | None:
+    """Retry-After в секундах (поддерживается только числовой формат)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _set_breaker_state(state: str):
+    if _breaker["state"] != state:
+        print(f"[WEEEK-API] circuit: {_breaker['state']} → {state}")
+        metrics.inc(f"weeek.circuit.{state}")
+    _breaker["state"] = state
+    metrics.set_gauge("weeek.circuit_state", state)
+
+
+def _breaker_allows() -> bool:
+    """Можно ли сейчас отправить запрос. В half_open пропускает один пробный."""
+    if _breaker["state"] == "closed":
+        return True
+    if _breaker["state"] == "open":
+        if time.monotonic() - _breaker["opened_at"] < BREAKER_COOLDOWN:
+            return False
+        _set_breaker_state("half_open")
+    # half_open: только один запрос одновременно
+    if _breaker["probe"]:
+        return False
+    _breaker["probe"] = True
+    return True
+
+
+def _record_success():
+    _breaker["failures"] = 0
+    _breaker["probe"] = False
+    _set_breaker_state("closed")
+
+
+def _record_failure():
+    _breaker["failures"] += 1
+    _breaker["probe"] = False
+    if _breaker["state"] == "half_open" or _breaker["failures"] >= BREAKER_THRESHOLD:
+        _breaker["opened_at"] = time.monotonic()
+        _set_breaker_state("open")
 
+
+def get_circuit_state() -> str:
+    """closed / open / half_open — для UI и метрик."""
+    if _breaker["state"] == "open" and time.monotonic() - _breaker["opened_at"] >= BREAKER_COOLDOWN:
+        return "half_open"
+    return _breaker["state"]
+
+
+def is_available() -> bool:
+    """False, пока circuit breaker открыт — Weeek недавно стабильно падал."""
+    return get_circuit_state() != "open"
+
+
+def _backoff(attempt: int, retry_after: float | None) -> float:
+    """Задержка перед повтором: Retry-After, иначе экспонента с full jitter."""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def _send(method: str, endpoint: str, data: dict | None,
+                timeout: float) -> tuple[dict, int | None, float | None]:
+    """
+    Одна попытка запроса.
+    Возвращает (результат, HTTP-статус или None при сетевой ошибке/таймауте, Retry-After).
+    """
     url = f"{BASE_URL}/{endpoint}"
     client = _get_client()
 
-    print(f"[WEEEK-API] {method} {endpoint}")
     try:
         response = await client.request(
             method=method,
             url=url,
             json=data,
+            timeout=timeout,
         )
         response.raise_for_status()
         print(f"[WEEEK-API] → {response.status_code}")
         # DELETE может вернуть 204 без тела
         if response.status_code == 204 or not response.content:
-            return {"success": True}
-        return response.json()
+            return {"success": True}, response.status_code, None
+        return response.json(), response.status_code, None
     except httpx.HTTPStatusError as e:
-        print(f"[WEEEK-API] ERROR {e.response.status_code}: {e.response.text[:200]}")
+        status = e.response.status_code
+        print(f"[WEEEK-API] ERROR {status}: {e.response.text[:200]}")
         try:
-            return e.response.json()
+            body = e.response.json()
         except Exception:
-            return {"error": f"HTTP {e.response.status_code}"}
+            body = None
+        # Тело ошибки Weeek + статус, чтобы вызывающий код мог отличить 404/429
+        result = body if isinstance(body, dict) else {}
+        result.setdefault("error", f"HTTP {status}")
+        result["status_code"] = status
+        retry_after = _parse_retry_after(e.response.headers.get("Retry-After"))
+        if status == 429:
+            result["retry_after"] = retry_after
+        return result, status, retry_after
     except httpx.TimeoutException:
         print("[WEEEK-API] ERROR: timeout")
-        return {"error": "Timeout"}
+        return {"error": "Timeout"}, None, None
     except Exception as e:
         print(f"[WEEEK-API] ERROR: {e}")
-        return {"error": str(e)}
+        return {"error": str(e)}, None, None
+
+
+async def _request(method: str, endpoint: str, data: dict = None,
+                   timeout: float = DEFAULT_TIMEOUT, retries: int = MAX_RETRIES) -> dict:
+    """
+    Выполняет асинхронный запрос к Weeek API.
+
+    Идемпотентные методы повторяются до retries раз на таймаут, сетевую
+    ошибку, 429 и 5xx (Retry-After или экспонента с jitter). Пока circuit
+    breaker открыт — сразу возвращает ошибку, не дёргая API.
+    """
+    if not WEEEK_API_KEY:
+        return {"error": "WEEEK_API_KEY не задан"}
+
+    attempts = 1 + (max(0, retries) if method.upper() in _IDEMPOTENT_METHODS else 0)
+    result: dict = {}
 
+    for attempt in range(attempts):
+        if not _breaker_allows():
+            metrics.inc("weeek.short_circuited")
+            print(f"[WEEEK-API] {method} {endpoint} — circuit open, пропуск")
+            return {"error": "Weeek временно недоступен", "circuit_open": True}
 
-async def get_projects() -> list:
+        print(f"[WEEEK-API] {method} {endpoint}" + (f" (повтор {attempt})" if attempt else ""))
+        metrics.inc("weeek.requests")
+        started = time.monotonic()
+        try:
+            result, status, retry_after = await _send(method, endpoint, data, timeout)
+        except BaseException:
+            # Отмена посреди пробного запроса (wait_for, дедлайн запроса):
+            # освобождаем пробу, иначе breaker навсегда застрянет в half_open
+            _breaker["probe"] = False
+            raise
+        metrics.observe("weeek.latency_ms", (time.monotonic() - started) * 1000)
+
+        # Сбой самого Weeek (сеть, таймаут, 5xx) — считаем для breaker.
+        # 4xx, включая 429, — Weeek жив, breaker не трогаем.
+        server_failure = status is None or status >= 500
+        if server_failure:
+            metrics.inc("weeek.errors")
+            _record_failure()
+        else:
+            _record_success()
+
+        retryable = status is None or status in _RETRY_STATUSES
+        if not retryable or attempt == attempts - 1:
+            break
+        wait = _backoff(attempt, retry_after)
+        if wait > RETRY_MAX_DELAY:
+            print(f"[WEEEK-API] Retry-After {wait}с — слишком долго, не повторяем")
+            break
+        metrics.inc("weeek.retries")
+        await asyncio.sleep(wait)
+
+    return result
+
+
+# Интерактивные вызовы (старт, кнопки руководителя): короткий таймаут, без повторов
+_FAST = {"timeout": FAST_TIMEOUT, "retries": 0}
+
+
+async def get_projects(fast: bool = False) -> list:
     """GET /tm/projects"""
-    result = await _request("GET", "tm/projects")
+    result = await _request("GET", "tm/projects", **(_FAST if fast else {}))
     return result.get("projects", [])
 
 
-async def get_boards(project_id: int = None) -> list:
+async def get_boards(project_id: int = None, fast: bool = False) -> list:
     """GET /tm/boards"""
+    opts = _FAST if fast else {}
     if project_id:
-        result = await _request("GET", f"tm/boards?projectId={project_id}")
+        result = await _request("GET", f"tm/boards?projectId={project_id}", **opts)
         boards = result.get("boards", [])
-        if boards:
+        if boards or result.get("circuit_open"):
             return boards
-    result = await _request("GET", "tm/boards")
+    result = await _request("GET", "tm/boards", **opts)
     return result.get("boards", [])
 
 
-async def find_columns_from_tasks(project_id: int) -> dict:
+async def _fetch_tasks_page(project_id: int, offset: int, per_page: int,
+                            opts: dict) -> tuple[list, bool, bool]:
+    """Одна страница задач проекта. Возвращает (задачи, есть_ещё, ошибка)."""
+    result = await _request(
+        "GET", f"tm/tasks?projectId={project_id}&perPage={per_page}&offset={offset}", **opts,
+    )
+    if "error" in result and not result.get("success"):
+        return [], False, True
+    tasks = result.get("tasks", [])
+    has_more = result.get("hasMore")
+    if has_more is None:
+        has_more = len(tasks) >= per_page
+    return tasks, bool(has_more), False
+
+
+async def find_columns_from_tasks(project_id: int, board_ids: list | None = None,
+                                  fast: bool = False,
+                                  budget: float = WEEEK_DISCOVERY_TIMEOUT) -> dict:
     """
     Находит boardColumnId для каждой доски из существующих задач.
+
+    Обходит задачи постранично: первая страница отдельно (у небольших
+    проектов на ней всё и заканчивается), дальше — пачками по
+    DISCOVERY_CONCURRENCY страниц параллельно. Останавливается, как только
+    у всех board_ids есть колонка, задачи кончились, случилась ошибка или
+    вышел budget секунд — тогда возвращает то, что успел найти.
+
     Возвращает {board_id: first_column_id, ...}
     """
-    result = await _request("GET", f"tm/tasks?projectId={project_id}&perPage=50")
-    tasks = result.get("tasks", [])
-    board_columns = {}
-    for task in tasks:
-        bid = task.get("boardId")
-        bcid = task.get("boardColumnId")
-        if bid and bcid and bid not in board_columns:
-            board_columns[bid] = bcid
+    opts = _FAST if fast else {}
+    wanted = set(board_ids) if board_ids else None
+    board_columns: dict = {}
+    started = time.monotonic()
+    deadline = started + budget
+    offset = 0
+    pages = 0
+
+    def all_found() -> bool:
+        return wanted is not None and wanted <= board_columns.keys()
+
+    while pages < DISCOVERY_MAX_PAGES and not all_found():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"[WEEEK-API] Поиск колонок: вышло время ({budget}с), страниц {pages}")
+            break
+        wave_size = 1 if pages == 0 else min(DISCOVERY_CONCURRENCY, DISCOVERY_MAX_PAGES - pages)
+        offsets = [offset + i * DISCOVERY_PER_PAGE for i in range(wave_size)]
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(
+                    _fetch_tasks_page(project_id, o, DISCOVERY_PER_PAGE, opts) for o in offsets
+                )),
+                timeout=remaining,
+            )
+        except asyncio.TimeoutError:
+            print(f"[WEEEK-API] Поиск колонок: вышло время ({budget}с), страниц {pages}")
+            break
+        pages += wave_size
+        offset += wave_size * DISCOVERY_PER_PAGE
+
+        more = True
+        for tasks, has_more, error in results:
+            for task in tasks:
+                bid = task.get("boardId")
+                bcid = task.get("boardColumnId")
+                if bid and bcid and bid not in board_columns:
+                    board_columns[bid] = bcid
+            if error or not has_more:
+                more = False
+        if not more:
+            break
+
+    metrics.observe("weeek.discovery_ms", (time.monotonic() - started) * 1000)
+    metrics.set_gauge("weeek.discovery_pages", pages)
     return board_columns
 
 
-async def get_board_columns(board_id: int) -> list:
+async def _load_column_cache(project_id) -> dict:
+    """Сохранённые колонки {board_id: column_id} — только если проект тот же."""
+    data = await async_load(WEEEK_COLUMNS_FILE)
+    if not data or data.get("project_id") != project_id:
+        return {}
+    return {int(bid): cid for bid, cid in data.get("columns", {}).items()}
+
+
+async def _save_column_cache(project_id, col_map: dict):
+    await async_save(WEEEK_COLUMNS_FILE, {
+        "project_id": project_id,
+        "columns": {str(bid): cid for bid, cid in col_map.items()},
+        "updated_at": datetime.now().isoformat(),
+    })
+
+
+async def replace_board_column(board_id: int, column_id) -> int | None:
+    """
+    Weeek отверг создание задачи в колонке (её могли удалить или перенести):
+    ищет колонку доски заново по задачам и обновляет data/weeek_columns.json
+    и кэш досок. Задачи всё ещё в этой колонке — значит, она жива и ошибка в
+    другом: колонка остаётся. Возвращает колонку для следующей попытки или None.
+    """
+    found = await find_columns_from_tasks(WEEEK_PROJECT_ID, board_ids=[board_id], fast=True)
+    new_id = found.get(board_id)
+    if new_id == column_id:
+        return column_id
+
+    print(f"[WEEEK-API] Колонка {column_id} доски {board_id} отвергнута → {new_id}")
+    metrics.inc("weeek.column_invalidated")
+    saved = await _load_column_cache(WEEEK_PROJECT_ID)
+    board = next((b for b in WEEEK_BOARDS if b.get("id") == board_id), None)
+    if new_id:
+        saved[board_id] = new_id
+        if board is not None:
+            board["_first_column_id"] = new_id
+    else:
+        saved.pop(board_id, None)
+        if board is not None:
+            board.pop("_first_column_id", None)
+    await _save_column_cache(WEEEK_PROJECT_ID, saved)
+    return new_id
+
+
+async def get_board_columns(board_id: int, fast: bool = False) -> list:
     """Возвращает список колонок доски. Пробует несколько вариантов эндпоинта."""
+    opts = _FAST if fast else {}
     # Вариант 1: tm/board-columns?boardId=
-    result = await _request("GET", f"tm/board-columns?boardId={board_id}")
+    result = await _request("GET", f"tm/board-columns?boardId={board_id}", **opts)
     cols = result.get("boardColumns") or result.get("columns") or []
-    if cols:
+    if cols or result.get("circuit_open"):
         return cols
     # Вариант 2: tm/boards/{board_id} — поле columns внутри объекта доски
-    result = await _request("GET", f"tm/boards/{board_id}")
+    result = await _request("GET", f"tm/boards/{board_id}", **opts)
     board = result.get("board") or result.get("data") or {}
     return board.get("columns") or board.get("boardColumns") or []
 
@@ -121,6 +398,10 @@ async def upload_attachment(task_id: str, file_bytes: bytes, filename: str) -> d
     if not WEEEK_API_KEY:
         return {"error": "WEEEK_API_KEY не задан", "success": False}
 
+    if not _breaker_allows():
+        metrics.inc("weeek.short_circuited")
+        return {"success": False, "error": "Weeek временно недоступен", "circuit_open": True}
+
     url = f"{BASE_URL}/tm/tasks/{task_id}/attachments"
 
     try:
@@ -133,15 +414,27 @@ async def upload_attachment(task_id: str, file_bytes: bytes, filename: str) -> d
                 files={"files[]": (filename, file_bytes)},
             )
         response.raise_for_status()
+        _record_success()
         return {"success": True}
     except httpx.HTTPStatusError as e:
         print(f"❌ Weeek upload {e.response.status_code}: {e.response.text[:200]}")
-        return {"success": False, "error": f"HTTP {e.response.status_code}"}
+        if e.response.status_code >= 500:
+            _record_failure()
+        else:
+            _record_success()
+        return {"success": False, "error": f"HTTP {e.response.status_code}",
+                "status_code": e.response.status_code}
     except Exception as e:
         print(f"❌ Weeek upload ошибка: {e}")
+        _record_failure()
         return {"success": False, "error": str(e)}
 
 
+def _bug_marker(bug_id: int) -> str:
+    """Метка бага в описании задачи — по ней find_task_by_bug находит уже созданную."""
+    return f"Внутренний ID: {bug_id}"
+
+
 async def create_task(title: str, description: str,
                       tester_username: str = "", bug_id: int = 0,
                       board_column_id: int = None) -> dict:
@@ -157,7 +450,7 @@ async def create_task(title: str, description: str,
         f"---\n"
         f"Тип: Баг\n"
         f"Автор: @{tester_username}\n"
-        f"Внутренний ID: {bug_id}"
+        f"{_bug_marker(bug_id)}"
     )
 
     task_data = {
@@ -175,8 +468,13 @@ async def create_task(title: str, description: str,
 
     result = await _request("POST", "tm/tasks", task_data)
 
-    if "error" in result and "success" not in result:
-        return {"success": False, "error": result.get("error", "Неизвестная ошибка")}
+    if "error" in result and not result.get("success"):
+        return {
+            "success": False,
+            "error": result.get("error", "Неизвестная ошибка"),
+            "status_code": result.get("status_code"),
+            "circuit_open": result.get("circuit_open", False),
+        }
 
     task = result.get("task", {})
     return {
@@ -186,16 +484,124 @@ async def create_task(title: str, description: str,
     }
 
 
-async def delete_task(task_id: str) -> dict:
+async def find_task_by_bug(bug_id: int) -> dict:
+    """
+    Ищет в проекте задачу, созданную для бага (по метке в описании).
+
+    Нужна outbox перед повтором create: POST мог дойти до Weeek, а ответ —
+    потеряться. Возвращает {"success": True, "task_id": id или None};
+    при ошибке чтения — {"success": False, ...}: повторять создание нельзя.
+    """
+    if not WEEEK_PROJECT_ID:
+        return {"success": True, "task_id": None}
+    marker = re.compile(rf"{re.escape(_bug_marker(bug_id))}(?!\d)")
+    offset = 0
+    for _ in range(DISCOVERY_MAX_PAGES):
+        tasks, has_more, error = await _fetch_tasks_page(WEEEK_PROJECT_ID, offset, DISCOVERY_PER_PAGE, {})
+        if error:
+            return {"success": False, "error": "Не удалось проверить задачи Weeek"}
+        for task in tasks:
+            if marker.search(task.get("description") or ""):
+                return {"success": True, "task_id": task.get("id")}
+        if not has_more:
+            break
+        offset += DISCOVERY_PER_PAGE
+    return {"success": True, "task_id": None}
+
+
+async def delete_task(task_id: str, retries: int = MAX_RETRIES) -> dict:
     """DELETE /tm/tasks/{task_id} — удаляет задачу из Weeek."""
     if not task_id:
         return {"error": "task_id пустой", "success": False}
-    result = await _request("DELETE", f"tm/tasks/{task_id}")
+    result = await _request("DELETE", f"tm/tasks/{task_id}", retries=retries)
     if "error" in result:
-        return {"success": False, "error": result["error"]}
+        return {
+            "success": False,
+            "error": result["error"],
+            "status_code": result.get("status_code"),
+            "retry_after": result.get("retry_after"),
+            "circuit_open": result.get("circuit_open", False),
+        }
     return {"success": True, "task_id": task_id}
 
 
+async def delete_tasks_bulk(task_ids: list[str], on_progress=None,
+                            concurrency: int = WEEEK_BULK_CONCURRENCY,
+                            rate_limit: int = WEEEK_RATE_LIMIT,
+                            max_attempts: int = 3) -> dict:
+    """
+    Параллельно удаляет задачи из Weeek.
+
+    Не больше concurrency запросов одновременно и не чаще rate_limit в секунду.
+    Повторы делает сам движок: на 429 на паузу ставятся все воркеры
+    (Retry-After или экспонента), на 5xx/таймаут ждёт только эта задача.
+    404 считается успехом — задачи в Weeek уже нет. Открытый circuit
+    breaker — сразу ошибка, без повторов.
+    on_progress(done, total, deleted, failed) — async-колбэк после каждой задачи.
+
+    Возвращает {"deleted": [task_id, ...], "failed": {task_id: error, ...}}.
+    """
+    total = len(task_ids)
+    deleted: list[str] = []
+    failed: dict[str, str] = {}
+    if not total:
+        return {"deleted": deleted, "failed": failed}
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    interval = 1.0 / rate_limit if rate_limit > 0 else 0.0
+    pace = {"next": 0.0}
+    pace_lock = asyncio.Lock()
+
+    async def wait_slot():
+        async with pace_lock:
+            start = max(time.monotonic(), pace["next"])
+            pace["next"] = start + interval
+        delay = start - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def pause_all(seconds: float):
+        async with pace_lock:
+            pace["next"] = max(pace["next"], time.monotonic() + seconds)
+
+    async def report():
+        if on_progress is None:
+            return
+        try:
+            await on_progress(len(deleted) + len(failed), total, len(deleted), len(failed))
+        except Exception as e:
+            print(f"[WEEEK-BULK] progress ERROR: {e}")
+
+    async def worker(task_id: str):
+        async with semaphore:
+            for attempt in range(max_attempts):
+                await wait_slot()
+                r = await delete_task(task_id, retries=0)
+                status = r.get("status_code")
+                if r.get("success") or status == 404:
+                    deleted.append(task_id)
+                    break
+                retryable = not r.get("circuit_open") and (status is None or status in _RETRY_STATUSES)
+                if not retryable or attempt == max_attempts - 1:
+                    failed[task_id] = r.get("error", "?")
+                    break
+                wait = _backoff(attempt, r.get("retry_after"))
+                if status == 429:
+                    print(f"[WEEEK-BULK] 429, пауза {wait:.1f}с (задача {task_id})")
+                    await pause_all(wait)
+                else:
+                    await asyncio.sleep(wait)
+        await report()
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(str(tid)) for tid in task_ids))
+    print(
+        f"[WEEEK-BULK] Удалено {len(deleted)}/{total}, ошибок {len(failed)} "
+        f"за {time.monotonic() - started:.1f}с"
+    )
+    return {"deleted": deleted, "failed": failed}
+
+
 async def setup_weeek() -> dict:
     """Инициализация: находит проект и кэширует доски."""
     global WEEEK_PROJECT_ID, WEEEK_BOARDS
@@ -203,9 +609,12 @@ async def setup_weeek() -> dict:
     if not WEEEK_API_KEY:
         return {"error": "WEEEK_API_KEY не задан"}
 
+    # Все вызовы — с коротким таймаутом и без повторов: старт не должен висеть
     # 1. Проекты
-    projects = await get_projects()
+    projects = await get_projects(fast=True)
     if not projects:
+        if not is_available():
+            return {"error": "Weeek недоступен"}
         return {"error": "Нет проектов в Weeek"}
 
     WEEEK_PROJECT_ID = projects[0].get("id")
@@ -213,7 +622,7 @@ async def setup_weeek() -> dict:
     print(f"  📋 Weeek проект: {proj_name} (ID: {WEEEK_PROJECT_ID})")
 
     # 2. Доски
-    boards = await get_boards(project_id=WEEEK_PROJECT_ID)
+    boards = await get_boards(project_id=WEEEK_PROJECT_ID, fast=True)
     if boards:
         WEEEK_BOARDS = boards
         names = ", ".join(b.get("name", "?") for b in boards)
@@ -221,16 +630,25 @@ async def setup_weeek() -> dict:
     else:
         print("  ⚠️ Досок нет")
 
-    # 3. Ищем колонки из задач (для кнопок)
-    col_map = await find_columns_from_tasks(WEEEK_PROJECT_ID)
+    # 3. Колонки для кнопок: сначала сохранённые, обход задач — только для остальных досок
+    board_ids = [b.get("id") for b in WEEEK_BOARDS if b.get("id")]
+    saved = await _load_column_cache(WEEEK_PROJECT_ID)
+    col_map = {bid: saved[bid] for bid in board_ids if bid in saved}
+    missing = [bid for bid in board_ids if bid not in col_map]
+    if missing and is_available():
+        found = await find_columns_from_tasks(WEEEK_PROJECT_ID, board_ids=missing, fast=True)
+        new_cols = {bid: cid for bid, cid in found.items() if bid not in col_map}
+        if new_cols:
+            col_map.update(new_cols)
+            await _save_column_cache(WEEEK_PROJECT_ID, {**saved, **col_map})
     if col_map:
         for board in WEEEK_BOARDS:
             bid = board.get("id")
             if bid in col_map:
                 board["_first_column_id"] = col_map[bid]
-        print(f"  📌 Колонки найдены для досок: {col_map}")
-    else:
-        print("  ⚠️ Колонки не найдены (создайте по 1 задаче в каждой доске вручную)")
+        print(f"  📌 Колонки найдены для досок: {col_map} (из сохранённых: {len(board_ids) - len(missing)})")
+    if len(col_map) < len(board_ids):
+        print("  ⚠️ Колонки найдены не для всех досок (создайте по 1 задаче в каждой доске вручную)")
 
     return {
         "success": True,
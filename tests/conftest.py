@@ -0,0 +1,13 @@
+"""Общие фикстуры тестов."""
+import pytest
+
+import json_store
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Пустая data/ во временной папке — тест не трогает данные бота."""
+    monkeypatch.setattr(json_store, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(json_store, "_locks", {})
+    json_store.init_store()
+    return tmp_path
@@ -0,0 +1,46 @@
+"""Кэш ответов: похожие вопросы совпадают, противоположные — нет."""
+import pytest
+
+from agent import answer_cache
+
+SCOPE = ("admin", 100)
+VERSIONS = (1, 1)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SIZE", 10)
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("кто лучший на этой неделе?", "Топ недели"),
+    ("кто лучший на этой неделе?", "лучшие за неделю"),
+    ("статистика @tester за неделю", "стата @tester за неделю"),
+])
+def test_near_duplicates_hit(stored, asked):
+    answer_cache.put(SCOPE, stored, VERSIONS, "ответ")
+    assert answer_cache.get(SCOPE, asked, VERSIONS) == "ответ"
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("сколько тестеров не активны в команде на этой неделе",
+     "сколько тестеров активны в команде на этой неделе"),
+    ("у кого больше багов за неделю", "у кого меньше багов за неделю"),
+    ("топ недели", "топ месяца"),
+    ("топ за сегодня", "топ за вчера"),
+    ("статистика @one за неделю", "статистика @two за неделю"),
+    ("неактивные 7 дней", "неактивные 14 дней"),
+])
+def test_opposite_questions_miss(stored, asked):
+    answer_cache.put(SCOPE, stored, VERSIONS, "ответ")
+    assert answer_cache.get(SCOPE, asked, VERSIONS) is None
+
+
+def test_scope_and_data_version_separate_answers():
+    answer_cache.put(SCOPE, "топ недели", VERSIONS, "ответ")
+    assert answer_cache.get(("admin", 200), "топ недели", VERSIONS) is None
+    assert answer_cache.get(("owner", 100), "топ недели", VERSIONS) is None
+    assert answer_cache.get(SCOPE, "топ недели", (1, 2)) is None
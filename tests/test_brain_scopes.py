@@ -0,0 +1,81 @@
+"""Общие ответы агента: кэш и склейка не отдают ответ одного участника другому."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from agent import answer_cache, brain
+
+CHAT_ID = -100123
+
+
+class _EchoClient:
+    """Отвечает текстом последней реплики пользователя — в группе это «@username: …»."""
+
+    def __init__(self, latency: float = 0.0):
+        self.calls = 0
+        self.latency = latency
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        last = next(m["content"] for m in reversed(kwargs["messages"])
+                    if m["role"] == "user" and isinstance(m["content"], str))
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5,
+                                cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        response = SimpleNamespace(content=[SimpleNamespace(type="text", text=f"Ответ для {last}")],
+                                   stop_reason="end_turn", usage=usage)
+        return SimpleNamespace(parse=lambda: response, headers={})
+
+
+@pytest.fixture
+def echo(monkeypatch, data_dir):
+    client = _EchoClient()
+    monkeypatch.setattr(brain, "client", client)
+    answer_cache.clear()
+    yield client
+    answer_cache.clear()
+
+
+def _ask(username: str, caller_id: int, text: str = "моя статистика"):
+    return brain.process_message(text, username, "tester", "general", caller_id, CHAT_ID)
+
+
+def test_self_referential_question_is_not_cached_across_callers(echo):
+    assert brain._is_read_only_request("моя статистика")
+
+    async def main():
+        first = await _ask("alice", 1)
+        second = await _ask("bob", 2)
+        again = await _ask("alice", 1)
+        return first, second, again
+
+    first, second, again = asyncio.run(main())
+    assert "@alice" in first
+    assert "@bob" in second
+    assert again == first
+    assert echo.calls == 2
+
+
+def test_concurrent_self_referential_questions_are_not_coalesced(echo):
+    echo.latency = 0.05
+
+    async def main():
+        return await asyncio.gather(_ask("alice", 1), _ask("bob", 2))
+
+    first, second = asyncio.run(main())
+    assert "@alice" in first
+    assert "@bob" in second
+    assert echo.calls == 2
+
+
+def test_concurrent_duplicates_from_one_caller_are_coalesced(echo):
+    echo.latency = 0.05
+
+    async def main():
+        return await asyncio.gather(_ask("alice", 1), _ask("alice", 1))
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert echo.calls == 1
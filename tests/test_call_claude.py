@@ -0,0 +1,55 @@
+"""call_claude: единственный слой повторов при сетевых сбоях."""
+import asyncio
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+from agent import brain
+
+
+class _FlakyClient:
+    """Первые failures вызовов падают с ошибкой соединения SDK, дальше — ответ."""
+
+    def __init__(self, failures: int, error=anthropic.APIConnectionError):
+        self.calls = 0
+        self.failures = failures
+        self.error = error
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error(request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5,
+                                cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        response = SimpleNamespace(content=[], stop_reason="end_turn", usage=usage)
+        return SimpleNamespace(parse=lambda: response, headers={})
+
+
+@pytest.fixture
+def no_delay(monkeypatch, data_dir):
+    monkeypatch.setattr(brain, "_retry_delay", lambda attempt, retry_after: 0.0)
+
+
+def _call(client):
+    return asyncio.run(brain.call_claude(model="test-model", max_tokens=10,
+                                         messages=[{"role": "user", "content": "hi"}]))
+
+
+@pytest.mark.parametrize("error", [anthropic.APIConnectionError, anthropic.APITimeoutError])
+def test_connection_errors_are_retried(monkeypatch, no_delay, error):
+    client = _FlakyClient(failures=2, error=error)
+    monkeypatch.setattr(brain, "client", client)
+    response = _call(client)
+    assert response.stop_reason == "end_turn"
+    assert client.calls == 3
+
+
+def test_connection_error_raised_after_last_attempt(monkeypatch, no_delay):
+    client = _FlakyClient(failures=10)
+    monkeypatch.setattr(brain, "client", client)
+    with pytest.raises(anthropic.APIConnectionError):
+        _call(client)
+    assert client.calls == 4
@@ -0,0 +1,47 @@
+"""Прямые команды: правило срабатывает только для инструментов роли."""
+import asyncio
+
+import pytest
+
+from agent import intents
+
+
+@pytest.fixture(autouse=True)
+def fresh_rules(data_dir):
+    intents.reload()
+    yield
+    intents.reload()
+
+
+def _match(text: str, role: str):
+    found = asyncio.run(intents.match(text, role))
+    return found[0]["name"] if found else None
+
+
+@pytest.mark.parametrize("text", ["статистика", "стата", "статистика за неделю", "стата багов за неделю"])
+def test_tester_does_not_get_team_or_bug_stats(text):
+    assert _match(text, "tester") is None
+
+
+def test_tester_keeps_own_commands():
+    assert _match("рейтинг", "tester") == "rating"
+    assert _match("статистика @alice", "tester") == "tester_stats"
+
+
+def test_staff_get_team_and_bug_stats():
+    assert _match("статистика", "admin") == "team_stats"
+    assert _match("статистика багов", "owner") == "bug_stats"
+
+
+def test_custom_rule_with_foreign_tool_is_skipped_for_tester(data_dir):
+    import json_store
+    json_store.save(json_store.INTENTS_FILE, {"intents": [
+        {"name": "inactive_short", "tool": "get_inactive_testers", "pattern": "афк", "args": {"days": 7}},
+    ]})
+    intents.reload()
+    assert _match("афк", "tester") is None
+    assert _match("афк", "admin") == "inactive_short"
+
+
+def test_try_direct_falls_through_to_claude_for_tester():
+    assert asyncio.run(intents.try_direct("статистика", caller_id=1, role="tester")) is None
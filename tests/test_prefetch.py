@@ -0,0 +1,39 @@
+"""Упреждающая загрузка: данные упомянутых тестеров уже в кэше инструментов."""
+import asyncio
+
+import pytest
+
+from agent import brain
+from models.admin import add_admin
+from models.tester import get_or_create_tester
+
+ADMIN_ID = 500
+
+
+@pytest.fixture
+def team(data_dir):
+    brain._tool_cache.clear()
+    brain._prefetched_keys.clear()
+
+    async def seed():
+        await add_admin(ADMIN_ID, "boss", "Boss")
+        await get_or_create_tester(1, "alice", "Alice")
+
+    asyncio.run(seed())
+    yield
+    brain._tool_cache.clear()
+    brain._prefetched_keys.clear()
+
+
+def test_prefetch_warms_stats_and_bugs_of_mentioned_tester(team):
+    asyncio.run(brain._prefetch_mentions("что по @Alice, сколько багов и варнов?", ADMIN_ID))
+    stats_key = brain._tool_cache_key("get_tester_stats", {"username": "@alice"}, ADMIN_ID)
+    bugs_key = brain._tool_cache_key("search_bugs", {"tester": "alice"}, ADMIN_ID)
+    assert brain._tool_cache_get(stats_key) is not None
+    assert brain._tool_cache_get(bugs_key) is not None
+
+
+def test_prefetch_only_selected_tools(team):
+    asyncio.run(brain._prefetch_mentions("@alice", ADMIN_ID, {"get_tester_stats"}))
+    bugs_key = brain._tool_cache_key("search_bugs", {"tester": "alice"}, ADMIN_ID)
+    assert brain._tool_cache_get(bugs_key) is None
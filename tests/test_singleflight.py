@@ -0,0 +1,91 @@
+"""Single-flight: общий результат, отмена и ошибка лидера."""
+import asyncio
+
+import pytest
+
+from utils import singleflight
+
+
+def _factory(calls: list, started: asyncio.Event, release: asyncio.Event, result="ok", error=None):
+    async def factory():
+        calls.append(result)
+        started.set()
+        await release.wait()
+        if error:
+            raise error
+        return result
+    return factory
+
+
+def test_concurrent_calls_share_leader_result():
+    async def main():
+        calls, started, release = [], asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(singleflight.do(("k", 1), _factory(calls, started, release)))
+        await started.wait()
+        follower = asyncio.create_task(singleflight.do(("k", 1), _factory(calls, asyncio.Event(), release, "own")))
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, await follower, calls
+
+    leader, follower, calls = asyncio.run(main())
+    assert leader == ("ok", False)
+    assert follower == ("ok", True)
+    assert calls == ["ok"]
+
+
+def test_leader_cancel_lets_follower_run_own_factory():
+    async def main():
+        calls, started, release = [], asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(singleflight.do(("k", 2), _factory(calls, started, release)))
+        await started.wait()
+        follower_release = asyncio.Event()
+        follower_release.set()
+        follower = asyncio.create_task(
+            singleflight.do(("k", 2), _factory(calls, asyncio.Event(), follower_release, "own")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, calls
+
+    follower, calls = asyncio.run(main())
+    assert follower == ("own", False)
+    assert calls == ["ok", "own"]
+    assert ("k", 2) not in singleflight._inflight
+
+
+def test_leader_error_lets_follower_run_own_factory():
+    async def main():
+        calls, started, release = [], asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(singleflight.do(
+            ("k", 3), _factory(calls, started, release, error=RuntimeError("boom"))))
+        await started.wait()
+        follower_release = asyncio.Event()
+        follower_release.set()
+        follower = asyncio.create_task(
+            singleflight.do(("k", 3), _factory(calls, asyncio.Event(), follower_release, "own")))
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(RuntimeError):
+            await leader
+        return await follower, calls
+
+    follower, calls = asyncio.run(main())
+    assert follower == ("own", False)
+    assert calls == ["ok", "own"]
+
+
+def test_cancelled_follower_does_not_cancel_leader():
+    async def main():
+        calls, started, release = [], asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(singleflight.do(("k", 4), _factory(calls, started, release)))
+        await started.wait()
+        follower = asyncio.create_task(singleflight.do(("k", 4), _factory(calls, asyncio.Event(), release)))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        release.set()
+        return await leader
+
+    assert asyncio.run(main()) == ("ok", False)
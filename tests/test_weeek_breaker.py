@@ -0,0 +1,45 @@
+"""Circuit breaker Weeek API: пробный запрос в half_open."""
+import asyncio
+import time
+
+import pytest
+
+from services import weeek_service
+
+
+@pytest.fixture(autouse=True)
+def breaker(monkeypatch):
+    monkeypatch.setattr(weeek_service, "WEEEK_API_KEY", "test")
+    state = {"state": "open", "failures": weeek_service.BREAKER_THRESHOLD,
+             "opened_at": time.monotonic() - weeek_service.BREAKER_COOLDOWN - 1, "probe": False}
+    monkeypatch.setattr(weeek_service, "_breaker", state)
+    return state
+
+
+def test_cancelled_probe_releases_half_open(monkeypatch, breaker):
+    async def hang(*args):
+        await asyncio.sleep(10)
+
+    async def ok(*args):
+        return {"success": True}, 200, None
+
+    async def main():
+        monkeypatch.setattr(weeek_service, "_send", hang)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(weeek_service._request("GET", "tm/projects", retries=0), 0.01)
+        assert breaker["state"] == "half_open"
+        assert breaker["probe"] is False
+
+        monkeypatch.setattr(weeek_service, "_send", ok)
+        return await weeek_service._request("GET", "tm/projects", retries=0)
+
+    assert asyncio.run(main()) == {"success": True}
+    assert breaker["state"] == "closed"
+
+
+def test_half_open_allows_single_probe(breaker):
+    assert weeek_service._breaker_allows() is True
+    assert weeek_service._breaker_allows() is False
+    weeek_service._record_failure()
+    assert breaker["state"] == "open"
+    assert breaker["probe"] is False
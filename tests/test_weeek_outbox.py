@@ -0,0 +1,89 @@
+"""Outbox Weeek: create не дублирует задачи и честно сообщает итог."""
+import asyncio
+
+import pytest
+
+import json_store
+from models.bug import create_bug, delete_bug, get_bug
+from services import weeek_outbox, weeek_service
+
+NOTIFY = {"chat_id": 1, "message_id": 2, "is_media": False, "base_html": "Баг"}
+
+
+class _Bot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        self.edits.append(text)
+
+
+@pytest.fixture
+def bot(monkeypatch, data_dir):
+    fake = _Bot()
+    monkeypatch.setattr(weeek_outbox, "get_bot", lambda: fake)
+    monkeypatch.setattr(weeek_service, "WEEEK_API_KEY", "test")
+    monkeypatch.setattr(weeek_service, "WEEEK_PROJECT_ID", 1)
+    monkeypatch.setattr(weeek_service, "_breaker",
+                        {"state": "closed", "failures": 0, "opened_at": 0.0, "probe": False})
+    return fake
+
+
+def _make_due():
+    data = json_store.load(json_store.WEEEK_OUTBOX_FILE)
+    for item in data.get("items", {}).values():
+        item["next_attempt_at"] = 0
+    json_store.save(json_store.WEEEK_OUTBOX_FILE, data)
+
+
+async def _enqueue_create(bug_id: int):
+    await weeek_outbox.enqueue("create", bug_id, {"title": "t", "description": "d", "board_name": "Доска"},
+                               notify=NOTIFY)
+
+
+def test_deleted_bug_is_reported_not_sent(monkeypatch, bot):
+    posts = []
+
+    async def send(method, endpoint, data, timeout):
+        posts.append(endpoint)
+        return {"task": {"id": 1}}, 200, None
+
+    monkeypatch.setattr(weeek_service, "_send", send)
+
+    async def main():
+        bug_id, _ = await create_bug(1, 10, "s")
+        await _enqueue_create(bug_id)
+        await delete_bug(bug_id)
+        await weeek_outbox.drain_once()
+
+    asyncio.run(main())
+    assert posts == []
+    assert len(bot.edits) == 1
+    assert "ничего не отправлено" in bot.edits[0]
+    assert "✅" not in bot.edits[0]
+
+
+def test_lost_create_response_is_reconciled_not_duplicated(monkeypatch, bot):
+    tasks, posts = [], []
+
+    async def send(method, endpoint, data, timeout):
+        if method == "POST":
+            posts.append(data)
+            tasks.append({"id": 700 + len(posts), "description": f"<p>{data['description']}</p>"})
+            return {"error": "Timeout"}, None, None  # задача создана, ответ потерян
+        return {"tasks": tasks, "hasMore": False}, 200, None
+
+    monkeypatch.setattr(weeek_service, "_send", send)
+
+    async def main():
+        bug_id, _ = await create_bug(1, 10, "s")
+        await _enqueue_create(bug_id)
+        await weeek_outbox.drain_once()
+        _make_due()
+        await weeek_outbox.drain_once()
+        return await get_bug(bug_id)
+
+    bug = asyncio.run(main())
+    assert len(posts) == 1
+    assert bug["weeek_task_id"] == "701"
+    assert "✅" in bot.edits[-1]
@@ -0,0 +1,347 @@
+"""
+Учёт стоимости и задержки запросов к агенту.
+
+Запрос открывается в роутере (async with request(...)), а brain дописывает
+в него по ходу: вызовы Claude (токены, включая кэш, и время), раунды и
+инструменты, время Telegram. Запись текущего запроса лежит в ContextVar,
+поэтому параллельные инструменты одного раунда пишут в ту же запись.
+
+По завершении запрос:
+- дописывается строкой в data/accounting/ГГГГ-ММ-ДД.jsonl (выгрузка — export_jsonl);
+- добавляется в суммы по дню, пользователю и инструменту в accounting.json.
+Хранится ACCOUNTING_DAYS последних дней.
+
+Стоимость — оценка по прайсу моделей (USD за 1М токенов), не счёт Anthropic.
+"""
+import asyncio
+import html
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+
+import json_store
+from config import ACCOUNTING_DAYS
+from json_store import async_update, async_load, ACCOUNTING_FILE
+from utils import metrics
+
+# Цена за 1М токенов (вход, выход) по семейству модели; кэш: запись ×1.25, чтение ×0.1
+_PRICES = {
+    "haiku": (1.0, 5.0),
+    "sonnet": (3.0, 15.0),
+    "opus": (15.0, 75.0),
+}
+_CACHE_WRITE_MULT = 1.25
+_CACHE_READ_MULT = 0.1
+
+_SUM_FIELDS = (
+    "requests", "llm_calls", "rounds", "tool_calls",
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "cost_usd", "llm_ms", "tools_ms", "telegram_ms", "total_ms",
+)
+
+_current: ContextVar[dict | None] = ContextVar("accounting_request", default=None)
+_log_lock = asyncio.Lock()
+_pruned_before: str | None = None
+
+
+def _price(model: str) -> tuple[float, float]:
+    for family, price in _PRICES.items():
+        if family in (model or ""):
+            return price
+    return _PRICES["sonnet"]
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int,
+                  cache_read: int = 0, cache_write: int = 0) -> float:
+    """Оценка стоимости вызова в USD."""
+    price_in, price_out = _price(model)
+    return (
+        input_tokens * price_in
+        + cache_write * price_in * _CACHE_WRITE_MULT
+        + cache_read * price_in * _CACHE_READ_MULT
+        + output_tokens * price_out
+    ) / 1_000_000
+
+
+# ─────────────────────────────────────────────
+#  Запись текущего запроса
+# ─────────────────────────────────────────────
+
+def _new_record(caller_id: int, username: str, role: str, chat_id: int | None, kind: str) -> dict:
+    return {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "caller_id": caller_id,
+        "username": username,
+        "role": role,
+        "chat_id": chat_id,
+        "kind": kind,
+        "model": None,
+        "llm_calls": 0,
+        "rounds": 0,
+        "tools": [],
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+        "cost_usd": 0.0,
+        "llm_ms": 0.0,
+        "tools_ms": 0.0,
+        "telegram_ms": 0.0,
+        "total_ms": 0.0,
+        "_tool_ms": {},
+        "_closed": False,
+    }
+
+
+def _open() -> dict | None:
+    record = _current.get()
+    if record is None or record["_closed"]:
+        return None
+    return record
+
+
+def current_role() -> str:
+    """Роль запроса, в котором идёт вызов (фоновые задачи без запроса — "system")."""
+    record = _current.get()
+    return record["role"] if record is not None else "system"
+
+
+def add_llm(model: str, usage, elapsed_ms: float) -> float:
+    """Один успешный вызов Claude (время — с ожиданием в очереди и повторами). Возвращает стоимость."""
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    cost = estimate_cost(model, usage.input_tokens, usage.output_tokens, cache_read, cache_write)
+    record = _open()
+    if record is None:
+        return cost
+    record["model"] = record["model"] or model
+    record["llm_calls"] += 1
+    record["input_tokens"] += usage.input_tokens
+    record["output_tokens"] += usage.output_tokens
+    record["cache_read_tokens"] += cache_read
+    record["cache_write_tokens"] += cache_write
+    record["cost_usd"] += cost
+    record["llm_ms"] += elapsed_ms
+    return cost
+
+
+def add_tool(name: str, elapsed_ms: float):
+    """Один вызов инструмента."""
+    record = _open()
+    if record is None:
+        return
+    record["tools"].append(name)
+    record["_tool_ms"][name] = record["_tool_ms"].get(name, 0.0) + elapsed_ms
+
+
+def add_tools_round(elapsed_ms: float):
+    """Раунд инструментов (время по стене — вызовы внутри идут параллельно)."""
+    record = _open()
+    if record is None:
+        return
+    record["rounds"] += 1
+    record["tools_ms"] += elapsed_ms
+
+
+@asynccontextmanager
+async def timed(part: str):
+    """async with timed("telegram"): await message.reply(...)"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record = _open()
+        if record is not None:
+            record[f"{part}_ms"] += (time.monotonic() - started) * 1000
+
+
+@asynccontextmanager
+async def request(caller_id: int, username: str, role: str,
+                  chat_id: int | None = None, kind: str = "agent"):
+    """Учитывает всё, что выполняется внутри блока, как один запрос пользователя."""
+    record = _new_record(caller_id, username, role, chat_id, kind)
+    token = _current.set(record)
+    started = time.monotonic()
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+        record["total_ms"] = (time.monotonic() - started) * 1000
+        # Фоновые задачи запроса (сжатие памяти и т.п.) в запись уже не пишут
+        record["_closed"] = True
+        try:
+            await _store(record)
+        except Exception as e:
+            print(f"[ACCOUNTING] Ошибка записи: {e}")
+
+
+# ─────────────────────────────────────────────
+#  Хранение: JSONL по дням + суммы
+# ─────────────────────────────────────────────
+
+def _log_dir() -> str:
+    return os.path.join(json_store.DATA_DIR, "accounting")
+
+
+def _public(record: dict) -> dict:
+    out = {k: v for k, v in record.items() if not k.startswith("_")}
+    out["cost_usd"] = round(out["cost_usd"], 6)
+    for key in ("llm_ms", "tools_ms", "telegram_ms", "total_ms"):
+        out[key] = round(out[key])
+    return out
+
+
+def _append_line(path: str, line: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _prune_logs(keep_from: str):
+    directory = _log_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".jsonl") and name[:-6] < keep_from:
+            os.remove(os.path.join(directory, name))
+
+
+def _add_sums(target: dict, record: dict):
+    target["requests"] = target.get("requests", 0) + 1
+    target["tool_calls"] = target.get("tool_calls", 0) + len(record["tools"])
+    for field in _SUM_FIELDS:
+        if field in ("requests", "tool_calls"):
+            continue
+        target[field] = round(target.get(field, 0) + record[field], 6)
+
+
+async def _store(record: dict):
+    global _pruned_before
+    day = record["ts"][:10]
+    keep_from = (date.fromisoformat(day) - timedelta(days=ACCOUNTING_DAYS - 1)).isoformat()
+
+    metrics.inc("accounting.requests")
+    metrics.observe("accounting.total_ms", record["total_ms"])
+    metrics.observe("accounting.llm_ms", record["llm_ms"])
+    metrics.observe("accounting.tools_ms", record["tools_ms"])
+    metrics.observe("accounting.telegram_ms", record["telegram_ms"])
+
+    line = json.dumps(_public(record), ensure_ascii=False)
+    async with _log_lock:
+        await asyncio.to_thread(_append_line, os.path.join(_log_dir(), f"{day}.jsonl"), line)
+
+    def updater(data):
+        days = data.setdefault("days", {})
+        stats = days.setdefault(day, {"total": {}, "users": {}, "tools": {}})
+        _add_sums(stats["total"], record)
+        user = stats["users"].setdefault(str(record["caller_id"]), {})
+        user["username"] = record["username"]
+        _add_sums(user, record)
+        for name in record["tools"]:
+            tool = stats["tools"].setdefault(name, {"calls": 0, "ms": 0})
+            tool["calls"] += 1
+        for name, ms in record["_tool_ms"].items():
+            stats["tools"][name]["ms"] = round(stats["tools"][name]["ms"] + ms)
+        for old in [d for d in days if d < keep_from]:
+            del days[old]
+        return data
+
+    await async_update(ACCOUNTING_FILE, updater)
+    # Старые JSONL чистим раз в день
+    if _pruned_before != keep_from:
+        _pruned_before = keep_from
+        await asyncio.to_thread(_prune_logs, keep_from)
+
+
+# ─────────────────────────────────────────────
+#  Отчёт и выгрузка
+# ─────────────────────────────────────────────
+
+def _since(days: int) -> str:
+    return (date.today() - timedelta(days=max(1, days) - 1)).isoformat()
+
+
+async def get_summary(days: int = 1) -> dict:
+    """Суммы за последние days дней: total, users (по caller_id), tools."""
+    data = await async_load(ACCOUNTING_FILE)
+    since = _since(days)
+    total: dict = {}
+    users: dict[str, dict] = {}
+    tools: dict[str, dict] = {}
+    for day, stats in data.get("days", {}).items():
+        if day < since:
+            continue
+        for field in _SUM_FIELDS:
+            total[field] = total.get(field, 0) + stats["total"].get(field, 0)
+        for uid, u in stats["users"].items():
+            agg = users.setdefault(uid, {"username": u.get("username")})
+            for field in _SUM_FIELDS:
+                agg[field] = agg.get(field, 0) + u.get(field, 0)
+        for name, t in stats["tools"].items():
+            agg = tools.setdefault(name, {"calls": 0, "ms": 0})
+            agg["calls"] += t["calls"]
+            agg["ms"] += t["ms"]
+    return {"since": since, "total": total, "users": users, "tools": tools}
+
+
+async def format_report(days: int = 1, top: int = 5) -> str:
+    """Отчёт руководителю (HTML): итоги, доля времени, топ пользователей и инструментов."""
+    summary = await get_summary(days)
+    total = summary["total"]
+    period = "сегодня" if days <= 1 else f"за {days} дн. (с {summary['since']})"
+    lines = [f"💰 <b>Расходы {period}</b>"]
+    if not total.get("requests"):
+        lines.append("Запросов не было.")
+        return "\n".join(lines)
+
+    n = total["requests"]
+    lines.append(
+        f"Запросов: <b>{n}</b>, вызовов Claude: {total['llm_calls']}, "
+        f"раундов инструментов: {total['rounds']}\n"
+        f"Токены: вход {total['input_tokens']}, выход {total['output_tokens']}, "
+        f"кэш чтение {total['cache_read_tokens']}, кэш запись {total['cache_write_tokens']}\n"
+        f"Стоимость (оценка): <b>${total['cost_usd']:.4f}</b>"
+    )
+    lines.append(
+        f"\n<b>Среднее время запроса:</b> {total['total_ms'] / n:.0f} мс — "
+        f"LLM {total['llm_ms'] / n:.0f}, инструменты {total['tools_ms'] / n:.0f}, "
+        f"Telegram {total['telegram_ms'] / n:.0f}"
+    )
+
+    users = sorted(summary["users"].values(), key=lambda u: u.get("cost_usd", 0), reverse=True)[:top]
+    lines.append("\n<b>Пользователи (по стоимости):</b>")
+    lines.extend(
+        f"• @{html.escape(u.get('username') or '?')}: {u['requests']} запр., ${u['cost_usd']:.4f}, "
+        f"в среднем {u['total_ms'] / u['requests']:.0f} мс"
+        for u in users
+    )
+
+    tools = sorted(summary["tools"].items(), key=lambda kv: kv[1]["ms"], reverse=True)[:top]
+    if tools:
+        lines.append("\n<b>Инструменты (по времени):</b>")
+        lines.extend(
+            f"• {name}: {t['calls']} выз., всего {t['ms']} мс, в среднем {t['ms'] / t['calls']:.0f} мс"
+            for name, t in tools
+        )
+    return "\n".join(lines)
+
+
+def _read_logs(since: str) -> bytes:
+    directory = _log_dir()
+    if not os.path.isdir(directory):
+        return b""
+    chunks = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".jsonl") and name[:-6] >= since:
+            with open(os.path.join(directory, name), "rb") as f:
+                chunks.append(f.read())
+    return b"".join(chunks)
+
+
+async def export_jsonl(days: int = 1) -> bytes:
+    """Все записи запросов за последние days дней — JSONL, по строке на запрос."""
+    async with _log_lock:
+        return await asyncio.to_thread(_read_logs, _since(days))
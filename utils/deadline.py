@@ -0,0 +1,96 @@
+"""
+Общий дедлайн запроса к агенту: ожидание планировщика, вызовы Claude,
+повторы и инструменты — всё в одном бюджете времени.
+
+    async with deadline.scope(REQUEST_DEADLINE) as state:
+        reply = await ...
+    if state["expired"]:
+        reply = deadline.fallback_reply(state)
+
+По истечении работа внутри отменяется (asyncio.timeout): слоты
+планировщика и очереди чатов освобождаются своими finally. Пока запрос
+идёт, brain отмечает в состоянии лучший частичный ответ (уже показанный
+потоком текст, иначе готовое сообщение инструмента) и то, что данные
+менялись, — из этого собирается ответ вместо тишины.
+
+Метрики: deadline.requests, deadline.expired, deadline.partial,
+гистограмма deadline.used_pct (доля бюджета, % — 100 значит «упёрлись»),
+gauge deadline.expired_rate.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from utils import metrics
+
+_current: ContextVar[dict | None] = ContextVar("request_deadline", default=None)
+
+
+@asynccontextmanager
+async def scope(seconds: float):
+    """Дедлайн на тело блока (seconds <= 0 — без ограничения). TimeoutError не выпускает."""
+    started = time.monotonic()
+    state = {"seconds": seconds, "at": started + seconds, "expired": False,
+             "partial": None, "draft": "", "mutated": False}
+    token = _current.set(state)
+    timeout = asyncio.timeout(seconds if seconds > 0 else None)
+    try:
+        async with timeout:
+            yield state
+    except TimeoutError:
+        if not timeout.expired():
+            raise
+        state["expired"] = True
+    finally:
+        _current.reset(token)
+        metrics.inc("deadline.requests")
+        if seconds > 0:
+            metrics.observe("deadline.used_pct", min(100.0, (time.monotonic() - started) / seconds * 100))
+        if state["expired"]:
+            metrics.inc("deadline.expired")
+            if state["draft"].strip() or state["partial"]:
+                metrics.inc("deadline.partial")
+        metrics.set_gauge("deadline.expired_rate", round(metrics.ratio("deadline.expired", "deadline.requests") or 0, 3))
+
+
+def remaining() -> float | None:
+    """Секунд до дедлайна текущего запроса (None — дедлайна нет)."""
+    state = _current.get()
+    if state is None or state["seconds"] <= 0:
+        return None
+    return max(0.0, state["at"] - time.monotonic())
+
+
+def note_partial(text: str | None):
+    """Запоминает лучший на сейчас частичный ответ (последний непустой)."""
+    state = _current.get()
+    if state is not None and text and text.strip():
+        state["partial"] = text
+
+
+def note_draft(text: str):
+    """Текст ответа, уже показанный потоком (пусто — начался новый tool-раунд)."""
+    state = _current.get()
+    if state is not None:
+        state["draft"] = text
+
+
+def note_mutation():
+    """Запрос уже изменил данные — в ответе по дедлайну предупредим об этом."""
+    state = _current.get()
+    if state is not None:
+        state["mutated"] = True
+
+
+def fallback_reply(state: dict) -> str:
+    """Ответ вместо недосчитанного: частичный результат или понятная заглушка."""
+    seconds = int(state["seconds"])
+    partial = state["draft"] if state["draft"].strip() else state["partial"]
+    print(f"[DEADLINE] Запрос не уложился в {seconds} с (частичный ответ: {'да' if partial else 'нет'})")
+    if partial:
+        return f"{partial}\n\n⏱ Ответ неполный — не уложился в {seconds} с."
+    if state["mutated"]:
+        return (f"⏱ Не успел закончить за {seconds} с. Часть действий могла выполниться — "
+                "проверь результат, прежде чем повторять.")
+    return f"⏱ Не успел ответить за {seconds} с. Попробуй ещё раз или упрости запрос."
@@ -0,0 +1,107 @@
+"""
+Метрики процесса в памяти: счётчики, gauge и гистограммы.
+
+Без внешних зависимостей — всё живёт до перезапуска бота.
+Посмотреть: команда руководителя «метрики» (format_metrics) или snapshot().
+"""
+from collections import deque
+
+_HISTOGRAM_SAMPLES = 1000  # Сколько последних значений держим для перцентилей
+
+_counters: dict[str, float] = {}
+_gauges: dict[str, float | str] = {}
+_histograms: dict[str, dict] = {}
+
+
+def inc(name: str, value: float = 1):
+    """Увеличивает счётчик."""
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float | str):
+    """Выставляет текущее значение (состояние, глубина очереди и т.п.)."""
+    _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """Добавляет значение в гистограмму (латентность в мс, размеры и т.п.)."""
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = {"count": 0, "sum": 0.0, "samples": deque(maxlen=_HISTOGRAM_SAMPLES)}
+        _histograms[name] = hist
+    hist["count"] += 1
+    hist["sum"] += value
+    hist["samples"].append(value)
+
+
+def get_counter(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def ratio(part: str, total: str) -> float | None:
+    """Доля part/total по счётчикам (hit rate и т.п.). None если total = 0."""
+    denominator = _counters.get(total, 0)
+    if not denominator:
+        return None
+    return _counters.get(part, 0) / denominator
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def snapshot() -> dict:
+    """Текущее состояние всех метрик (JSON-сериализуемое)."""
+    histograms = {}
+    for name, hist in _histograms.items():
+        values = sorted(hist["samples"])
+        histograms[name] = {
+            "count": hist["count"],
+            "avg": round(hist["sum"] / hist["count"], 1) if hist["count"] else 0,
+            "p50": round(_percentile(values, 0.5), 1),
+            "p95": round(_percentile(values, 0.95), 1),
+            "max": round(values[-1], 1) if values else 0,
+        }
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+        "histograms": histograms,
+    }
+
+
+def format_metrics(prefix: str = "") -> str:
+    """Форматирует метрики для Telegram (HTML). prefix — фильтр по началу имени."""
+    snap = snapshot()
+    lines = ["📈 <b>Метрики</b>"]
+
+    gauges = {k: v for k, v in sorted(snap["gauges"].items()) if k.startswith(prefix)}
+    if gauges:
+        lines.append("\n<b>Состояние:</b>")
+        lines.extend(f"• {k}: <code>{v}</code>" for k, v in gauges.items())
+
+    counters = {k: v for k, v in sorted(snap["counters"].items()) if k.startswith(prefix)}
+    if counters:
+        lines.append("\n<b>Счётчики:</b>")
+        lines.extend(f"• {k}: <code>{v:g}</code>" for k, v in counters.items())
+
+    hists = {k: v for k, v in sorted(snap["histograms"].items()) if k.startswith(prefix)}
+    if hists:
+        lines.append("\n<b>Распределения:</b>")
+        lines.extend(
+            f"• {k}: n={h['count']}, p50={h['p50']:g}, p95={h['p95']:g}, max={h['max']:g}"
+            for k, h in hists.items()
+        )
+
+    if len(lines) == 1:
+        lines.append("Пока пусто.")
+    return "\n".join(lines)
+
+
+def reset():
+    """Сбрасывает все метрики (для бенчмарков)."""
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
@@ -0,0 +1,52 @@
+"""
+Single-flight: одинаковые запросы, пришедшие одновременно, считаются один раз.
+
+    result, shared = await do(key, factory)
+
+Первый вызов с ключом (лидер) выполняет factory(), остальные с тем же ключом
+ждут его результат. Ключ должен включать всё, от чего зависит ответ
+(роль, нормализованный текст, версию данных) — тогда общий результат
+корректен для каждого. Лидер упал или отменён — ожидающие выполняют
+свой factory сами.
+
+Метрики: singleflight.leader, singleflight.shared.
+"""
+import asyncio
+
+from utils import metrics
+
+_inflight: dict[tuple, asyncio.Future] = {}
+
+
+async def do(key: tuple, factory) -> tuple[object, bool]:
+    """(результат, разделён ли он с другим вызовом)."""
+    fut = _inflight.get(key)
+    if fut is not None:
+        try:
+            result = await asyncio.shield(fut)
+            metrics.inc("singleflight.shared")
+            return result, True
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+        except Exception:
+            pass
+        # Лидер не справился — считаем сами
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    metrics.inc("singleflight.leader")
+    try:
+        result = await factory()
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # помечаем как прочитанное, если ожидающих не было
+        raise
+    finally:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+    fut.set_result(result)
+    return result, False
@@ -0,0 +1,138 @@
+"""
+Потоковый ответ в Telegram: текст от Claude появляется по мере генерации.
+
+create_stream_reply(message) → (push, finish):
+- push(delta) — очередной кусок текста; push(None) — начался tool-раунд,
+  текст раунда не ответ: сообщение возвращается к «⏳»;
+- finish(final) — итоговый текст. True — ответ уже показан (или удалён
+  для silent-инструментов), False — вызывающий отвечает как обычно.
+
+Сообщение правится не чаще STREAM_EDIT_INTERVAL или при накоплении
+STREAM_EDIT_CHARS новых символов, с учётом flood control Telegram.
+Промежуточный текст приводится к валидному HTML (обрезанный тег/сущность
+отбрасываются, открытые теги закрываются).
+"""
+import asyncio
+import re
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+STREAM_EDIT_INTERVAL = 0.7   # сек между правками
+STREAM_EDIT_CHARS = 200      # или раньше, если набралось столько новых символов
+_TICK = 0.1
+_MAX_LEN = 4000              # длиннее — стрим замирает, итог отправляется частями
+_PLACEHOLDER = "⏳"
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9\-]*)[^>]*>")
+
+
+def close_html(text: str) -> str:
+    """Делает обрезанный на полуслове HTML валидным для Telegram."""
+    lt = text.rfind("<")
+    if lt > text.rfind(">"):
+        text = text[:lt]
+    amp = text.rfind("&")
+    if amp != -1 and ";" not in text[amp:]:
+        text = text[:amp]
+    stack: list[str] = []
+    for m in _TAG_RE.finditer(text):
+        tag = m.group(2).lower()
+        if not m.group(1):
+            stack.append(tag)
+        elif tag in stack:
+            # Закрываем до парного открывающего
+            while stack and stack.pop() != tag:
+                pass
+    return text + "".join(f"</{tag}>" for tag in reversed(stack))
+
+
+def create_stream_reply(message: Message):
+    state = {
+        "text": "",
+        "shown": None,
+        "msg": None,
+        "last_edit": 0.0,
+        "blocked_until": 0.0,
+        "task": None,
+        "closed": False,
+    }
+
+    async def show(text: str):
+        display = close_html(text) or _PLACEHOLDER
+        try:
+            if state["msg"] is None:
+                state["msg"] = await message.reply(display, parse_mode="HTML")
+            else:
+                await state["msg"].edit_text(display, parse_mode="HTML")
+        except TelegramRetryAfter as e:
+            state["blocked_until"] = time.monotonic() + e.retry_after
+            return
+        except TelegramBadRequest as e:
+            # «message is not modified» и ошибки разметки промежуточного текста — не критично
+            print(f"[STREAM] edit пропущен: {str(e)[:100]}")
+        except Exception as e:
+            print(f"[STREAM] edit ERROR: {e}")
+        state["shown"] = text
+        state["last_edit"] = time.monotonic()
+
+    async def editor():
+        while not state["closed"]:
+            await asyncio.sleep(_TICK)
+            if state["closed"]:
+                break
+            text = state["text"]
+            if text == state["shown"] or len(text) > _MAX_LEN:
+                continue
+            now = time.monotonic()
+            if now < state["blocked_until"]:
+                continue
+            fresh = len(text) - len(state["shown"] or "")
+            if now - state["last_edit"] < STREAM_EDIT_INTERVAL and fresh < STREAM_EDIT_CHARS:
+                continue
+            await show(text)
+
+    async def push(delta: str | None):
+        if delta is None:
+            state["text"] = ""
+        else:
+            state["text"] += delta
+        if state["task"] is None:
+            state["task"] = asyncio.create_task(editor())
+
+    async def finish(final: str | None) -> bool:
+        # Не отменяем редактор посреди отправки — иначе сообщение может уйти без ссылки на него
+        state["closed"] = True
+        if state["task"] is not None:
+            await state["task"]
+        msg = state["msg"]
+        if msg is None:
+            return False
+        if final is None or len(final) > _MAX_LEN:
+            try:
+                await msg.delete()
+            except Exception:
+                pass
+            return final is None
+        if final == state["shown"]:
+            return True
+        try:
+            try:
+                await msg.edit_text(final, parse_mode="HTML")
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                await msg.edit_text(final, parse_mode="HTML")
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                return True
+            try:
+                await msg.edit_text(final)
+            except Exception:
+                return False
+        except Exception as e:
+            print(f"[STREAM] final edit ERROR: {e}")
+            return False
+        return True
+
+    return push, finish